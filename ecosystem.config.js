@@ -1,22 +1,49 @@
 module.exports = {
   apps: [{
     name: 'raspadinha-backend',
-    script: '/var/www/raspadinha/raspadinha-backend/venv/bin/python',
-    args: '/var/www/raspadinha/raspadinha-backend/src/main.py',
+    script: '/var/www/raspadinha/raspadinha-backend/venv/bin/gunicorn',
+    // Carteira com UPDATEs atômicos: vários workers e threads no mesmo banco
+    args: '--workers 4 --threads 4 --bind 0.0.0.0:5000 src.main:app',
+    interpreter: 'none',
     cwd: '/var/www/raspadinha/raspadinha-backend',
-    instances: 1,
+    instances: 1, // Os workers são processos do gunicorn
     autorestart: true,
     watch: false,
     max_memory_restart: '1G',
     env: {
       NODE_ENV: 'production',
       PORT: 5000,
-      FLASK_ENV: 'production'
+      FLASK_ENV: 'production',
+      // As threads em background rodam só no app raspadinha-worker, uma cópia para todo o servidor
+      CARD_POOL_ENABLED: '0',
+      JOB_WORKERS_ENABLED: '0',
+      PAYOUT_WORKER_ENABLED: '0',
+      METRICS_COMPACTION_ENABLED: '0'
     },
     error_file: '/var/log/pm2/raspadinha-backend-error.log',
     out_file: '/var/log/pm2/raspadinha-backend-out.log',
     log_file: '/var/log/pm2/raspadinha-backend.log',
     time: true
+  }, {
+    name: 'raspadinha-worker',
+    // Pool de raspadinhas, fila de jobs, saques e compactação das métricas (um único processo)
+    script: '/var/www/raspadinha/raspadinha-backend/venv/bin/python',
+    args: '-m src.worker',
+    interpreter: 'none',
+    cwd: '/var/www/raspadinha/raspadinha-backend',
+    instances: 1, // Nunca mais de um: o reabastecimento do pool não é coordenado entre processos
+    autorestart: true,
+    watch: false,
+    max_memory_restart: '1G',
+    kill_timeout: 30000, // Tempo para terminar o job ou o lote de saques em andamento
+    env: {
+      NODE_ENV: 'production',
+      FLASK_ENV: 'production'
+    },
+    error_file: '/var/log/pm2/raspadinha-worker-error.log',
+    out_file: '/var/log/pm2/raspadinha-worker-out.log',
+    log_file: '/var/log/pm2/raspadinha-worker.log',
+    time: true
   }]
 };
 
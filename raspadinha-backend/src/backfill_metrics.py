@@ -0,0 +1,67 @@
+"""Reconstrói os contadores agregados do admin a partir das tabelas de origem
+
+    metric_buckets           baldes por minuto/hora/dia/total do painel e das séries
+    category_prize_counters  jogos e prêmios por categoria e faixa de prêmio
+
+Os triggers de `users`, `games` e `transactions` mantêm os contadores a cada
+escrita, e as migrações que criaram as tabelas já preencheram o histórico.
+Este comando os refaz depois de uma carga feita direto no banco ou para
+corrigir divergências, e pode rodar com a aplicação no ar. Os baldes são
+processados em lotes de dias, com um commit por lote; os contadores por
+categoria, em uma única passada pelos jogos. Minutos e horas só são refeitos
+dentro da retenção (RETENTION em src/models/metrics.py).
+
+Uso:
+    python -m src.backfill_metrics
+    python -m src.backfill_metrics --since 2024-01-01 --chunk-days 30
+    python -m src.backfill_metrics --only category_prize_counters
+"""
+import os
+import sys
+import time
+import argparse
+from datetime import datetime
+
+from flask import Flask
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from src.models.user import db
+from src.models.metrics import MetricsService
+from src.models.schema import upgrade
+
+DEFAULT_DATABASE_URI = f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'app.db')}"
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Reconstrói metric_buckets e category_prize_counters a partir de usuários, jogos e transações')
+    parser.add_argument('--since', type=datetime.fromisoformat, help='Primeiro dia a reconstruir (AAAA-MM-DD; padrão: todo o histórico)')
+    parser.add_argument('--chunk-days', type=int, default=7, help='Dias recalculados por commit')
+    parser.add_argument('--only', choices=('metric_buckets', 'category_prize_counters'), help='Reconstrói só uma das tabelas')
+    parser.add_argument('--database-uri', default=DEFAULT_DATABASE_URI, help='Banco a preencher')
+    args = parser.parse_args(argv)
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = args.database_uri
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'connect_args': {'timeout': 30}}
+    db.init_app(app)
+
+    with app.app_context():
+        upgrade()
+
+        if args.only in (None, 'metric_buckets'):
+            started_at = time.perf_counter()
+
+            def report(days, written, until):
+                elapsed = time.perf_counter() - started_at
+                print(f'metric_buckets: {days:,} dias, {written:,} baldes gravados (até {until:%Y-%m-%d}) em {elapsed:.1f}s', file=sys.stderr, flush=True)
+
+            days, written = MetricsService.rebuild(args.since, args.chunk_days, report)
+            print(f'metric_buckets: {written:,} baldes com movimento em {days:,} dias')
+
+        if args.only in (None, 'category_prize_counters'):
+            written = MetricsService.rebuild_category_counters(db.session)
+            db.session.commit()
+            print(f'category_prize_counters: {written:,} faixas de prêmio')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""Reconstrói os resumos por usuário a partir de jogos e extrato
+
+    user_monthly_stats  totais concluídos do mês (resumo da carteira)
+    user_stats          totais de jogo de todo o histórico (listagem do admin)
+
+As duas tabelas são preenchidas pelas migrações que as criam e mantidas
+pelos triggers dali em diante; este comando as refaz a partir do extrato
+para corrigir divergências (depois de correções manuais, por exemplo).
+Processa em lotes de usuários, com um commit por lote, e pode rodar com a
+aplicação no ar ou ser executado de novo a qualquer momento.
+
+Uso:
+    python -m src.backfill_stats
+    python -m src.backfill_stats --chunk-size 500
+    python -m src.backfill_stats --only user_stats
+"""
+import os
+import sys
+import time
+import argparse
+
+from flask import Flask
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+# Todos os modelos precisam estar importados para o SQLAlchemy configurar os relacionamentos
+from src.models.user import db
+from src.models.wallet import Wallet
+from src.models.game import ScratchCardCategory, ScratchCard
+from src.models.transaction import Transaction
+from src.models.bonus import Bonus, Mission
+from src.models.pool import CardPoolEntry
+from src.models.series import TicketSeries
+from src.models.ledger import LedgerEntry, WalletCheckpoint
+from src.models.stats import UserMonthlyStats, UserStats, StatsService
+from src.models.schema import upgrade
+
+DEFAULT_DATABASE_URI = f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'app.db')}"
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Reconstrói user_monthly_stats e user_stats a partir de jogos e transações')
+    parser.add_argument('--chunk-size', type=int, default=1000, help='Usuários recalculados por commit')
+    parser.add_argument('--only', choices=('user_monthly_stats', 'user_stats'), help='Reconstrói só uma das tabelas')
+    parser.add_argument('--database-uri', default=DEFAULT_DATABASE_URI, help='Banco a preencher')
+    args = parser.parse_args(argv)
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = args.database_uri
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'connect_args': {'timeout': 30}}
+    db.init_app(app)
+
+    with app.app_context():
+        upgrade()
+
+        rebuilds = {
+            'user_monthly_stats': (StatsService.rebuild_monthly, 'meses'),
+            'user_stats': (StatsService.rebuild_user_stats, 'totais')
+        }
+        for table, (rebuild, unit) in rebuilds.items():
+            if args.only and table != args.only:
+                continue
+
+            started_at = time.perf_counter()
+
+            def report(users, written, last_id):
+                elapsed = time.perf_counter() - started_at
+                print(f'{table}: {users:,} usuários, {written:,} {unit} gravados (até id {last_id}) em {elapsed:.1f}s', file=sys.stderr, flush=True)
+
+            users, written = rebuild(args.chunk_size, report)
+            print(f'{table}: {written:,} {unit} de {users:,} usuários')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+"""Microbenchmark do caminho do dinheiro em uma jogada: NUMERIC em reais x Money em centavos
+
+Reproduz, com SQLAlchemy Core em um SQLite temporário, o que uma jogada
+premiada grava e lê de valores monetários:
+
+    débito e crédito na carteira (UPDATE ... RETURNING dos saldos)
+    2 lançamentos no razão, 1 jogo, 2 transações no extrato
+    leitura do jogo de volta (to_dict)
+
+Roda o mesmo roteiro com as colunas como antes (Numeric(10, 2), arredondando
+no SQL) e como agora (Money, centavos inteiros), e mede também as conversões
+em Python (Decimal(str(valor)) x to_decimal). Mostra o custo por jogada.
+
+Uso:
+    python -m src.bench_money
+    python -m src.bench_money --plays 20000 --repeat 5 --json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+from decimal import Decimal
+
+from sqlalchemy import Column, Integer, MetaData, Numeric, String, Table, create_engine, func, select
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from src.models.money import Money, to_decimal
+
+PRICE = Decimal('10.00')
+PRIZE = Decimal('25.00')
+
+def _tables(money_type):
+    metadata = MetaData()
+    wallets = Table(
+        'wallets', metadata,
+        Column('id', Integer, primary_key=True),
+        Column('balance', money_type), Column('bonus_balance', money_type)
+    )
+    ledger = Table(
+        'ledger_entries', metadata,
+        Column('id', Integer, primary_key=True), Column('wallet_id', Integer),
+        Column('balance_delta', money_type), Column('bonus_delta', money_type),
+        Column('balance_after', money_type), Column('bonus_after', money_type)
+    )
+    games = Table(
+        'games', metadata,
+        Column('id', Integer, primary_key=True),
+        Column('amount_paid', money_type), Column('prize_won', money_type)
+    )
+    transactions = Table(
+        'transactions', metadata,
+        Column('id', Integer, primary_key=True), Column('type', String(20)), Column('amount', money_type)
+    )
+    return metadata, wallets, ledger, games, transactions
+
+def run_plays(money_type, plays, rounded):
+    """Executa `plays` jogadas premiadas; devolve microssegundos por jogada"""
+    metadata, wallets, ledger, games, transactions = _tables(money_type)
+    database = os.path.join(tempfile.mkdtemp(prefix='raspadinha-bench-money-'), 'bench.db')
+    engine = create_engine(f'sqlite:///{database}')
+    metadata.create_all(engine)
+
+    # Antes, o SQL arredondava cada conta porque NUMERIC vira REAL no SQLite
+    arithmetic = (lambda expression: func.round(expression, 2)) if rounded else (lambda expression: expression)
+
+    with engine.begin() as connection:
+        connection.execute(wallets.insert(), {'id': 1, 'balance': Decimal('1000000.00'), 'bonus_balance': Decimal('0.00')})
+
+    started_at = time.perf_counter()
+    with engine.begin() as connection:
+        for _ in range(plays):
+            for delta in (-PRICE, PRIZE):
+                balance, bonus_balance = connection.execute(
+                    wallets.update().where(wallets.c.id == 1)
+                    .values(balance=arithmetic(wallets.c.balance + delta))
+                    .returning(wallets.c.balance, wallets.c.bonus_balance)
+                ).one()
+                connection.execute(ledger.insert(), {
+                    'wallet_id': 1, 'balance_delta': delta, 'bonus_delta': Decimal('0.00'),
+                    'balance_after': balance, 'bonus_after': bonus_balance
+                })
+
+            game_id = connection.execute(
+                games.insert().returning(games.c.id), {'amount_paid': PRICE, 'prize_won': PRIZE}
+            ).scalar()
+            connection.execute(transactions.insert(), [
+                {'type': 'game_cost', 'amount': PRICE},
+                {'type': 'prize_payout', 'amount': PRIZE}
+            ])
+
+            game = connection.execute(select(games).where(games.c.id == game_id)).one()
+            float(game.amount_paid), float(game.prize_won)
+    elapsed = time.perf_counter() - started_at
+
+    engine.dispose()
+    return elapsed / plays * 1e6
+
+def run_conversions(plays):
+    """Conversões Python de uma jogada (custo, prêmio e os 4 valores do extrato); µs por jogada"""
+    values = (PRICE, PRIZE, PRICE, PRIZE, PRICE, PRIZE)
+
+    started_at = time.perf_counter()
+    for _ in range(plays):
+        for value in values:
+            Decimal(str(value))
+    before = time.perf_counter() - started_at
+
+    started_at = time.perf_counter()
+    for _ in range(plays):
+        for value in values:
+            to_decimal(value)
+    after = time.perf_counter() - started_at
+
+    return before / plays * 1e6, after / plays * 1e6
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Microbenchmark de valores monetários por jogada (NUMERIC x centavos)')
+    parser.add_argument('--plays', type=int, default=5000, help='Jogadas por medição')
+    parser.add_argument('--repeat', type=int, default=3, help='Medições de cada variante (vale a melhor)')
+    parser.add_argument('--json', action='store_true', help='Resultado em JSON')
+    args = parser.parse_args(argv)
+
+    numeric = min(run_plays(Numeric(10, 2), args.plays, rounded=True) for _ in range(args.repeat))
+    cents = min(run_plays(Money(), args.plays, rounded=False) for _ in range(args.repeat))
+    conversions = [run_conversions(args.plays * 10) for _ in range(args.repeat)]
+    convert_before = min(before for before, _ in conversions)
+    convert_after = min(after for _, after in conversions)
+
+    result = {
+        'plays': args.plays,
+        'sql_numeric_us_per_play': round(numeric, 2),
+        'sql_cents_us_per_play': round(cents, 2),
+        'sql_saving_us_per_play': round(numeric - cents, 2),
+        'convert_decimal_str_us_per_play': round(convert_before, 3),
+        'convert_to_decimal_us_per_play': round(convert_after, 3),
+        'convert_saving_us_per_play': round(convert_before - convert_after, 3)
+    }
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print(f'{args.plays:,} jogadas premiadas por medição (melhor de {args.repeat})')
+        print(f"  SQL + tipos   NUMERIC {numeric:8.1f} µs/jogada   centavos {cents:8.1f} µs/jogada   "
+              f"economia {numeric - cents:6.1f} µs ({(numeric - cents) / numeric:.0%})")
+        print(f"  conversões    Decimal(str) {convert_before:6.2f} µs/jogada   to_decimal {convert_after:6.2f} µs/jogada   "
+              f"economia {convert_before - convert_after:5.2f} µs")
+
+if __name__ == '__main__':
+    main()
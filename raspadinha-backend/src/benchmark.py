@@ -0,0 +1,533 @@
+"""Benchmark de carga da API (src.main.app) com cargas mistas
+
+Cria um banco SQLite novo, popula com o volume pedido (usuários, jogos e
+extrato) e dispara cenários realistas pelo test client do Flask em várias
+threads: cadastro/login, rajadas de jogadas, depósitos confirmados pelo
+webhook PIX, saques e painéis do admin. Mede req/s, latência p50/p95/p99 e
+consultas SQL por requisição de cada endpoint e grava tudo em JSON para
+comparar execuções.
+
+Uso:
+    python -m src.benchmark
+    python -m src.benchmark --users 100000 --games 10000000 --duration 120 --workers 8
+    python -m src.benchmark --mix play=60,play_batch=5,deposit=10 --output resultado.json
+    python -m src.benchmark --database /tmp/bench.db --keep-database   # reaproveita o banco populado
+    python -m src.benchmark --compare benchmark-anterior.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import sqlite3
+import subprocess
+import tempfile
+import threading
+from collections import defaultdict
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import event
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+BENCH_PASSWORD = 'benchmark123'
+PRICE_CENTS = 1000  # Valores monetários são gravados em centavos
+
+# Cenário -> peso padrão (proporção das iterações)
+DEFAULT_MIX = (
+    'play=35,play_batch=4,history=8,balance=8,categories=5,statistics=4,winners=3,'
+    'login=4,register=2,deposit=8,withdraw=3,transactions=4,'
+    'admin_dashboard=2,admin_users=2,admin_transactions=2,admin_revenue=1'
+)
+
+def make_cpf(n):
+    """CPF válido e único derivado de um número"""
+    digits = [int(d) for d in f'{100000000 + n:09d}'[-9:]]
+    for weights in (range(10, 1, -1), range(11, 1, -1)):
+        remainder = sum(d * w for d, w in zip(digits, weights)) % 11
+        digits.append(0 if remainder < 2 else 11 - remainder)
+    return ''.join(map(str, digits))
+
+def _timestamps(rng, n, days, now):
+    """`n` datas aleatórias nos últimos `days` dias, no formato que o SQLAlchemy grava no SQLite"""
+    offsets = rng.integers(0, days * 86400 * 1_000_000, n)
+    stamps = np.datetime64(now, 'us') - offsets.astype('timedelta64[us]')
+    return [s.replace('T', ' ') for s in np.datetime_as_string(stamps, unit='us')]
+
+class Seeder:
+    """Popula o banco com inserts em massa direto no SQLite (bem mais rápido que o ORM)"""
+
+    def __init__(self, app, db, chunk_size=100_000, days=60, seed=None, report=None):
+        self.app = app
+        self.db = db
+        self.chunk_size = chunk_size
+        self.days = days
+        self.rng = np.random.default_rng(seed)
+        self.report = report or (lambda message: None)
+        self.now = datetime.utcnow()
+
+    def _executemany(self, sql, rows):
+        with self.db.engine.begin() as connection:
+            connection.exec_driver_sql(sql, rows)
+
+    def seed(self, users, games, cards_per_category=5000):
+        from src.models.ledger import LedgerService
+
+        with self.app.app_context():
+            started_at = time.perf_counter()
+            self.seed_users(users)
+            LedgerService.open_wallets()  # Saldo inicial das carteiras como lançamento de abertura
+            card_ids, card_prizes = self.seed_cards(cards_per_category)
+            self.seed_games(games, users, card_ids, card_prizes)
+            return time.perf_counter() - started_at
+
+    def seed_users(self, count):
+        from src.models.user import User
+
+        hasher = User()
+        hasher.set_password(BENCH_PASSWORD)  # Um único hash bcrypt para todos
+        now = self.now.isoformat(sep=' ')
+
+        for start in range(0, count, self.chunk_size):
+            ids = range(start + 1, min(start + self.chunk_size, count) + 1)
+            created = _timestamps(self.rng, len(ids), self.days, self.now)
+
+            self._executemany(
+                'INSERT INTO users (id, email, password_hash, first_name, last_name, birth_date, cpf, status, '
+                'loyalty_level, loyalty_points, created_at, updated_at, email_verified, two_factor_enabled) '
+                "VALUES (?, ?, ?, 'Bench', 'User', '1990-01-01', ?, 'active', 'bronze', 0, ?, ?, 0, 0)",
+                [(i, f'bench{i}@example.com', hasher.password_hash, make_cpf(i), c, now) for i, c in zip(ids, created)]
+            )
+            self._executemany(
+                'INSERT INTO wallets (user_id, balance, bonus_balance, total_deposited, total_withdrawn, created_at, updated_at) '
+                'VALUES (?, 100000, 0, 100000, 0, ?, ?)',
+                [(i, c, now) for i, c in zip(ids, created)]
+            )
+            self.report(f'usuários: {ids[-1]:,}/{count:,}')
+
+    def seed_cards(self, per_category):
+        """Raspadinhas reaproveitadas pelos jogos históricos (o conteúdo não importa para a carga)"""
+        from src.models.game import ScratchCardCategory, ScratchCard, GameEngine
+        from src.models.money import to_cents
+
+        card_ids, card_prizes = [], []
+        for category in ScratchCardCategory.query.all():
+            for start in range(0, per_category, 10_000):
+                rows = GameEngine.generate_batch(category, min(10_000, per_category - start)).to_rows()
+                # O prêmio vem junto do id: o RETURNING em lote não garante a ordem das linhas
+                cards = self.db.session.execute(self.db.insert(ScratchCard).returning(ScratchCard.id, ScratchCard.prize_amount).execution_options(render_nulls=True), rows).all()
+                self.db.session.commit()
+                card_ids.extend(card_id for card_id, _ in cards)
+                card_prizes.extend(to_cents(prize) for _, prize in cards)
+
+        self.report(f'raspadinhas: {len(card_ids):,}')
+        return np.array(card_ids), np.array(card_prizes)
+
+    def seed_games(self, count, users, card_ids, card_prizes):
+        """Jogos e o extrato correspondente (custo de cada jogo e prêmios)"""
+        if not count or not users:
+            return
+
+        with self.db.engine.connect() as connection:
+            next_game_id = (connection.exec_driver_sql('SELECT max(id) FROM games').scalar() or 0) + 1
+
+        for start in range(0, count, self.chunk_size):
+            size = min(self.chunk_size, count - start)
+            game_ids = np.arange(next_game_id, next_game_id + size)
+            next_game_id += size
+
+            user_ids = self.rng.integers(1, users + 1, size)
+            picks = self.rng.integers(0, len(card_ids), size)
+            prizes = card_prizes[picks]
+            played_at = _timestamps(self.rng, size, self.days, self.now)
+
+            self._executemany(
+                "INSERT INTO games (id, user_id, scratch_card_id, amount_paid, prize_won, is_bonus_game, status, played_at) "
+                "VALUES (?, ?, ?, ?, ?, 0, 'completed', ?)",
+                list(zip(game_ids.tolist(), user_ids.tolist(), card_ids[picks].tolist(), [PRICE_CENTS] * size, prizes.tolist(), played_at))
+            )
+
+            transactions = [
+                (user_id, 'game_cost', PRICE_CENTS, 'wallet', f'Jogo de raspadinha #{game_id}',
+                 f'{{"game_id": {game_id}, "is_bonus": false}}', stamp, stamp)
+                for game_id, user_id, stamp in zip(game_ids.tolist(), user_ids.tolist(), played_at)
+            ]
+            winners = np.flatnonzero(prizes > 0)
+            transactions += [
+                (int(user_ids[i]), 'prize_payout', int(prizes[i]), 'wallet', f'Prêmio do jogo #{game_ids[i]}',
+                 f'{{"game_id": {game_ids[i]}}}', played_at[i], played_at[i])
+                for i in winners.tolist()
+            ]
+            self._executemany(
+                "INSERT INTO transactions (user_id, type, amount, status, payment_method, description, extra_data, created_at, processed_at) "
+                "VALUES (?, ?, ?, 'completed', ?, ?, ?, ?, ?)",
+                transactions
+            )
+            self.report(f'jogos: {start + size:,}/{count:,}')
+
+class Recorder:
+    """Latência, status e consultas SQL de cada requisição, por endpoint"""
+
+    def __init__(self):
+        self.samples = defaultdict(list)  # endpoint -> [(ms, consultas, status)]
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.recording = False
+
+    def install(self, engine):
+        @event.listens_for(engine, 'before_cursor_execute')
+        def count_query(conn, cursor, statement, parameters, context, executemany):
+            self.local.queries = getattr(self.local, 'queries', 0) + 1
+
+    def call(self, client, label, method, url, **kwargs):
+        self.local.queries = 0
+        start = time.perf_counter()
+        response = client.open(url, method=method, **kwargs)
+        elapsed = (time.perf_counter() - start) * 1000
+
+        if self.recording:
+            with self.lock:
+                self.samples[label].append((elapsed, self.local.queries, response.status_code))
+        return response
+
+class VirtualUser:
+    """Uma thread de carga: escolhe cenários pelo peso e mantém tokens dos usuários já logados"""
+
+    def __init__(self, app, recorder, mix, seeded_users, worker_id, seed=None):
+        self.client = app.test_client()
+        self.recorder = recorder
+        self.scenarios, self.weights = zip(*mix.items())
+        self.seeded_users = seeded_users
+        self.worker_id = worker_id
+        self.random = random.Random(seed)
+        self.tokens = {}
+        self.registered = 0
+        self.cursors = {}
+
+    def call(self, label, method, url, token=None, **kwargs):
+        headers = {'Authorization': f'Bearer {token}'} if token else None
+        return self.recorder.call(self.client, label, method, url, headers=headers, **kwargs)
+
+    def token_for(self, user_id):
+        token = self.tokens.get(user_id)
+        if token is None:
+            response = self.call('POST /api/auth/login', 'POST', '/api/auth/login', json={
+                'email': f'bench{user_id}@example.com', 'password': BENCH_PASSWORD
+            })
+            token = self.tokens[user_id] = response.get_json().get('access_token')
+        return token
+
+    def player(self):
+        """Jogadores repetem: cada thread joga com um grupo próprio de 10 usuários (sessões reaproveitadas)"""
+        first = 2 + (self.worker_id * 10) % max(self.seeded_users - 11, 1)
+        return min(self.random.randint(first, first + 9), self.seeded_users)
+
+    def run(self, deadline):
+        while time.perf_counter() < deadline:
+            scenario = self.random.choices(self.scenarios, self.weights)[0]
+            getattr(self, f'scenario_{scenario}')()
+
+    def scenario_login(self):
+        user_id = self.random.randint(2, self.seeded_users)
+        self.tokens.pop(user_id, None)
+        self.token_for(user_id)
+
+    def scenario_register(self):
+        self.registered += 1
+        n = 10_000_000 + self.worker_id * 1_000_000 + self.registered
+        self.call('POST /api/auth/register', 'POST', '/api/auth/register', json={
+            'email': f'new{n}@example.com', 'password': BENCH_PASSWORD, 'first_name': 'Novo',
+            'last_name': 'Jogador', 'birth_date': '1995-05-05', 'cpf': make_cpf(n)
+        })
+
+    def scenario_play(self):
+        token = self.token_for(self.player())
+        # Rajada: algumas jogadas seguidas na mesma categoria
+        category_id = self.random.randint(1, 4)
+        for _ in range(self.random.randint(1, 5)):
+            self.call('POST /api/games/play', 'POST', '/api/games/play', token, json={'category_id': category_id})
+
+    def scenario_play_batch(self):
+        self.call('POST /api/games/play-batch', 'POST', '/api/games/play-batch', self.token_for(self.player()), json={
+            'category_id': self.random.randint(1, 4), 'count': self.random.choice((10, 20, 50))
+        })
+
+    def scenario_history(self):
+        self.call('GET /api/games/history', 'GET', '/api/games/history', self.token_for(self.player()))
+
+    def scenario_balance(self):
+        self.call('GET /api/wallet/balance', 'GET', '/api/wallet/balance', self.token_for(self.player()))
+
+    def scenario_transactions(self):
+        self.call('GET /api/wallet/transactions', 'GET', '/api/wallet/transactions', self.token_for(self.player()))
+
+    def scenario_categories(self):
+        self.call('GET /api/games/categories', 'GET', '/api/games/categories')
+
+    def scenario_statistics(self):
+        self.call('GET /api/games/statistics', 'GET', '/api/games/statistics', self.token_for(self.player()))
+
+    def scenario_winners(self):
+        self.call('GET /api/games/winners-feed', 'GET', '/api/games/winners-feed')
+
+    def scenario_deposit(self):
+        response = self.call('POST /api/wallet/deposit', 'POST', '/api/wallet/deposit', self.token_for(self.player()), json={
+            'amount': self.random.choice((20, 50, 100)), 'payment_method': 'pix'
+        })
+        transaction = (response.get_json() or {}).get('transaction')
+        if transaction:
+            self.call('POST /api/wallet/webhook/pix', 'POST', '/api/wallet/webhook/pix', json={
+                'external_transaction_id': transaction['external_transaction_id'], 'status': 'approved'
+            })
+
+    def scenario_withdraw(self):
+        user_id = self.player()
+        self.call('POST /api/wallet/withdraw', 'POST', '/api/wallet/withdraw', self.token_for(user_id), json={
+            'amount': 20, 'pix_key': make_cpf(user_id), 'pix_key_type': 'cpf'
+        })
+
+    def scenario_admin_dashboard(self):
+        self.call('GET /api/admin/dashboard', 'GET', '/api/admin/dashboard', self.token_for(1))
+
+    def browse(self, label, path, token):
+        """Avança uma página na listagem seguindo o cursor anterior (volta ao início no fim ou 1 vez em 20)"""
+        cursor = self.cursors.get(path)
+        if cursor is None or self.random.random() < 0.05:
+            cursor = None
+        url = f'{path}?cursor={cursor}' if cursor else path
+        response = self.call(label, 'GET', url, token)
+        self.cursors[path] = ((response.get_json() or {}).get('pagination') or {}).get('next_cursor')
+
+    def scenario_admin_users(self):
+        self.browse('GET /api/admin/users', '/api/admin/users', self.token_for(1))
+
+    def scenario_admin_transactions(self):
+        self.browse('GET /api/admin/transactions', '/api/admin/transactions', self.token_for(1))
+
+    def scenario_admin_revenue(self):
+        self.call('GET /api/admin/analytics/revenue', 'GET', '/api/admin/analytics/revenue', self.token_for(1))
+
+def parse_mix(text):
+    mix = {}
+    for item in text.split(','):
+        name, _, weight = item.partition('=')
+        name = name.strip()
+        if not hasattr(VirtualUser, f'scenario_{name}'):
+            raise ValueError(f'Cenário desconhecido: {name}')
+        mix[name] = float(weight or 1)
+    return {name: weight for name, weight in mix.items() if weight > 0}
+
+def summarize(samples, elapsed):
+    """Estatísticas por endpoint e totais"""
+    endpoints = {}
+    all_latencies = []
+
+    for label, values in sorted(samples.items()):
+        latencies = np.array([v[0] for v in values])
+        queries = np.array([v[1] for v in values])
+        statuses = defaultdict(int)
+        for v in values:
+            statuses[str(v[2])] += 1
+        all_latencies.append(latencies)
+
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        endpoints[label] = {
+            'requests': len(values),
+            'rps': len(values) / elapsed,
+            'errors': sum(count for status, count in statuses.items() if status.startswith('5')),
+            'status': dict(statuses),
+            'mean_ms': float(latencies.mean()),
+            'p50_ms': float(p50),
+            'p95_ms': float(p95),
+            'p99_ms': float(p99),
+            'max_ms': float(latencies.max()),
+            'queries_mean': float(queries.mean()),
+            'queries_max': int(queries.max())
+        }
+
+    latencies = np.concatenate(all_latencies) if all_latencies else np.zeros(1)
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    total = sum(e['requests'] for e in endpoints.values())
+    return {
+        'requests': total,
+        'rps': total / elapsed,
+        'errors': sum(e['errors'] for e in endpoints.values()),
+        'p50_ms': float(p50),
+        'p95_ms': float(p95),
+        'p99_ms': float(p99)
+    }, endpoints
+
+def _format_report(result):
+    totals = result['totals']
+    lines = [
+        f"{totals['requests']:,} requisições em {result['meta']['duration']:.0f}s: {totals['rps']:.1f} req/s, "
+        f"p50 {totals['p50_ms']:.1f} ms, p95 {totals['p95_ms']:.1f} ms, p99 {totals['p99_ms']:.1f} ms, "
+        f"{totals['errors']} erros 5xx, {result['background_errors']} erros em threads de fundo",
+        f"{'endpoint':<34} {'req':>7} {'req/s':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'SQL':>6}  status"
+    ]
+    for label, e in result['endpoints'].items():
+        statuses = ' '.join(f'{status}:{count}' for status, count in sorted(e['status'].items()))
+        lines.append(
+            f"{label:<34} {e['requests']:>7,} {e['rps']:>8.1f} {e['p50_ms']:>8.1f} {e['p95_ms']:>8.1f} "
+            f"{e['p99_ms']:>8.1f} {e['queries_mean']:>6.1f}  {statuses}"
+        )
+    return '\n'.join(lines)
+
+def _format_comparison(previous, current):
+    lines = [f"{'endpoint':<34} {'req/s antes':>12} {'req/s agora':>12} {'p95 antes':>10} {'p95 agora':>10} {'SQL antes':>10} {'SQL agora':>10}"]
+    for label in sorted(set(previous['endpoints']) | set(current['endpoints'])):
+        before = previous['endpoints'].get(label)
+        after = current['endpoints'].get(label)
+        row = [f'{label:<34}']
+        for key, width in (('rps', 12), ('p95_ms', 10), ('queries_mean', 10)):
+            row.append(f"{before[key]:>{width}.1f}" if before else f"{'-':>{width}}")
+            row.append(f"{after[key]:>{width}.1f}" if after else f"{'-':>{width}}")
+        lines.append(' '.join(row))
+    return '\n'.join(lines)
+
+def _has_users(database):
+    if not os.path.exists(database):
+        return False
+    connection = sqlite3.connect(database)
+    try:
+        return bool(connection.execute("SELECT count(*) FROM sqlite_master WHERE name = 'users'").fetchone()[0]
+                    and connection.execute('SELECT count(*) FROM users').fetchone()[0])
+    finally:
+        connection.close()
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+            cwd=os.path.dirname(__file__), check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark de carga da API com banco SQLite populado')
+    parser.add_argument('--users', type=int, default=1000, help='Usuários pré-cadastrados')
+    parser.add_argument('--games', type=int, default=100_000, help='Jogos históricos (com extrato)')
+    parser.add_argument('--days', type=int, default=60, help='Período coberto pelo histórico')
+    parser.add_argument('--duration', type=float, default=30, help='Segundos de carga medidos')
+    parser.add_argument('--warmup', type=float, default=3, help='Segundos de aquecimento (não medidos)')
+    parser.add_argument('--workers', type=int, default=4, help='Threads de carga simultâneas')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='Pesos dos cenários: nome=peso,...')
+    parser.add_argument('--seed', type=int, help='Semente para dados e cenários reprodutíveis')
+    parser.add_argument('--database', help='Arquivo SQLite (padrão: temporário); se já populado, não popula de novo')
+    parser.add_argument('--keep-database', action='store_true', help='Não apaga o banco no final')
+    parser.add_argument('--no-pool', action='store_true', help='Desliga o pool de raspadinhas pré-geradas')
+    parser.add_argument('--output', help='Arquivo JSON de resultado (padrão: benchmark-<data>.json)')
+    parser.add_argument('--compare', help='Resultado JSON anterior para comparar')
+    args = parser.parse_args(argv)
+
+    try:
+        mix = parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+
+    database = args.database or os.path.join(tempfile.mkdtemp(prefix='raspadinha-bench-'), 'bench.db')
+    already_seeded = _has_users(database)
+
+    # A aplicação lê a configuração do ambiente ao ser importada
+    os.environ['DATABASE_URL'] = f'sqlite:///{database}'
+    if args.no_pool:
+        os.environ['CARD_POOL_ENABLED'] = '0'
+    from src.main import app
+    from src.models.user import db
+
+    def log(message):
+        print(message, file=sys.stderr, flush=True)
+
+    seeding_seconds = 0.0
+    if not already_seeded:
+        log(f'Populando {database}...')
+        seeding_seconds = Seeder(app, db, days=args.days, seed=args.seed, report=log).seed(args.users, args.games)
+        log(f'Banco populado em {seeding_seconds:.1f}s')
+
+    with app.app_context():
+        from src.models.user import User
+        seeded_users = User.query.filter(User.email.like('bench%')).count()
+        recorder = Recorder()
+        recorder.install(db.engine)
+
+    # Erros em threads de fundo (ex.: workers da fila de jobs) não aparecem nas respostas
+    background_errors = []
+    previous_hook = threading.excepthook
+    threading.excepthook = lambda hook_args: background_errors.append(repr(hook_args.exc_value))
+
+    workers = [
+        VirtualUser(app, recorder, mix, seeded_users, i, None if args.seed is None else args.seed + i)
+        for i in range(args.workers)
+    ]
+
+    def run_all(seconds):
+        deadline = time.perf_counter() + seconds
+        threads = [threading.Thread(target=worker.run, args=(deadline,)) for worker in workers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    log(f'Aquecimento ({args.warmup:.0f}s)...')
+    run_all(args.warmup)
+    recorder.recording = True
+    log(f'Carga com {args.workers} threads ({args.duration:.0f}s)...')
+    started_at = time.perf_counter()
+    run_all(args.duration)
+    elapsed = time.perf_counter() - started_at
+    recorder.recording = False
+
+    # Espera as threads de fundo disparadas pelas requisições antes de restaurar o hook
+    for thread in threading.enumerate():
+        if thread is not threading.current_thread() and not thread.daemon:
+            thread.join()
+    threading.excepthook = previous_hook
+
+    totals, endpoints = summarize(recorder.samples, elapsed)
+    result = {
+        'meta': {
+            'timestamp': datetime.utcnow().isoformat(),
+            'git_commit': _git_commit(),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'users': seeded_users,
+            'games': args.games if not already_seeded else None,
+            'workers': args.workers,
+            'duration': elapsed,
+            'warmup': args.warmup,
+            'mix': mix,
+            'card_pool': not args.no_pool,
+            'seeding_seconds': seeding_seconds
+        },
+        'totals': totals,
+        'endpoints': endpoints,
+        'background_errors': len(background_errors),
+        'background_error_samples': sorted(set(background_errors))[:5]
+    }
+
+    output = args.output or f"benchmark-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}.json"
+    with open(output, 'w') as f:
+        json.dump(result, f, indent=2)
+
+    print(_format_report(result))
+    print(f'Resultado salvo em {output}')
+
+    if args.compare:
+        with open(args.compare) as f:
+            print(_format_comparison(json.load(f), result))
+
+    if app.extensions.get('card_pool_refiller'):
+        app.extensions['card_pool_refiller'].stop()
+    # Banco temporário é apagado; um --database informado fica para as próximas execuções
+    if not args.database and not args.keep_database:
+        os.remove(database)
+    else:
+        log(f'Banco mantido em {database}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,268 @@
+"""Confere o plano de execução (EXPLAIN QUERY PLAN) das consultas quentes da API
+
+Sobe a aplicação em um SQLite temporário, percorre pelo test client do Flask
+os fluxos principais (cadastro, depósito confirmado pelo webhook, jogadas,
+saque, históricos e painéis do admin) e roda um ciclo de cada worker em
+background (pool de raspadinhas, fila de jobs, saques, compactação das
+métricas). Cada comando SQL
+executado é explicado de novo com os mesmos parâmetros, e o comando falha
+(código de saída 1) se algum varrer uma tabela inteira. Ficam de fora as
+tabelas pequenas por natureza e os agregados de todo o histórico listados em
+ALLOWED_SCANS. Também são aceitos varrer um índice em ordem até o LIMIT e
+varrer um índice parcial (só tem as linhas do filtro, como a fila de jobs).
+
+Sem ANALYZE (sqlite_stat1) o SQLite escolhe o plano sem olhar o tamanho das
+tabelas, então o plano com poucos dados é o mesmo de um banco grande.
+
+Uso:
+    python -m src.check_query_plans
+    python -m src.check_query_plans --verbose
+    python -m src.check_query_plans --json
+"""
+import os
+import re
+import sys
+import json
+import sqlite3
+import argparse
+import tempfile
+import contextlib
+from collections import OrderedDict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+# Tabelas de configuração e contadores por categoria: poucas linhas, qualquer que seja o volume de jogo
+SMALL_TABLES = {'scratch_card_categories', 'limit_policies', 'ticket_series', 'symbol_sets', 'category_prize_counters'}
+
+# (passo, tabela) -> motivo: varreduras completas aceitas de propósito
+ALLOWED_SCANS = {
+    ('worker: reconstrução dos contadores por categoria', 'games'): 'reconstrução completa a partir de todos os jogos',
+    ('GET /api/admin/users?search=', 'users'): 'busca por trecho do nome ou e-mail (LIKE com curinga no início)',
+    ('GET /api/admin/jobs', 'jobs'): 'contagem da fila por estado',
+    ('POST /api/admin/limits/rebuild', 'transactions'): 'reconstrução completa dos contadores de limite',
+    ('POST /api/admin/limits/rebuild', 'limit_counters'): 'reconstrução completa dos contadores de limite',
+    ('worker: pool de raspadinhas', 'card_pool'): 'expurgo das usadas: o pool só guarda as disponíveis e as usadas desde o último ciclo'
+}
+
+SCAN_RE = re.compile(r'^SCAN (\S+)(?: AS \S+)?( USING (?:COVERING )?INDEX (\S+))?')
+
+class StatementRecorder:
+    """Guarda o primeiro uso de cada comando SQL em cada passo, com os parâmetros"""
+
+    def __init__(self):
+        self.step = None
+        self.statements = OrderedDict()
+
+    def install(self, engine):
+        from sqlalchemy import event
+
+        @event.listens_for(engine, 'before_cursor_execute')
+        def record(connection, cursor, statement, parameters, context, executemany):
+            keyword = statement.lstrip().split(None, 1)[0].upper()
+            if self.step is None or keyword not in ('SELECT', 'UPDATE', 'DELETE', 'INSERT', 'WITH'):
+                return
+            # executemany: lista de conjuntos de parâmetros; basta o primeiro
+            if executemany and parameters and isinstance(parameters[0], (list, tuple, dict)):
+                parameters = parameters[0]
+            parameters = tuple(parameters) if isinstance(parameters, (list, tuple)) else dict(parameters)
+            self.statements.setdefault((self.step, statement), parameters)
+
+def run_flows(app, recorder):
+    """Percorre os fluxos da API e um ciclo de cada worker, marcando o passo de cada comando"""
+    from src.benchmark import make_cpf
+    from src.models.user import db
+    from src.models.game import ScratchCardCategory
+    from src.models.pool import CardPoolRefiller
+    from src.models.jobs import JobQueue
+    from src.models.payout import PayoutService, FakePayoutGateway
+    from src.models.metrics import MetricsService, MetricsCompactor
+    from src.models.stats import StatsService
+
+    client = app.test_client()
+
+    def call(method, url, token=None, label=None, **kwargs):
+        recorder.step = label or f'{method} {url.split("?")[0]}'
+        headers = {'Authorization': f'Bearer {token}'} if token else None
+        response = client.open(url, method=method, headers=headers, **kwargs)
+        recorder.step = None
+        if response.status_code >= 500:
+            raise RuntimeError(f'{method} {url}: {response.status_code} {response.get_json()}')
+        return response.get_json() or {}
+
+    def worker(label, function):
+        recorder.step = f'worker: {label}'
+        with app.app_context():
+            function()
+            db.session.remove()
+        recorder.step = None
+
+    with app.app_context():
+        category_id = ScratchCardCategory.query.order_by(ScratchCardCategory.id).first().id
+
+    worker('pool de raspadinhas', CardPoolRefiller(app, low_watermark=50, high_watermark=100, batch_size=100).refill_once)
+
+    tokens = []
+    for i in range(1, 4):
+        data = call('POST', '/api/auth/register', json={
+            'email': f'plano{i}@example.com', 'password': 'planos123', 'first_name': 'Plano',
+            'last_name': f'Teste {i}', 'birth_date': '1990-01-01', 'cpf': make_cpf(i)
+        })
+        tokens.append(data.get('access_token'))
+    call('POST', '/api/auth/login', json={'email': 'plano2@example.com', 'password': 'planos123'})
+    admin, player = tokens[0], tokens[1]
+
+    call('GET', '/api/auth/profile', player)
+    transaction = call('POST', '/api/wallet/deposit', player, json={'amount': 200, 'payment_method': 'pix'}).get('transaction') or {}
+    call('POST', '/api/wallet/webhook/pix', json={
+        'external_transaction_id': transaction.get('external_transaction_id'), 'status': 'approved'
+    })
+    # Um job sem payload falha na única tentativa e vai para dead: o painel da fila e o reenvio têm o que mostrar
+    worker('enfileiramento de job', lambda: (JobQueue.enqueue('pix.confirm_deposit', max_attempts=1), db.session.commit()))
+    worker('fila de jobs', lambda: [JobQueue.run(*job, 'planos') for job in JobQueue.claim('planos', limit=10)])
+    worker('manutenção da fila de jobs', lambda: (JobQueue.expire_dead(), JobQueue.purge_done()))
+
+    call('GET', '/api/games/categories')
+    call('GET', f'/api/games/categories/{category_id}', label='GET /api/games/categories/<id>')
+    call('POST', '/api/games/play', player, json={'category_id': category_id, 'use_bonus': True})
+    for _ in range(3):
+        call('POST', '/api/games/play', player, json={'category_id': category_id})
+    call('POST', '/api/games/play-batch', player, json={'category_id': category_id, 'count': 5})
+    call('GET', '/api/games/bonuses', player)
+    call('GET', '/api/games/winners-feed')
+    call('GET', '/api/games/statistics')
+
+    history = call('GET', '/api/games/history?per_page=3', player)
+    call('GET', f'/api/games/history?per_page=3&cursor={history["pagination"]["next_cursor"]}', player,
+         label='GET /api/games/history?cursor=')
+    statement = call('GET', '/api/wallet/transactions?per_page=3', player)
+    call('GET', f'/api/wallet/transactions?per_page=3&type=game_cost&cursor={statement["pagination"]["next_cursor"]}',
+         player, label='GET /api/wallet/transactions?type=&cursor=')
+    call('GET', f'/api/wallet/transactions/{transaction.get("id")}', player, label='GET /api/wallet/transactions/<id>')
+    call('GET', '/api/wallet/balance', player)
+    call('GET', '/api/wallet/summary', player)
+    call('GET', '/api/wallet/limits', player)
+
+    call('POST', '/api/wallet/withdraw', player, json={'amount': 20, 'pix_key': make_cpf(2), 'pix_key_type': 'cpf'})
+    worker('saques', lambda: PayoutService.run_batch(FakePayoutGateway(latency=0), 'planos'))
+
+    call('GET', '/api/admin/dashboard', admin)
+    users = call('GET', '/api/admin/users?per_page=2', admin)
+    call('GET', f'/api/admin/users?per_page=2&cursor={users["pagination"]["next_cursor"]}', admin,
+         label='GET /api/admin/users?cursor=')
+    call('GET', '/api/admin/users?search=plano', admin, label='GET /api/admin/users?search=')
+    call('GET', '/api/admin/users/2', admin, label='GET /api/admin/users/<id>')
+    call('GET', '/api/admin/users/2/ledger', admin, label='GET /api/admin/users/<id>/ledger')
+    call('GET', '/api/admin/transactions?per_page=3', admin)
+    call('GET', '/api/admin/transactions?type=withdrawal&status=completed', admin,
+         label='GET /api/admin/transactions?type=&status=')
+    call('GET', '/api/admin/categories', admin)
+    call('GET', '/api/admin/analytics/revenue', admin)
+    call('GET', '/api/admin/analytics/series?granularity=minute&metrics=games,active_users,revenue', admin,
+         label='GET /api/admin/analytics/series')
+    # Exportações em fluxo: buffered lê a resposta inteira ainda dentro do passo
+    call('GET', '/api/admin/export/transactions?start=2000-01-01&end=2100-01-01&type=deposit', admin,
+         label='GET /api/admin/export/transactions', buffered=True)
+    call('GET', '/api/admin/export/games?start=2000-01-01&format=ndjson&gzip=true', admin,
+         label='GET /api/admin/export/games', buffered=True)
+    call('GET', '/api/admin/pools', admin)
+    jobs = call('GET', '/api/admin/jobs', admin)
+    if not jobs['dead_jobs']:
+        raise RuntimeError('GET /api/admin/jobs: nenhum job morto listado')
+    call('POST', f'/api/admin/jobs/{jobs["dead_jobs"][0]["id"]}/retry', admin, label='POST /api/admin/jobs/<id>/retry')
+    call('GET', '/api/admin/payouts', admin)
+    call('GET', '/api/admin/limits', admin)
+    call('POST', '/api/admin/limits/rebuild', admin)
+    worker('compactação das métricas', lambda: MetricsCompactor(app).compact_once())
+    worker('reconstrução do painel', lambda: MetricsService.rebuild(chunk_days=1))
+    worker('reconstrução dos totais por usuário', lambda: StatsService.rebuild_user_stats(chunk_size=2))
+    worker('reconstrução dos contadores por categoria', lambda: MetricsService.rebuild_category_counters(db.session))
+
+def explain(database, recorder, tables, partial_indexes):
+    """Plano de cada comando gravado; devolve [(passo, comando, linhas do plano, varreduras)]"""
+    connection = sqlite3.connect(database)
+    results = []
+    for (step, statement), parameters in recorder.statements.items():
+        plan = [row[3] for row in connection.execute(f'EXPLAIN QUERY PLAN {statement}', parameters)]
+        scans = []
+        for line in plan:
+            match = SCAN_RE.match(line)
+            if not match or match.group(1) not in tables:
+                continue
+            # Varrer um índice na ordem pedida até o LIMIT lê só a página, não a tabela
+            if match.group(2) and re.search(r'\bLIMIT\b', statement, re.IGNORECASE):
+                continue
+            if match.group(3) in partial_indexes:
+                continue
+            scans.append(match.group(1))
+        results.append((step, statement, plan, scans))
+    connection.close()
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Confere se as consultas quentes da API usam índices')
+    parser.add_argument('--verbose', action='store_true', help='Mostra o plano de todos os comandos')
+    parser.add_argument('--json', action='store_true', help='Resultado em JSON')
+    args = parser.parse_args(argv)
+
+    database = os.path.join(tempfile.mkdtemp(prefix='raspadinha-plans-'), 'plans.db')
+
+    # A aplicação lê a configuração do ambiente ao ser importada; os workers rodam um ciclo aqui mesmo
+    os.environ['DATABASE_URL'] = f'sqlite:///{database}'
+    os.environ['CARD_POOL_ENABLED'] = '0'
+    os.environ['JOB_WORKERS_ENABLED'] = '0'
+    os.environ['PAYOUT_WORKER_ENABLED'] = '0'
+    os.environ['METRICS_COMPACTION_ENABLED'] = '0'
+    # A inicialização imprime mensagens (categorias criadas...): ficam fora da saída JSON
+    with contextlib.redirect_stdout(sys.stderr):
+        from src.main import app
+    from src.models.user import db
+
+    recorder = StatementRecorder()
+    with app.app_context():
+        recorder.install(db.engine)
+        tables = set(db.metadata.tables) - SMALL_TABLES
+        partial_indexes = {
+            index.name for table in db.metadata.tables.values() for index in table.indexes
+            if index.dialect_options['sqlite'].get('where') is not None
+        }
+
+    run_flows(app, recorder)
+    results = explain(database, recorder, tables, partial_indexes)
+
+    failures = []
+    allowed = []
+    for step, statement, plan, scans in results:
+        for table in scans:
+            reason = ALLOWED_SCANS.get((step, table))
+            entry = {'step': step, 'table': table, 'statement': ' '.join(statement.split()), 'plan': plan}
+            if reason:
+                allowed.append({**entry, 'reason': reason})
+            else:
+                failures.append(entry)
+
+    if args.json:
+        print(json.dumps({
+            'statements': len(results),
+            'failures': failures,
+            'allowed': allowed
+        }, indent=2, ensure_ascii=False))
+    else:
+        if args.verbose:
+            for step, statement, plan, scans in results:
+                print(f'[{step}] {" ".join(statement.split())[:160]}')
+                for line in plan:
+                    print(f'    {line}')
+        print(f'{len(results)} comandos SQL explicados em {len({step for step, *_ in results})} passos')
+        for entry in allowed:
+            print(f"  aceito  {entry['step']}: varre {entry['table']} ({entry['reason']})")
+        for entry in failures:
+            print(f"  FALHA   {entry['step']}: varre {entry['table']}")
+            print(f"          {entry['statement'][:200]}")
+            for line in entry['plan']:
+                print(f'          {line}')
+        print('OK: nenhuma varredura completa inesperada' if not failures else f'{len(failures)} varredura(s) completa(s) inesperada(s)')
+
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,78 @@
+"""Exporta transações, jogos ou usuários em CSV ou NDJSON, em fluxo
+
+Lê o banco em lotes pelo cursor (yield_per) e grava cada lote já
+codificado, opcionalmente comprimido em gzip: a memória fica do tamanho de um
+lote, qualquer que seja o período exportado. Toda a exportação sai de um
+único snapshot de leitura, então pode rodar com a aplicação no ar. É a mesma
+exportação de GET /api/admin/export/<conjunto>.
+
+Uso:
+    python -m src.export transactions --start 2024-01-01 --end 2024-02-01 --output jan.csv
+    python -m src.export transactions --type deposit --status completed --format ndjson --gzip --output depositos.ndjson.gz
+    python -m src.export games --category-id 2 > jogos.csv
+"""
+import os
+import sys
+import time
+import argparse
+
+from flask import Flask
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from src.models.user import db
+from src.models.schema import import_models
+from src.models.pagination import parse_utc
+from src.models.export import ExportService, DATASETS, FORMATS, DEFAULT_CHUNK_SIZE
+
+DEFAULT_DATABASE_URI = f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'app.db')}"
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Exporta transações, jogos ou usuários em CSV ou NDJSON')
+    parser.add_argument('dataset', choices=DATASETS, help='O que exportar')
+    parser.add_argument('--start', type=parse_utc, help='Início do período, inclusive (data de criação ou da jogada; sem fuso: UTC)')
+    parser.add_argument('--end', type=parse_utc, help='Fim do período, exclusive')
+    parser.add_argument('--type', help='Tipo da transação')
+    parser.add_argument('--status', help='Status da transação, do jogo ou do usuário')
+    parser.add_argument('--user-id', type=int, help='Só as transações ou jogos deste usuário')
+    parser.add_argument('--category-id', type=int, help='Só os jogos desta categoria')
+    parser.add_argument('--loyalty-level', help='Só os usuários deste nível')
+    parser.add_argument('--format', choices=FORMATS, default='csv', help='Formato da saída')
+    parser.add_argument('--gzip', action='store_true', help='Comprime a saída em gzip')
+    parser.add_argument('--output', help='Arquivo de saída (padrão: saída padrão)')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Linhas lidas do banco por vez')
+    parser.add_argument('--database-uri', default=DEFAULT_DATABASE_URI, help='Banco a exportar')
+    args = parser.parse_args(argv)
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = args.database_uri
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'connect_args': {'timeout': 30}}
+    db.init_app(app)
+    import_models()
+
+    with app.app_context():
+        try:
+            query = ExportService.query(
+                args.dataset, args.start, args.end,
+                type=args.type, status=args.status, user_id=args.user_id,
+                category_id=args.category_id, loyalty_level=args.loyalty_level
+            )
+        except ValueError as e:
+            parser.error(str(e))
+
+        started_at = time.perf_counter()
+        written = 0
+        output = open(args.output, 'wb') if args.output else sys.stdout.buffer
+        try:
+            for chunk in ExportService.stream(query, args.format, args.gzip, args.chunk_size):
+                output.write(chunk)
+                written += len(chunk)
+        finally:
+            if args.output:
+                output.close()
+
+        elapsed = time.perf_counter() - started_at
+        print(f'{args.dataset}: {written:,} bytes em {elapsed:.1f}s', file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
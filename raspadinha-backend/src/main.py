@@ -7,6 +7,7 @@ from flask import Flask, send_from_directory
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager
 from datetime import timedelta
+from sqlalchemy import text
 
 # Importar todos os modelos
 from src.models.user import db, User
@@ -14,6 +15,15 @@ from src.models.wallet import Wallet
 from src.models.game import ScratchCardCategory, ScratchCard, Game
 from src.models.transaction import Transaction
 from src.models.bonus import Bonus, Mission
+from src.models.pool import CardPoolEntry, CardPoolRefiller
+from src.models.series import TicketSeries
+from src.models.ledger import LedgerEntry, WalletCheckpoint, LedgerService
+from src.models.jobs import Job, JobWorkerPool
+from src.models.limits import LimitPolicy, LimitCounter, LimitService
+from src.models.stats import UserMonthlyStats
+from src.models.metrics import MetricBucket, MetricsCompactor
+from src.models.payout import PayoutWorker
+from src.models.schema import upgrade
 
 # Importar todas as rotas
 from src.routes.auth import auth_bp
@@ -30,12 +40,54 @@ app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=24)
 app.config['JWT_REFRESH_TOKEN_EXPIRES'] = timedelta(days=30)
 
 # Configuração do banco de dados
-app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'app.db')}"
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get(
+    'DATABASE_URL', f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'app.db')}"
+)
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Vários workers no mesmo arquivo SQLite: espera o lock de escrita em vez de falhar na hora
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'connect_args': {'timeout': 30}}
+
+# Pool de raspadinhas pré-geradas (reabastecido em background)
+app.config['CARD_POOL_ENABLED'] = os.environ.get('CARD_POOL_ENABLED', '1') == '1'
+app.config['CARD_POOL_LOW_WATERMARK'] = 200
+app.config['CARD_POOL_HIGH_WATERMARK'] = 2000
+app.config['CARD_POOL_BATCH_SIZE'] = 1000
+app.config['CARD_POOL_REFILL_INTERVAL'] = 5  # segundos
+
+# Fila de jobs (confirmação de depósito, processamento de saque...) consumida por um pool fixo de threads
+app.config['JOB_WORKERS_ENABLED'] = os.environ.get('JOB_WORKERS_ENABLED', '1') == '1'
+app.config['JOB_WORKERS'] = int(os.environ.get('JOB_WORKERS', '2'))  # Threads por processo
+app.config['JOB_POLL_INTERVAL'] = 1.0  # segundos com a fila vazia
+app.config['JOB_VISIBILITY_TIMEOUT'] = 60  # segundos até outro worker poder pegar um job reservado
+app.config['JOB_MAINTENANCE_INTERVAL'] = 60  # segundos entre as expirações para dead e os expurgos dos concluídos
+app.config['JOB_RETENTION_DAYS'] = int(os.environ.get('JOB_RETENTION_DAYS', '7'))  # dias que os jobs concluídos ficam na tabela
+
+# Saques pagos em lote por um worker em background (um por processo) via gateway de pagamento
+app.config['PAYOUT_WORKER_ENABLED'] = os.environ.get('PAYOUT_WORKER_ENABLED', '1') == '1'
+app.config['PAYOUT_GATEWAY'] = os.environ.get('PAYOUT_GATEWAY', 'fake')  # Nome registrado ou 'pacote.modulo:Classe'
+app.config['PAYOUT_GATEWAY_OPTIONS'] = {}  # Argumentos do construtor do gateway
+app.config['PAYOUT_BATCH_SIZE'] = int(os.environ.get('PAYOUT_BATCH_SIZE', '100'))
+app.config['PAYOUT_POLL_INTERVAL'] = 2.0  # segundos com a fila vazia
+app.config['PAYOUT_VISIBILITY_TIMEOUT'] = 300  # segundos até outro worker retomar um lote reservado
+
+# Painel do admin montado a partir dos baldes agregados e guardado em cache por processo
+app.config['DASHBOARD_CACHE_TTL'] = int(os.environ.get('DASHBOARD_CACHE_TTL', '30'))  # segundos
+
+# Retenção dos baldes por minuto e por hora aplicada por uma thread em background
+app.config['METRICS_COMPACTION_ENABLED'] = os.environ.get('METRICS_COMPACTION_ENABLED', '1') == '1'
+app.config['METRICS_COMPACTION_INTERVAL'] = 60  # segundos
+
+# Exportações do admin (CSV/NDJSON em fluxo): linhas lidas do banco por vez
+app.config['EXPORT_CHUNK_SIZE'] = int(os.environ.get('EXPORT_CHUNK_SIZE', '5000'))
 
 # Inicializar extensões
 db.init_app(app)
 jwt = JWTManager(app)
+
+@jwt.user_identity_loader
+def user_identity_lookup(identity):
+    # O claim 'sub' do JWT precisa ser string; as rotas convertem de volta com int(get_jwt_identity())
+    return str(identity)
 CORS(app, origins="*")  # Permitir CORS para desenvolvimento
 
 # Registrar blueprints
@@ -46,7 +98,17 @@ app.register_blueprint(admin_bp, url_prefix='/api/admin')
 
 # Criar tabelas e dados iniciais
 with app.app_context():
-    db.create_all()
+    # WAL: leituras não bloqueiam a escrita (a configuração fica gravada no arquivo do banco)
+    if db.engine.dialect.name == 'sqlite':
+        db.session.execute(text('PRAGMA journal_mode=WAL'))
+        db.session.commit()
+    
+    upgrade()
+    # Carteiras criadas antes do razão recebem o saldo atual como lançamento de abertura
+    LedgerService.open_wallets()
+    
+    # Políticas de limite padrão para os níveis de fidelidade
+    LimitService.seed_policies()
     
     # Criar categorias de raspadinha se não existirem
     if ScratchCardCategory.query.count() == 0:
@@ -96,6 +158,30 @@ with app.app_context():
         db.session.commit()
         print("Categorias de raspadinha criadas!")
 
+# Inicia o reabastecimento do pool de raspadinhas
+if app.config['CARD_POOL_ENABLED']:
+    card_pool_refiller = CardPoolRefiller.from_config(app)
+    app.extensions['card_pool_refiller'] = card_pool_refiller
+    card_pool_refiller.start()
+
+# Inicia os workers da fila de jobs
+if app.config['JOB_WORKERS_ENABLED']:
+    job_worker_pool = JobWorkerPool.from_config(app)
+    app.extensions['job_worker_pool'] = job_worker_pool
+    job_worker_pool.start()
+
+# Inicia o worker de saques
+if app.config['PAYOUT_WORKER_ENABLED']:
+    payout_worker = PayoutWorker.from_config(app)
+    app.extensions['payout_worker'] = payout_worker
+    payout_worker.start()
+
+# Inicia a compactação dos baldes de métricas
+if app.config['METRICS_COMPACTION_ENABLED']:
+    metrics_compactor = MetricsCompactor.from_config(app)
+    app.extensions['metrics_compactor'] = metrics_compactor
+    metrics_compactor.start()
+
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
 def serve(path):
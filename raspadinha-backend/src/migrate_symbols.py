@@ -0,0 +1,172 @@
+"""Migra raspadinhas antigas (símbolos em JSON) para o formato compacto
+
+Converte em lotes, com um commit por lote, as linhas de scratch_cards que
+ainda não têm `grid`. Pode ser interrompido e executado de novo: continua
+das linhas que faltam. Cada linha é decodificada de volta e comparada com o
+JSON original antes de gravar; as que não batem ficam no formato antigo.
+
+Uso:
+    python -m src.migrate_symbols
+    python -m src.migrate_symbols --chunk-size 10000 --vacuum
+"""
+import os
+import sys
+import time
+import argparse
+
+from flask import Flask
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+# Todos os modelos precisam estar importados para o SQLAlchemy configurar os relacionamentos
+from src.models.user import db
+from src.models.wallet import Wallet
+from src.models.game import ScratchCardCategory, ScratchCard
+from src.models.transaction import Transaction
+from src.models.bonus import Bonus, Mission
+from src.models.pool import CardPoolEntry
+from src.models.series import TicketSeries
+from src.models.ledger import LedgerEntry, WalletCheckpoint
+from src.models.rules import WinRule
+from src.models.symbols import SymbolSet, positions_to_mask, decode_combination
+from src.models.schema import upgrade
+
+DEFAULT_DATABASE_URI = f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'app.db')}"
+
+def encode_legacy(symbols, combination, symbol_table):
+    """Codifica uma raspadinha antiga; devolve as colunas novas ou None se não for possível"""
+    table = list(symbol_table)
+    combination = combination or {}
+
+    def index_of(symbol):
+        if symbol not in table:
+            table.append(symbol)
+        return table.index(symbol)
+
+    if not isinstance(symbols, list) or len(symbols) != 9:
+        return None
+
+    grid = [index_of(symbol) for symbol in symbols]
+    winning_symbol = index_of(combination['symbol']) if 'symbol' in combination else None
+    bonus = combination.get('bonus') or {}
+    bonus_symbol = index_of(bonus['symbol']) if bonus else None
+
+    if len(table) > 256:
+        return None
+
+    return {
+        'table': table,
+        'rule_type': combination.get('rule') if 'symbol' in combination else None,
+        'bonus_symbol': bonus_symbol,
+        'grid': bytes(grid),
+        'winning_symbol': winning_symbol,
+        'winning_mask': positions_to_mask(combination.get('positions') or []),
+        'multiplier': combination.get('multiplier', 1),
+        'bonus_free_games': bonus.get('free_games', 0)
+    }
+
+def _round_trips(encoded, symbols, combination):
+    """Confere se a versão codificada decodifica para o mesmo conteúdo (posições em qualquer ordem)"""
+    symbol_set = SymbolSet(symbols=encoded['table'], rule_type=encoded['rule_type'], bonus_symbol=encoded['bonus_symbol'])
+    decoded = decode_combination(
+        symbol_set, encoded['winning_symbol'], encoded['winning_mask'],
+        encoded['multiplier'], encoded['bonus_free_games']
+    )
+
+    if combination and 'positions' in combination:
+        combination = {**combination, 'positions': sorted(combination['positions'])}
+    return [encoded['table'][i] for i in encoded['grid']] == symbols and decoded == (combination or None)
+
+def migrate(chunk_size=5000, report=None):
+    """Converte as linhas pendentes em lotes; devolve (convertidas, mantidas no formato antigo)"""
+    table = ScratchCard.__table__
+    symbol_tables = {
+        category.id: WinRule.for_category(category).symbol_table
+        for category in ScratchCardCategory.query.all()
+    }
+
+    update = table.update().where(table.c.id == db.bindparam('card_id')).values(
+        symbol_set_id=db.bindparam('symbol_set_id'),
+        grid=db.bindparam('grid'),
+        winning_symbol=db.bindparam('winning_symbol'),
+        winning_mask=db.bindparam('winning_mask'),
+        multiplier=db.bindparam('multiplier'),
+        bonus_free_games=db.bindparam('bonus_free_games'),
+        symbols=db.bindparam('legacy_symbols', type_=db.JSON),
+        winning_combination=db.bindparam('legacy_winning_combination', type_=db.JSON)
+    )
+
+    last_id = 0
+    converted = 0
+    skipped = 0
+
+    while True:
+        rows = db.session.execute(
+            db.select(table.c.id, table.c.category_id, table.c.symbols, table.c.winning_combination)
+            .where(table.c.grid.is_(None), table.c.id > last_id)
+            .order_by(table.c.id)
+            .limit(chunk_size)
+        ).all()
+        if not rows:
+            break
+
+        params = []
+        for card_id, category_id, symbols, combination in rows:
+            encoded = encode_legacy(symbols, combination, symbol_tables.get(category_id, []))
+            if encoded is None or not _round_trips(encoded, symbols, combination):
+                skipped += 1
+                continue
+
+            params.append({
+                'card_id': card_id,
+                'symbol_set_id': SymbolSet.id_for(encoded['table'], encoded['rule_type'], encoded['bonus_symbol']),
+                'grid': encoded['grid'],
+                'winning_symbol': encoded['winning_symbol'],
+                'winning_mask': encoded['winning_mask'],
+                'multiplier': encoded['multiplier'],
+                'bonus_free_games': encoded['bonus_free_games'],
+                'legacy_symbols': None,  # JSON null: a coluna antiga é NOT NULL
+                'legacy_winning_combination': None
+            })
+
+        if params:
+            db.session.execute(update, params)
+        db.session.commit()
+
+        converted += len(params)
+        last_id = rows[-1].id
+        if report:
+            report(converted, skipped, last_id)
+
+    return converted, skipped
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Migra scratch_cards para o formato compacto de símbolos')
+    parser.add_argument('--chunk-size', type=int, default=5000, help='Linhas convertidas por commit')
+    parser.add_argument('--database-uri', default=DEFAULT_DATABASE_URI, help='Banco a migrar')
+    parser.add_argument('--vacuum', action='store_true', help='Executa VACUUM no final para devolver o espaço ao disco')
+    args = parser.parse_args(argv)
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = args.database_uri
+    db.init_app(app)
+
+    with app.app_context():
+        upgrade()
+
+        started_at = time.perf_counter()
+
+        def report(converted, skipped, last_id):
+            elapsed = time.perf_counter() - started_at
+            print(f'{converted:,} convertidas, {skipped:,} mantidas (até id {last_id}) em {elapsed:.1f}s', file=sys.stderr, flush=True)
+
+        converted, skipped = migrate(args.chunk_size, report)
+        print(f'Concluído: {converted:,} raspadinhas convertidas, {skipped:,} mantidas no formato antigo')
+
+        if args.vacuum:
+            with db.engine.connect() as connection:
+                connection.exec_driver_sql('VACUUM')
+            print('VACUUM concluído')
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,5 @@
 from src.models.user import db
+from src.models.money import Money, to_decimal
 from datetime import datetime, timedelta
 from decimal import Decimal
 import json
@@ -9,7 +10,7 @@ class Bonus(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     type = db.Column(db.String(50), nullable=False)  # welcome, reload, daily, referral, mission
-    amount = db.Column(db.Numeric(10, 2), default=Decimal('0.00'))
+    amount = db.Column(Money, default=Decimal('0.00'))
     free_games = db.Column(db.Integer, default=0)
     status = db.Column(db.String(20), default='active')  # active, claimed, expired
     expires_at = db.Column(db.DateTime)
@@ -17,6 +18,11 @@ class Bonus(db.Model):
     extra_data = db.Column(db.JSON)  # Dados específicos do bônus
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        # Bônus ativos do usuário (jogadas grátis, listagem) e bônus diário do dia
+        db.Index('ix_bonuses_user_status', 'user_id', 'status'),
+    )
+
     def __repr__(self):
         return f'<Bonus {self.id} {self.type} User:{self.user_id}>'
 
@@ -62,12 +68,17 @@ class Mission(db.Model):
     target_value = db.Column(db.Integer, nullable=False)  # Valor alvo para completar
     current_value = db.Column(db.Integer, default=0)  # Progresso atual
     reward_type = db.Column(db.String(20))  # points, free_games, bonus_money
-    reward_value = db.Column(db.Numeric(10, 2))
+    reward_value = db.Column(Money)
     status = db.Column(db.String(20), default='active')  # active, completed, claimed
     expires_at = db.Column(db.DateTime)
     completed_at = db.Column(db.DateTime)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        # Missões ativas do usuário, atualizadas a cada jogada
+        db.Index('ix_missions_user_status', 'user_id', 'status'),
+    )
+
     def __repr__(self):
         return f'<Mission {self.id} {self.name} User:{self.user_id}>'
 
@@ -136,12 +147,12 @@ class BonusService:
     def create_daily_bonus(user_id):
         """Cria bônus diário"""
         # Verifica se já recebeu hoje
-        today = datetime.utcnow().date()
+        today = datetime.combine(datetime.utcnow().date(), datetime.min.time())
         existing = Bonus.query.filter_by(
             user_id=user_id,
             type='daily'
         ).filter(
-            db.func.date(Bonus.created_at) == today
+            Bonus.created_at >= today
         ).first()
         
         if existing:
@@ -177,7 +188,7 @@ class BonusService:
             bonus = Bonus(
                 user_id=user_id,
                 type='reload',
-                amount=Decimal(str(bonus_amount)),
+                amount=to_decimal(bonus_amount),
                 expires_at=datetime.utcnow() + timedelta(days=30),
                 extra_data={
                     'description': f'Bônus de recarga {int(bonus_percentage*100)}%',
@@ -191,17 +202,34 @@ class BonusService:
         
         return None
     
+    @staticmethod
+    def create_card_bonus(user_id, free_games, scratch_card_id):
+        """Cria bônus de jogos grátis ganho pelo símbolo de bônus da raspadinha (sem commit)"""
+        bonus = Bonus(
+            user_id=user_id,
+            type='card_bonus',
+            free_games=free_games,
+            expires_at=datetime.utcnow() + timedelta(days=7),
+            extra_data={
+                'description': f'Símbolo de bônus - {free_games} jogo(s) grátis',
+                'scratch_card_id': scratch_card_id
+            }
+        )
+        
+        db.session.add(bonus)
+        return bonus
+    
     @staticmethod
     def create_daily_missions(user_id):
         """Cria missões diárias para o usuário"""
-        today = datetime.utcnow().date()
+        today = datetime.combine(datetime.utcnow().date(), datetime.min.time())
         
         # Verifica se já tem missões para hoje
         existing = Mission.query.filter_by(
             user_id=user_id,
             type='daily'
         ).filter(
-            db.func.date(Mission.created_at) == today
+            Mission.created_at >= today
         ).first()
         
         if existing:
@@ -233,7 +261,7 @@ class BonusService:
                 description=mission_data['description'],
                 target_value=mission_data['target_value'],
                 reward_type=mission_data['reward_type'],
-                reward_value=Decimal(str(mission_data['reward_value'])),
+                reward_value=to_decimal(mission_data['reward_value']),
                 expires_at=datetime.utcnow() + timedelta(hours=24)
             )
             
@@ -245,7 +273,7 @@ class BonusService:
     
     @staticmethod
     def update_user_missions(user_id, action, value=1):
-        """Atualiza progresso das missões do usuário"""
+        """Atualiza progresso das missões do usuário (sem commit)"""
         active_missions = Mission.query.filter_by(
             user_id=user_id,
             status='active'
@@ -262,14 +290,11 @@ class BonusService:
                 if mission.update_progress(value):
                     completed_missions.append(mission)
         
-        if completed_missions:
-            db.session.commit()
-        
         return completed_missions
     
     @staticmethod
     def update_loyalty_points(user_id, amount_spent):
-        """Atualiza pontos de fidelidade do usuário"""
+        """Atualiza pontos de fidelidade do usuário (sem commit)"""
         from src.models.user import User
         
         user = User.query.get(user_id)
@@ -289,7 +314,6 @@ class BonusService:
             # Cria bônus de upgrade de nível
             BonusService._create_level_up_bonus(user_id, new_level)
         
-        db.session.commit()
         return points_earned
     
     @staticmethod
@@ -306,7 +330,7 @@ class BonusService:
     
     @staticmethod
     def _create_level_up_bonus(user_id, new_level):
-        """Cria bônus de upgrade de nível"""
+        """Cria bônus de upgrade de nível (sem commit)"""
         level_bonuses = {
             'silver': {'free_games': 2, 'amount': 10},
             'gold': {'free_games': 5, 'amount': 25},
@@ -319,7 +343,7 @@ class BonusService:
             bonus = Bonus(
                 user_id=user_id,
                 type='level_up',
-                amount=Decimal(str(bonus_data['amount'])),
+                amount=to_decimal(bonus_data['amount']),
                 free_games=bonus_data['free_games'],
                 expires_at=datetime.utcnow() + timedelta(days=30),
                 extra_data={
@@ -329,7 +353,6 @@ class BonusService:
             )
             
             db.session.add(bonus)
-            db.session.commit()
             return bonus
         
         return None
@@ -0,0 +1,168 @@
+from src.models.user import db, User
+from src.models.game import Game, ScratchCard
+from src.models.transaction import Transaction
+from datetime import datetime, date
+from decimal import Decimal
+import csv
+import io
+import json
+import zlib
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson'
+}
+
+# Linhas lidas do banco (e codificadas) por vez: a memória fica nesse tamanho, qualquer que seja o total
+DEFAULT_CHUNK_SIZE = 5000
+
+# Conjunto exportável -> (colunas, junções, coluna de data, filtros aceitos). Só colunas, sem
+# carregar objetos: nada de identity map crescendo nem uma consulta por linha para buscar o
+# usuário. A ordem (data, id) segue os índices de listagem do admin.
+DATASETS = {
+    'transactions': (
+        [
+            Transaction.id, Transaction.created_at, Transaction.user_id, User.email.label('user_email'),
+            Transaction.type, Transaction.status, Transaction.amount, Transaction.payment_method,
+            Transaction.external_transaction_id, Transaction.description, Transaction.processed_at
+        ],
+        [(User, Transaction.user_id == User.id)],
+        Transaction.created_at,
+        {'type': Transaction.type, 'status': Transaction.status, 'user_id': Transaction.user_id}
+    ),
+    'games': (
+        [
+            Game.id, Game.played_at, Game.user_id, User.email.label('user_email'), ScratchCard.category_id,
+            Game.scratch_card_id, Game.amount_paid, Game.prize_won, Game.is_bonus_game, Game.status
+        ],
+        [(User, Game.user_id == User.id), (ScratchCard, Game.scratch_card_id == ScratchCard.id)],
+        Game.played_at,
+        {'status': Game.status, 'user_id': Game.user_id, 'category_id': ScratchCard.category_id}
+    ),
+    'users': (
+        [
+            User.id, User.created_at, User.email, User.first_name, User.last_name, User.status,
+            User.loyalty_level, User.loyalty_points, User.email_verified, User.last_login
+        ],
+        [],
+        User.created_at,
+        {'status': User.status, 'loyalty_level': User.loyalty_level}
+    )
+}
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    return value
+
+def _json_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+class ExportService:
+    """Exportação em fluxo (CSV ou NDJSON, opcionalmente gzip) de transações, jogos e usuários"""
+
+    @staticmethod
+    def query(dataset, start=None, end=None, **filters):
+        """Consulta da exportação de `dataset` em [start, end) com filtros de igualdade
+
+        ValueError para conjunto ou filtro desconhecido. Filtros None são
+        ignorados.
+        """
+        if dataset not in DATASETS:
+            raise ValueError(f"Exportação inválida: use {', '.join(DATASETS)}")
+        columns, joins, timestamp, accepted = DATASETS[dataset]
+
+        query = db.select(*columns)
+        for table, condition in joins:
+            query = query.outerjoin(table, condition)
+
+        if start is not None:
+            query = query.where(timestamp >= start)
+        if end is not None:
+            query = query.where(timestamp < end)
+        for name, value in filters.items():
+            if value is None:
+                continue
+            if name not in accepted:
+                raise ValueError(f"Filtro '{name}' não se aplica a {dataset}: use {', '.join(accepted)}")
+            query = query.where(accepted[name] == value)
+
+        return query.order_by(timestamp, columns[0])
+
+    @staticmethod
+    def rows(query, chunk_size=DEFAULT_CHUNK_SIZE):
+        """Gera (nomes das colunas, lotes de linhas) lendo `chunk_size` linhas por vez do cursor
+
+        Uma única consulta e um único snapshot de leitura do início ao fim
+        (yield_per); o primeiro item gerado são os nomes das colunas.
+        """
+        result = db.session.execute(query.execution_options(yield_per=chunk_size))
+        try:
+            yield list(result.keys())
+            for partition in result.partitions():
+                yield partition
+        finally:
+            result.close()
+
+    @staticmethod
+    def encode(query, fmt='csv', chunk_size=DEFAULT_CHUNK_SIZE):
+        """Texto da exportação em pedaços, um por lote de linhas"""
+        chunks = ExportService.rows(query, chunk_size)
+        names = next(chunks)
+
+        if fmt == 'csv':
+            buffer = io.StringIO()
+            writer = csv.writer(buffer, lineterminator='\n')
+            writer.writerow(names)
+            for partition in chunks:
+                writer.writerows([_csv_value(value) for value in row] for row in partition)
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            yield buffer.getvalue()
+        else:
+            for partition in chunks:
+                yield ''.join(
+                    json.dumps(dict(zip(names, map(_json_value, row))), ensure_ascii=False) + '\n'
+                    for row in partition
+                )
+
+    @staticmethod
+    def stream(query, fmt='csv', compress=False, chunk_size=DEFAULT_CHUNK_SIZE):
+        """Bytes da exportação em pedaços (gzip em fluxo se `compress`)
+
+        O formato é conferido já na chamada (ValueError), antes de qualquer
+        byte ser enviado; a consulta só roda quando o fluxo é consumido.
+        """
+        if fmt not in FORMATS:
+            raise ValueError(f"Formato inválido: use {', '.join(FORMATS)}")
+        return ExportService._stream(query, fmt, compress, chunk_size)
+
+    @staticmethod
+    def _stream(query, fmt, compress, chunk_size):
+        chunks = ExportService.encode(query, fmt, chunk_size)
+        if not compress:
+            for chunk in chunks:
+                if chunk:
+                    yield chunk.encode('utf-8')
+            return
+
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        for chunk in chunks:
+            data = compressor.compress(chunk.encode('utf-8'))
+            if data:
+                yield data
+        yield compressor.flush()
+
+    @staticmethod
+    def filename(dataset, fmt='csv', compress=False, now=None):
+        now = now or datetime.utcnow()
+        return f"{dataset}-{now:%Y%m%dT%H%M%S}.{fmt}{'.gz' if compress else ''}"
@@ -3,6 +3,22 @@ from datetime import datetime
 from decimal import Decimal
 import json
 import random
+import os
+import threading
+import numpy as np
+
+from src.models.rules import WinRule, category_version
+from src.models.symbols import SymbolSet, decode_combination
+from src.models.money import Money, from_cents, to_decimal
+
+# Gerador NumPy por thread (e por processo, para não repetir a sequência após um fork)
+_rng_local = threading.local()
+
+def _default_rng():
+    if getattr(_rng_local, 'pid', None) != os.getpid():
+        _rng_local.rng = np.random.default_rng()
+        _rng_local.pid = os.getpid()
+    return _rng_local.rng
 
 class ScratchCardCategory(db.Model):
     __tablename__ = 'scratch_card_categories'
@@ -11,12 +27,14 @@ class ScratchCardCategory(db.Model):
     name = db.Column(db.String(50), nullable=False)
     theme = db.Column(db.String(50), nullable=False)
     description = db.Column(db.Text)
-    price = db.Column(db.Numeric(8, 2), nullable=False)
-    max_prize = db.Column(db.Numeric(10, 2), nullable=False)
+    price = db.Column(Money, nullable=False)
+    max_prize = db.Column(Money, nullable=False)
     symbols = db.Column(db.JSON)  # Lista de símbolos possíveis
     win_rules = db.Column(db.JSON)  # Regras de vitória
+    prize_table = db.Column(db.JSON)  # Faixas de prêmio: [{'multiplier' ou 'amount', 'weight'}]; NULL = padrão
     is_active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     def __repr__(self):
         return f'<ScratchCardCategory {self.name}>'
@@ -31,25 +49,63 @@ class ScratchCardCategory(db.Model):
             'max_prize': float(self.max_prize),
             'symbols': self.symbols,
             'win_rules': self.win_rules,
+            'prize_table': self.prize_table,
             'is_active': self.is_active,
             'created_at': self.created_at.isoformat()
         }
 
 class ScratchCard(db.Model):
+    """Raspadinha gerada
+    
+    O grid é gravado compacto: 9 bytes com o índice de cada símbolo em um
+    SymbolSet, posições vencedoras como máscara de bits e o restante da
+    combinação em colunas inteiras. `symbols` e `winning_combination`
+    decodificam para o mesmo formato de antes. Raspadinhas antigas ainda não
+    migradas (src.migrate_symbols) usam as colunas JSON legadas.
+    """
     __tablename__ = 'scratch_cards'
     
     id = db.Column(db.Integer, primary_key=True)
     category_id = db.Column(db.Integer, db.ForeignKey('scratch_card_categories.id'), nullable=False)
-    symbols = db.Column(db.JSON, nullable=False)  # Símbolos da carta específica
-    winning_combination = db.Column(db.JSON)  # Combinação vencedora se houver
-    prize_amount = db.Column(db.Numeric(10, 2), default=Decimal('0.00'))
+    symbol_set_id = db.Column(db.Integer, db.ForeignKey('symbol_sets.id'))
+    grid = db.Column(db.LargeBinary(9))  # Índice de cada casa no SymbolSet
+    winning_symbol = db.Column(db.SmallInteger)  # Índice do símbolo vencedor; NULL se perdeu
+    winning_mask = db.Column(db.SmallInteger, default=0)  # Bit i = casa i faz parte do padrão vencedor
+    multiplier = db.Column(db.SmallInteger, default=1)
+    bonus_free_games = db.Column(db.SmallInteger, default=0)
+    prize_amount = db.Column(Money, default=Decimal('0.00'))
     probability = db.Column(db.Numeric(8, 6), nullable=False)
     is_winner = db.Column(db.Boolean, default=False)
+    series_id = db.Column(db.Integer, db.ForeignKey('ticket_series.id'))  # NULL fora do modo série
+    ticket_number = db.Column(db.Integer)  # Posição do bilhete na série (a partir de 1)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # Formato antigo (JSON); JSON null nas raspadinhas codificadas
+    legacy_symbols = db.Column('symbols', db.JSON, default=db.JSON.NULL)
+    legacy_winning_combination = db.Column('winning_combination', db.JSON)
+    
     # Relacionamentos
     category = db.relationship('ScratchCardCategory', backref='cards')
 
+    @property
+    def symbols(self):
+        """Símbolos da carta específica"""
+        if self.grid is None:
+            return self.legacy_symbols
+        table = SymbolSet.lookup(self.symbol_set_id).symbols
+        return [table[i] for i in self.grid]
+    
+    @property
+    def winning_combination(self):
+        """Combinação vencedora se houver (e/ou bônus)"""
+        if self.grid is None:
+            return self.legacy_winning_combination
+        
+        return decode_combination(
+            SymbolSet.lookup(self.symbol_set_id), self.winning_symbol,
+            self.winning_mask, self.multiplier, self.bonus_free_games
+        )
+
     def __repr__(self):
         return f'<ScratchCard {self.id} Winner:{self.is_winner}>'
 
@@ -62,6 +118,8 @@ class ScratchCard(db.Model):
             'prize_amount': float(self.prize_amount),
             'probability': float(self.probability),
             'is_winner': self.is_winner,
+            'series_id': self.series_id,
+            'ticket_number': self.ticket_number,
             'created_at': self.created_at.isoformat(),
             'category': self.category.to_dict() if self.category else None
         }
@@ -72,8 +130,8 @@ class Game(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     scratch_card_id = db.Column(db.Integer, db.ForeignKey('scratch_cards.id'), nullable=False)
-    amount_paid = db.Column(db.Numeric(8, 2), nullable=False)
-    prize_won = db.Column(db.Numeric(10, 2), default=Decimal('0.00'))
+    amount_paid = db.Column(Money, nullable=False)
+    prize_won = db.Column(Money, default=Decimal('0.00'))
     is_bonus_game = db.Column(db.Boolean, default=False)
     game_data = db.Column(db.JSON)  # Dados específicos do jogo
     status = db.Column(db.String(20), default='completed')
@@ -82,6 +140,13 @@ class Game(db.Model):
     # Relacionamentos
     scratch_card = db.relationship('ScratchCard', backref='games')
 
+    __table_args__ = (
+        # Histórico do usuário paginado por (played_at, id)
+        db.Index('ix_games_user_played', 'user_id', 'played_at', 'id'),
+        # Jogos do dia e feed de ganhadores recentes
+        db.Index('ix_games_played', 'played_at'),
+    )
+
     def __repr__(self):
         return f'<Game {self.id} User:{self.user_id} Prize:{self.prize_won}>'
 
@@ -104,60 +169,53 @@ class GameEngine:
     
     @staticmethod
     def generate_scratch_card(category_id, user_id=None):
-        """Gera uma nova raspadinha baseada na categoria"""
+        """Gera uma nova raspadinha baseada na categoria (sem commit; o chamador confirma a transação)"""
         category = ScratchCardCategory.query.get(category_id)
         if not category:
             raise ValueError("Categoria não encontrada")
         
-        # Símbolos disponíveis
-        symbols = category.symbols
-        if not symbols:
-            symbols = ['🍀', '💎', '💰', '⭐', '🎯', '🏆', '🎁', '🔥']
-        
-        # Gera grid 3x3 de símbolos
-        card_symbols = []
-        for i in range(9):
-            card_symbols.append(random.choice(symbols))
-        
-        # Determina se é vencedora baseado em probabilidades
-        win_probability = GameEngine._calculate_win_probability(category, user_id)
-        is_winner = random.random() < win_probability
-        
-        prize_amount = Decimal('0.00')
-        winning_combination = None
-        
-        if is_winner:
-            # Determina o prêmio
-            prize_amount = GameEngine._determine_prize(category)
-            
-            # Força uma combinação vencedora
-            winning_symbol = random.choice(symbols)
-            winning_positions = random.sample(range(9), 3)
-            
-            for pos in winning_positions:
-                card_symbols[pos] = winning_symbol
-            
-            winning_combination = {
-                'symbol': winning_symbol,
-                'positions': winning_positions,
-                'rule': '3_of_a_kind'
-            }
-        
         # Cria a raspadinha
-        scratch_card = ScratchCard(
-            category_id=category_id,
-            symbols=card_symbols,
-            winning_combination=winning_combination,
-            prize_amount=prize_amount,
-            probability=win_probability,
-            is_winner=is_winner
-        )
+        scratch_card = ScratchCard(**GameEngine.build_card(category, user_id))
         
         db.session.add(scratch_card)
-        db.session.commit()
+        db.session.flush()  # Para obter o ID da raspadinha
         
         return scratch_card
     
+    @staticmethod
+    def generate_scratch_cards(category, count, user_id=None):
+        """Gera e insere `count` raspadinhas de uma vez (sem commit)"""
+        if count <= 0:
+            return []
+        
+        rows = GameEngine.generate_batch(category, count, user_id).to_rows()
+        # Cada raspadinha devolvida traz o próprio conteúdo: a ordem do RETURNING não importa
+        return db.session.scalars(db.insert(ScratchCard).returning(ScratchCard).execution_options(render_nulls=True), rows).all()
+    
+    @staticmethod
+    def build_card(category, user_id=None):
+        """Sorteia o conteúdo de uma raspadinha sem tocar no banco (colunas de ScratchCard)"""
+        # Mesmo caminho do lote: regra compilada da categoria e tabela de alias dos prêmios
+        return GameEngine.generate_batch(category, 1, user_id).to_rows()[0]
+    
+    @staticmethod
+    def verify_card(scratch_card):
+        """Confere se o grid da raspadinha corresponde ao resultado gravado, pela regra da categoria"""
+        evaluation = WinRule.for_category(scratch_card.category).verify(scratch_card.symbols)
+        combination = scratch_card.winning_combination or {}
+        
+        valid = evaluation['is_winner'] == bool(scratch_card.is_winner)
+        if valid and evaluation['is_winner']:
+            valid = (
+                evaluation['symbol'] == combination.get('symbol')
+                and sorted(evaluation['positions']) == sorted(combination.get('positions') or [])
+                and evaluation['multiplier'] == combination.get('multiplier', 1)
+            )
+        bonus = combination.get('bonus') or {}
+        valid = valid and evaluation['bonus_free_games'] == bonus.get('free_games', 0)
+        
+        return {'valid': valid, 'evaluation': evaluation}
+    
     @staticmethod
     def _calculate_win_probability(category, user_id=None):
         """Calcula probabilidade de vitória dinâmica"""
@@ -176,27 +234,249 @@ class GameEngine:
         return base_probability
     
     @staticmethod
-    def _determine_prize(category):
-        """Determina o valor do prêmio baseado na categoria"""
+    def _prize_distribution(category):
+        """Faixas de prêmio da categoria: lista de (valor, probabilidade)"""
         max_prize = float(category.max_prize)
         price = float(category.price)
         
-        # Distribuição de prêmios
-        prize_distribution = [
-            (price, 0.60),          # Recupera o investimento (60%)
-            (price * 2.5, 0.25),   # 2.5x o valor (25%)
-            (price * 5, 0.10),     # 5x o valor (10%)
-            (price * 10, 0.04),    # 10x o valor (4%)
-            (max_prize, 0.01)      # Prêmio máximo (1%)
+        if not category.prize_table:
+            # Distribuição de prêmios padrão
+            return [
+                (price, 0.60),          # Recupera o investimento (60%)
+                (price * 2.5, 0.25),   # 2.5x o valor (25%)
+                (price * 5, 0.10),     # 5x o valor (10%)
+                (price * 10, 0.04),    # 10x o valor (4%)
+                (max_prize, 0.01)      # Prêmio máximo (1%)
+            ]
+        
+        total_weight = sum(float(tier['weight']) for tier in category.prize_table)
+        return [
+            (
+                min(price * float(tier['multiplier']) if 'multiplier' in tier else float(tier['amount']), max_prize),
+                float(tier['weight']) / total_weight
+            )
+            for tier in category.prize_table
         ]
+    
+    @staticmethod
+    def _determine_prize(category):
+        """Determina o valor do prêmio baseado na categoria (tabela de alias, O(1))"""
+        return PrizeTable.for_category(category).sample()
+    
+    @staticmethod
+    def expected_rtp(category):
+        """RTP teórico da configuração: P(vitória) x prêmio médio (com multiplicadores) / preço"""
+        win_probability = GameEngine._calculate_win_probability(category)
+        tiers = GameEngine._prize_distribution(category)
+        rule = WinRule.for_category(category)
+        max_prize = float(category.max_prize)
+        
+        def expected_prize(prize):
+            # Multiplicador sorteado com a probabilidade da regra, limitado ao prêmio máximo
+            if not len(rule.multiplier_values):
+                return prize
+            multiplied = sum(min(prize * int(factor), max_prize) for factor in rule.multiplier_values) / len(rule.multiplier_values)
+            return (1 - rule.multiplier_probability) * prize + rule.multiplier_probability * multiplied
+        
+        return win_probability * sum(expected_prize(prize) * probability for prize, probability in tiers) / float(category.price)
+    
+    @staticmethod
+    def generate_batch(category, n, user_id=None, rng=None, outcomes=None):
+        """Gera `n` raspadinhas de uma vez com NumPy, sem tocar no banco
+        
+        Sorteia o resultado (vitória com a probabilidade da categoria e prêmio
+        pela tabela de alias) e depois monta os grids pela regra compilada da
+        categoria. É o único caminho de geração: jogada ao vivo, pool, séries e
+        simulação passam por aqui. Devolve um CardBatch.
         
-        rand = random.random()
-        cumulative = 0
+        outcomes: (prize_cents, probability) com os prêmios já definidos (ex.:
+        bilhetes de uma série); nesse caso não há sorteio nem multiplicadores.
+        """
+        rng = rng if rng is not None else _default_rng()
+        rule = WinRule.for_category(category)
         
-        for prize, probability in prize_distribution:
-            cumulative += probability
-            if rand <= cumulative:
-                return Decimal(str(prize))
+        if outcomes is not None:
+            prize_cents, win_probability = outcomes
+            prize_cents = np.asarray(prize_cents, dtype=np.int64)
+            cards = rule.generate(prize_cents > 0, rng, extras=False)
+            return CardBatch(category.id, rule, win_probability, cards, prize_cents)
         
-        return Decimal(str(price))  # Fallback
+        win_probability = GameEngine._calculate_win_probability(category, user_id)
+        
+        is_winner = rng.random(n) < win_probability
+        winners = np.flatnonzero(is_winner)
+        
+        prize_cents = np.zeros(n, dtype=np.int64)
+        prize_cents[winners] = PrizeTable.for_category(category).sample_cents(rng, len(winners))
+        
+        cards = rule.generate(is_winner, rng)
+        
+        # Multiplicadores da regra, limitados ao prêmio máximo
+        prize_cents = np.minimum(prize_cents * cards.multiplier, round(float(category.max_prize) * 100))
+        
+        return CardBatch(category.id, rule, win_probability, cards, prize_cents)
+
+class PrizeTable:
+    """Distribuição de prêmios de uma categoria compilada em tabela de alias (método de Vose)
+    
+    Compilada uma vez por versão da categoria; cada sorteio é O(1) qualquer que
+    seja o número de faixas.
+    """
+    
+    # category_id -> PrizeTable; a versão guardada invalida a entrada quando a categoria muda
+    _cache = {}
+    _cache_lock = threading.Lock()
+    
+    def __init__(self, distribution, version=None):
+        self.version = version
+        self.prizes = [to_decimal(prize) for prize, _ in distribution]
+        self.probabilities = [probability for _, probability in distribution]
+        self.prob, self.alias = PrizeTable._build_alias(self.probabilities)
+        
+        self._prize_cents = np.array([round(prize * 100) for prize, _ in distribution], dtype=np.int64)
+        self._prob_array = np.array(self.prob)
+        self._alias_array = np.array(self.alias, dtype=np.int64)
+    
+    def __len__(self):
+        return len(self.prizes)
+    
+    @staticmethod
+    def _build_alias(probabilities):
+        """Método de Vose: divide a distribuição em n colunas de peso 1 com no máximo 2 faixas cada"""
+        n = len(probabilities)
+        total = sum(probabilities)
+        scaled = [p * n / total for p in probabilities]
+        prob = [1.0] * n
+        alias = list(range(n))
+        
+        small = [i for i, value in enumerate(scaled) if value < 1]
+        large = [i for i, value in enumerate(scaled) if value >= 1]
+        
+        while small and large:
+            less, more = small.pop(), large.pop()
+            prob[less] = scaled[less]
+            alias[less] = more
+            scaled[more] = scaled[more] + scaled[less] - 1
+            (small if scaled[more] < 1 else large).append(more)
+        
+        # O que sobra tem peso 1 (a menos de erro de arredondamento)
+        return prob, alias
+    
+    @classmethod
+    def for_category(cls, category):
+        """Tabela compilada da categoria, recompilada se a categoria mudou"""
+        version = category_version(category)
+        table = cls._cache.get(category.id)
+        
+        if table is None or table.version != version:
+            table = cls(GameEngine._prize_distribution(category), version)
+            if category.id is not None:
+                with cls._cache_lock:
+                    cls._cache[category.id] = table
+        
+        return table
+    
+    @classmethod
+    def invalidate(cls, category_id=None):
+        """Descarta a tabela compilada de uma categoria (ou de todas)"""
+        with cls._cache_lock:
+            if category_id is None:
+                cls._cache.clear()
+            else:
+                cls._cache.pop(category_id, None)
+    
+    @staticmethod
+    def validate_config(prize_table):
+        """Valida a configuração de faixas de ScratchCardCategory.prize_table"""
+        if prize_table is None:
+            return
+        if not isinstance(prize_table, list) or not prize_table:
+            raise ValueError('A tabela de prêmios deve ser uma lista não vazia de faixas')
+        
+        for tier in prize_table:
+            if not isinstance(tier, dict) or ('multiplier' in tier) == ('amount' in tier):
+                raise ValueError("Cada faixa deve ter 'multiplier' ou 'amount'")
+            value = tier.get('multiplier', tier.get('amount'))
+            weight = tier.get('weight')
+            if not isinstance(value, (int, float)) or isinstance(value, bool) or value <= 0:
+                raise ValueError('Valor da faixa deve ser positivo')
+            if not isinstance(weight, (int, float)) or isinstance(weight, bool) or weight <= 0:
+                raise ValueError("Cada faixa deve ter 'weight' positivo")
+    
+    def _index(self, u):
+        # Um único número uniforme escolhe a coluna (parte inteira) e o lado (parte fracionária)
+        scaled = u * len(self.prob)
+        column = min(int(scaled), len(self.prob) - 1)
+        return column if scaled - column < self.prob[column] else self.alias[column]
+    
+    def sample(self, rng=random):
+        """Sorteia um prêmio (Decimal)"""
+        return self.prizes[self._index(rng.random())]
+    
+    def sample_cents(self, rng, n):
+        """Sorteia `n` prêmios em centavos de uma vez (NumPy)"""
+        scaled = rng.random(n) * len(self.prob)
+        columns = np.minimum(scaled.astype(np.int64), len(self.prob) - 1)
+        accept = (scaled - columns) < self._prob_array[columns]
+        return self._prize_cents[np.where(accept, columns, self._alias_array[columns])]
 
+class CardBatch:
+    """Lote compacto de raspadinhas geradas por GameEngine.generate_batch
+    
+    symbols: (n, 9) índices em `symbol_table`; is_winner: (n,);
+    prize_cents: (n,) prêmio em centavos; winning_symbol: (n,) índice ou -1;
+    winning_positions: (n, tamanho do padrão) posições no grid ou -1;
+    multiplier: (n,) fator aplicado ao prêmio; bonus_free_games: (n,).
+    """
+    
+    def __init__(self, category_id, rule, probability, cards, prize_cents):
+        self.category_id = category_id
+        self.rule_type = rule.type
+        self.symbol_table = rule.symbol_table
+        self.bonus_symbol = rule.bonus_symbol
+        self.probability = probability
+        self.symbols = cards.grids
+        self.is_winner = cards.is_winner
+        self.prize_cents = prize_cents
+        self.winning_symbol = cards.winning_symbol
+        self.winning_positions = cards.winning_positions
+        self.multiplier = cards.multiplier
+        self.bonus_free_games = cards.bonus_free_games
+    
+    def __len__(self):
+        return len(self.is_winner)
+    
+    def to_rows(self):
+        """Converte o lote em dicionários com as colunas de ScratchCard (para insert em massa)
+        
+        Precisa de sessão: registra o SymbolSet do lote se ainda não existir.
+        """
+        symbol_set_id = SymbolSet.id_for(
+            self.symbol_table, self.rule_type,
+            int(self.bonus_symbol) if self.bonus_symbol is not None else None
+        )
+        
+        # Máscara de bits das posições vencedoras (-1 = posição não usada)
+        positions = self.winning_positions.astype(np.int64)
+        masks = np.where(positions >= 0, 1 << np.maximum(positions, 0), 0).sum(axis=1)
+        
+        rows = []
+        for grid, is_winner, prize_cents, symbol, mask, multiplier, free_games in zip(
+            self.symbols, self.is_winner.tolist(), self.prize_cents.tolist(),
+            self.winning_symbol.tolist(), masks.tolist(),
+            self.multiplier.tolist(), self.bonus_free_games.tolist()
+        ):
+            rows.append({
+                'category_id': self.category_id,
+                'symbol_set_id': symbol_set_id,
+                'grid': grid.tobytes(),
+                'winning_symbol': symbol if is_winner else None,
+                'winning_mask': mask,
+                'multiplier': multiplier,
+                'bonus_free_games': free_games,
+                'prize_amount': from_cents(prize_cents),
+                'probability': self.probability,
+                'is_winner': is_winner
+            })
+        
+        return rows
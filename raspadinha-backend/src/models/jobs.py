@@ -0,0 +1,374 @@
+from src.models.user import db
+from src.models.schema import inline
+from sqlalchemy import func
+from datetime import datetime, timedelta
+import logging
+import os
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+class Job(db.Model):
+    """Tarefa em segundo plano persistida no banco (fila de jobs)
+
+    Estados: pending (aguardando `run_at`), running (reservada por um worker até
+    `locked_until`), done e dead (esgotou as tentativas). Um job running cujo
+    prazo venceu volta a ficar visível para outro worker.
+    """
+    __tablename__ = 'jobs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), nullable=False)  # Handler registrado em JobQueue
+    payload = db.Column(db.JSON)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, running, done, dead
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)  # Não executa antes disso
+    locked_until = db.Column(db.DateTime)  # Prazo de visibilidade enquanto running
+    locked_by = db.Column(db.String(50))
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        # Índice parcial: só o que ainda pode ser executado, na ordem de execução
+        db.Index('ix_jobs_ready', 'run_at', sqlite_where=db.text("status IN ('pending', 'running')")),
+        # Painel da fila: jobs mortos mais recentes e latência dos concluídos na janela
+        db.Index('ix_jobs_status_finished', 'status', 'finished_at'),
+    )
+
+    def __repr__(self):
+        return f'<Job {self.id} {self.name} {self.status}>'
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'payload': self.payload,
+            'status': self.status,
+            'attempts': self.attempts,
+            'max_attempts': self.max_attempts,
+            'run_at': self.run_at.isoformat() if self.run_at else None,
+            'locked_until': self.locked_until.isoformat() if self.locked_until else None,
+            'locked_by': self.locked_by,
+            'last_error': self.last_error,
+            'created_at': self.created_at.isoformat(),
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+def _ready_statuses():
+    """Termo do índice parcial ix_jobs_ready, com literais para o SQLite poder usá-lo"""
+    return Job.status.in_([inline('pending'), inline('running')])
+
+class JobQueue:
+    """Fila de jobs no SQLite: enfileirar, reservar, concluir e reagendar com backoff"""
+
+    RETRY_BASE_SECONDS = 5
+    RETRY_MAX_SECONDS = 3600
+
+    # nome -> função(payload); registrados com @JobQueue.handler('nome')
+    _handlers = {}
+
+    @staticmethod
+    def handler(name):
+        """Decorator que registra a função que executa os jobs `name`
+
+        O handler não faz commit: o trabalho é gravado junto com a conclusão do
+        job. Como um job pode rodar de novo (prazo expirado, nova tentativa), o
+        handler precisa ser idempotente.
+        """
+        def register(function):
+            JobQueue._handlers[name] = function
+            return function
+        return register
+
+    @staticmethod
+    def enqueue(name, payload=None, delay=0, max_attempts=5):
+        """Enfileira um job (sem commit: entra junto com a transação de quem o criou)"""
+        if name not in JobQueue._handlers:
+            raise ValueError(f'Job desconhecido: {name}')
+
+        job = Job(
+            name=name,
+            payload=payload,
+            max_attempts=max_attempts,
+            run_at=datetime.utcnow() + timedelta(seconds=delay)
+        )
+        db.session.add(job)
+        return job
+
+    @staticmethod
+    def _ready(now):
+        """Jobs que podem ser reservados agora: pending vencidos e running com o prazo expirado
+
+        Um running expirado sem tentativas restantes fica de fora: vai para dead
+        em expire_dead.
+        """
+        return db.select(Job.id).where(
+            _ready_statuses(),
+            Job.run_at <= now,
+            db.or_(Job.status == 'pending', db.and_(Job.locked_until < now, Job.attempts < Job.max_attempts))
+        )
+
+    @staticmethod
+    def expire_dead():
+        """Move para dead os reservados que expiraram sem tentativas restantes (worker morreu na última) e faz commit"""
+        now = datetime.utcnow()
+        expired = db.session.execute(
+            db.update(Job)
+            .where(
+                _ready_statuses(), Job.status == 'running', Job.locked_until < now, Job.attempts >= Job.max_attempts
+            )
+            .values(status='dead', finished_at=now, locked_until=None, last_error='Prazo de visibilidade expirado')
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.commit()
+        return expired
+
+    @staticmethod
+    def claim(worker_id, limit=1, visibility_timeout=60):
+        """Reserva até `limit` jobs prontos com um único UPDATE atômico e faz commit
+
+        Pega jobs pending vencidos e jobs running cujo prazo de visibilidade
+        expirou (worker que morreu no meio). Com a fila vazia só faz uma
+        leitura pelo índice parcial: o UPDATE abriria uma transação de escrita
+        e disputaria o lock do banco com as jogadas a cada consulta.
+        Devolve [(id, name, payload, attempts)].
+        """
+        now = datetime.utcnow()
+
+        found = db.session.execute(JobQueue._ready(now).limit(1)).first() is not None
+        # Encerra a leitura antes do UPDATE: promover o snapshot antigo a escrita falharia (BUSY_SNAPSHOT)
+        db.session.commit()
+        if not found:
+            return []
+
+        ready = JobQueue._ready(now).order_by(Job.run_at, Job.id).limit(limit)
+
+        rows = db.session.execute(
+            db.update(Job)
+            .where(Job.id.in_(ready))
+            .values(
+                status='running',
+                attempts=Job.attempts + 1,
+                locked_by=worker_id,
+                locked_until=now + timedelta(seconds=visibility_timeout),
+                started_at=now
+            )
+            .returning(Job.id, Job.name, Job.payload, Job.attempts)
+            .execution_options(synchronize_session=False)
+        ).all()
+        db.session.commit()
+
+        return rows
+
+    @staticmethod
+    def complete(job_id, worker_id):
+        """Marca o job como concluído, se ainda estiver reservado para este worker, e faz commit"""
+        updated = db.session.execute(
+            db.update(Job)
+            .where(Job.id == job_id, Job.status == 'running', Job.locked_by == worker_id)
+            .values(status='done', finished_at=datetime.utcnow(), locked_until=None, last_error=None)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.commit()
+        return bool(updated)
+
+    @staticmethod
+    def fail(job_id, worker_id, attempts, error):
+        """Reagenda com backoff exponencial ou, sem tentativas restantes, move para dead"""
+        delay = min(JobQueue.RETRY_BASE_SECONDS * 2 ** (attempts - 1), JobQueue.RETRY_MAX_SECONDS)
+        delay *= 1 + random.random() * 0.25  # Jitter para não reprocessar tudo ao mesmo tempo
+        now = datetime.utcnow()
+
+        updated = db.session.execute(
+            db.update(Job)
+            .where(Job.id == job_id, Job.status == 'running', Job.locked_by == worker_id)
+            .values(
+                status=db.case((Job.attempts >= Job.max_attempts, 'dead'), else_='pending'),
+                run_at=now + timedelta(seconds=delay),
+                finished_at=db.case((Job.attempts >= Job.max_attempts, now), else_=None),
+                locked_until=None,
+                last_error=str(error)[:2000]
+            )
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.commit()
+        return bool(updated)
+
+    @staticmethod
+    def run(job_id, name, payload, attempts, worker_id):
+        """Executa um job reservado; devolve True se concluiu"""
+        try:
+            JobQueue._handlers[name](payload or {})
+        except Exception as e:
+            db.session.rollback()
+            logger.warning('Job %s (%s) falhou na tentativa %s: %s', job_id, name, attempts, e)
+            JobQueue.fail(job_id, worker_id, attempts, e)
+            return False
+
+        return JobQueue.complete(job_id, worker_id)
+
+    @staticmethod
+    def retry(job):
+        """Devolve um job dead para a fila com as tentativas zeradas"""
+        if job.status != 'dead':
+            raise ValueError('Só jobs mortos podem ser reenviados')
+
+        job.status = 'pending'
+        job.attempts = 0
+        job.run_at = datetime.utcnow()
+        job.finished_at = None
+        db.session.commit()
+        return job
+
+    @staticmethod
+    def purge_done(older_than=timedelta(days=7)):
+        """Apaga jobs concluídos há mais de `older_than`"""
+        deleted = db.session.execute(
+            db.delete(Job).where(Job.status == 'done', Job.finished_at < datetime.utcnow() - older_than)
+        ).rowcount
+        db.session.commit()
+        return deleted
+
+    @staticmethod
+    def stats(window=timedelta(hours=1)):
+        """Profundidade da fila por estado e latência (criação até conclusão) dos jobs recentes"""
+        now = datetime.utcnow()
+
+        by_status = dict(db.session.query(Job.status, func.count(Job.id)).group_by(Job.status).all())
+        oldest_ready = db.session.query(func.min(Job.run_at)).filter(
+            _ready_statuses(), Job.status == 'pending', Job.run_at <= now
+        ).scalar()
+
+        latency = func.julianday(Job.finished_at) - func.julianday(Job.created_at)
+        count, average, maximum = db.session.query(
+            func.count(Job.id), func.avg(latency), func.max(latency)
+        ).filter(
+            Job.status == 'done', Job.finished_at >= now - window
+        ).one()
+
+        by_name = {}
+        for name, status, total in db.session.query(Job.name, Job.status, func.count(Job.id)).filter(
+            Job.status.in_(('pending', 'running', 'dead'))
+        ).group_by(Job.name, Job.status).all():
+            by_name.setdefault(name, {})[status] = total
+
+        return {
+            'pending': by_status.get('pending', 0),
+            'running': by_status.get('running', 0),
+            'done': by_status.get('done', 0),
+            'dead': by_status.get('dead', 0),
+            'ready_lag_seconds': round((now - oldest_ready).total_seconds(), 3) if oldest_ready else 0,
+            'completed_last_window': count,
+            'avg_latency_seconds': round(average * 86400, 3) if average is not None else None,
+            'max_latency_seconds': round(maximum * 86400, 3) if maximum is not None else None,
+            'by_name': by_name
+        }
+
+class JobWorkerPool:
+    """Pool fixo de threads que consomem a fila de jobs (uma instância por processo)"""
+
+    def __init__(self, app, size=4, poll_interval=1.0, visibility_timeout=60,
+                 maintenance_interval=60, retention=timedelta(days=7)):
+        self.app = app
+        self.size = size
+        self.poll_interval = poll_interval
+        self.visibility_timeout = visibility_timeout
+        self.maintenance_interval = maintenance_interval
+        self.retention = retention
+
+        self.jobs_done = 0
+        self.jobs_failed = 0
+        self.jobs_expired = 0
+        self.jobs_purged = 0
+        self.last_maintenance_at = None
+        self.last_error = None
+        self._threads = []
+        self._counters_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._next_maintenance = 0
+
+    @classmethod
+    def from_config(cls, app):
+        return cls(
+            app,
+            size=app.config['JOB_WORKERS'],
+            poll_interval=app.config['JOB_POLL_INTERVAL'],
+            visibility_timeout=app.config['JOB_VISIBILITY_TIMEOUT'],
+            maintenance_interval=app.config['JOB_MAINTENANCE_INTERVAL'],
+            retention=timedelta(days=app.config['JOB_RETENTION_DAYS'])
+        )
+
+    def start(self):
+        for i in range(self.size):
+            thread = threading.Thread(
+                target=self._work, args=(f'{os.getpid()}-{i}',), name=f'job-worker-{i}', daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=None):
+        self._stop_event.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _work(self, worker_id):
+        while not self._stop_event.is_set():
+            try:
+                with self.app.app_context():
+                    self.maintain()
+                    claimed = JobQueue.claim(worker_id, visibility_timeout=self.visibility_timeout)
+                    for job_id, name, payload, attempts in claimed:
+                        done = JobQueue.run(job_id, name, payload, attempts, worker_id)
+                        with self._counters_lock:
+                            if done:
+                                self.jobs_done += 1
+                            else:
+                                self.jobs_failed += 1
+            except Exception as e:
+                claimed = None
+                self.last_error = str(e)
+                logger.exception('Erro no worker de jobs %s', worker_id)
+
+            # Fila vazia (ou erro): espera antes de consultar de novo
+            if not claimed:
+                self._stop_event.wait(self.poll_interval)
+
+    def maintain(self):
+        """Manutenção da fila a cada `maintenance_interval` segundos, por uma só thread do pool
+
+        Move para dead os reservados expirados sem tentativas e apaga os
+        concluídos há mais de `retention`.
+        """
+        with self._counters_lock:
+            if time.monotonic() < self._next_maintenance:
+                return
+            self._next_maintenance = time.monotonic() + self.maintenance_interval
+
+        expired = JobQueue.expire_dead()
+        purged = JobQueue.purge_done(self.retention)
+        with self._counters_lock:
+            self.jobs_expired += expired
+            self.jobs_purged += purged
+            self.last_maintenance_at = datetime.utcnow()
+
+    def to_dict(self):
+        return {
+            'running': sum(thread.is_alive() for thread in self._threads),
+            'size': self.size,
+            'poll_interval': self.poll_interval,
+            'visibility_timeout': self.visibility_timeout,
+            'maintenance_interval': self.maintenance_interval,
+            'retention_days': self.retention.days,
+            'jobs_done': self.jobs_done,
+            'jobs_failed': self.jobs_failed,
+            'jobs_expired': self.jobs_expired,
+            'jobs_purged': self.jobs_purged,
+            'last_maintenance_at': self.last_maintenance_at.isoformat() if self.last_maintenance_at else None,
+            'last_error': self.last_error
+        }
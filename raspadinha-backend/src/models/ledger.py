@@ -0,0 +1,236 @@
+from src.models.user import db
+from src.models.money import Money, money
+from src.models.schema import sqlite_trigger
+from sqlalchemy import func, literal
+from datetime import datetime
+from decimal import Decimal
+
+CHECKPOINT_INTERVAL = 100  # Um checkpoint a cada N lançamentos da carteira
+
+# Conta do outro lado de cada tipo de lançamento (partidas dobradas)
+CONTRA_ACCOUNTS = {
+    'opening': 'opening',          # Saldo de carteiras anteriores ao razão
+    'deposit': 'payments',
+    'withdrawal': 'payouts',
+    'game_cost': 'house',
+    'prize_payout': 'house',
+    'bonus': 'promotions',
+    'adjustment': 'adjustments'
+}
+
+class LedgerEntry(db.Model):
+    """Lançamento do razão da carteira (só inserção, nunca alterado nem apagado)
+
+    Cada lançamento movimenta a carteira (saldo e/ou bônus) e a conta de
+    contrapartida com o valor oposto. O trigger de inserção copia os saldos
+    resultantes para `wallets`, que é só o retrato do último lançamento.
+    """
+    __tablename__ = 'ledger_entries'
+
+    id = db.Column(db.Integer, primary_key=True)
+    wallet_id = db.Column(db.Integer, db.ForeignKey('wallets.id'), nullable=False)
+    seq = db.Column(db.Integer, nullable=False)  # Posição no razão da carteira (1, 2, 3...)
+    entry_type = db.Column(db.String(20), nullable=False)  # Chaves de CONTRA_ACCOUNTS
+    contra_account = db.Column(db.String(30), nullable=False)
+    balance_delta = db.Column(Money, nullable=False, default=Decimal('0.00'))
+    bonus_delta = db.Column(Money, nullable=False, default=Decimal('0.00'))
+    balance_after = db.Column(Money, nullable=False)
+    bonus_after = db.Column(Money, nullable=False)
+    reference = db.Column(db.String(50))  # ex.: game:12, transaction:34
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('wallet_id', 'seq', name='uq_ledger_entries_wallet_seq'),
+    )
+
+    def __repr__(self):
+        return f'<LedgerEntry Wallet:{self.wallet_id} #{self.seq} {self.entry_type}>'
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'wallet_id': self.wallet_id,
+            'seq': self.seq,
+            'entry_type': self.entry_type,
+            'contra_account': self.contra_account,
+            'balance_delta': float(self.balance_delta),
+            'bonus_delta': float(self.bonus_delta),
+            'balance_after': float(self.balance_after),
+            'bonus_after': float(self.bonus_after),
+            'reference': self.reference,
+            'created_at': self.created_at.isoformat()
+        }
+
+class WalletCheckpoint(db.Model):
+    """Saldos da carteira após o lançamento `seq`; o replay parte do checkpoint mais próximo"""
+    __tablename__ = 'wallet_checkpoints'
+
+    id = db.Column(db.Integer, primary_key=True)
+    wallet_id = db.Column(db.Integer, db.ForeignKey('wallets.id'), nullable=False)
+    seq = db.Column(db.Integer, nullable=False)
+    balance = db.Column(Money, nullable=False)
+    bonus_balance = db.Column(Money, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('wallet_id', 'seq', name='uq_wallet_checkpoints_wallet_seq'),
+    )
+
+    def __repr__(self):
+        return f'<WalletCheckpoint Wallet:{self.wallet_id} #{self.seq}>'
+
+# O retrato em `wallets` é atualizado pelo próprio INSERT do lançamento
+sqlite_trigger(LedgerEntry.__table__, f"""
+CREATE TRIGGER ledger_entries_apply AFTER INSERT ON ledger_entries
+BEGIN
+    UPDATE wallets SET
+        balance = NEW.balance_after,
+        bonus_balance = NEW.bonus_after,
+        total_deposited = total_deposited + CASE WHEN NEW.entry_type = 'deposit' THEN NEW.balance_delta ELSE 0 END,
+        total_withdrawn = total_withdrawn - CASE WHEN NEW.entry_type = 'withdrawal' THEN NEW.balance_delta ELSE 0 END,
+        ledger_seq = NEW.seq,
+        updated_at = NEW.created_at
+    WHERE id = NEW.wallet_id;
+
+    INSERT INTO wallet_checkpoints (wallet_id, seq, balance, bonus_balance, created_at)
+    SELECT NEW.wallet_id, NEW.seq, NEW.balance_after, NEW.bonus_after, NEW.created_at
+    WHERE NEW.seq %% {CHECKPOINT_INTERVAL} = 0;
+END
+""")
+
+sqlite_trigger(LedgerEntry.__table__, """
+CREATE TRIGGER ledger_entries_no_update BEFORE UPDATE ON ledger_entries
+BEGIN
+    SELECT RAISE(ABORT, 'ledger_entries é somente inserção');
+END
+""")
+
+sqlite_trigger(LedgerEntry.__table__, """
+CREATE TRIGGER ledger_entries_no_delete BEFORE DELETE ON ledger_entries
+BEGIN
+    SELECT RAISE(ABORT, 'ledger_entries é somente inserção');
+END
+""")
+
+class LedgerService:
+    """Lançamentos, replay e conferência do razão das carteiras"""
+
+    @staticmethod
+    def post(wallet_id, entry_type, balance_delta, bonus_delta, condition=None, reference=None):
+        """Acrescenta um lançamento calculado a partir do retrato atual da carteira (sem commit)
+
+        `balance_delta`/`bonus_delta` são expressões SQL sobre `wallets` (ou
+        valores); o INSERT ... SELECT só grava se `condition` valer no momento
+        da escrita. Devolve (seq, balance_after, bonus_after) ou None.
+        """
+        from src.models.wallet import Wallet
+
+        balance_delta = money(balance_delta)
+        bonus_delta = money(bonus_delta)
+
+        source = db.select(
+            Wallet.id,
+            Wallet.ledger_seq + 1,
+            literal(entry_type),
+            literal(CONTRA_ACCOUNTS[entry_type]),
+            balance_delta,
+            bonus_delta,
+            Wallet.balance + balance_delta,
+            Wallet.bonus_balance + bonus_delta,
+            literal(reference, db.String),
+            literal(datetime.utcnow(), db.DateTime)
+        ).where(Wallet.id == wallet_id)
+        if condition is not None:
+            source = source.where(condition)
+
+        table = LedgerEntry.__table__
+        return db.session.execute(
+            table.insert().from_select(
+                ['wallet_id', 'seq', 'entry_type', 'contra_account', 'balance_delta', 'bonus_delta',
+                 'balance_after', 'bonus_after', 'reference', 'created_at'],
+                source
+            ).returning(table.c.seq, table.c.balance_after, table.c.bonus_after)
+        ).first()
+
+    @staticmethod
+    def open_wallets():
+        """Lançamento de abertura para carteiras que ainda não têm razão (criadas antes dele)
+
+        O saldo atual vira o primeiro lançamento; devolve quantas carteiras foram abertas.
+        """
+        from src.models.wallet import Wallet
+
+        table = LedgerEntry.__table__
+        result = db.session.execute(
+            table.insert().from_select(
+                ['wallet_id', 'seq', 'entry_type', 'contra_account', 'balance_delta', 'bonus_delta',
+                 'balance_after', 'bonus_after', 'reference', 'created_at'],
+                db.select(
+                    Wallet.id, literal(1), literal('opening'), literal(CONTRA_ACCOUNTS['opening']),
+                    func.coalesce(Wallet.balance, 0), func.coalesce(Wallet.bonus_balance, 0),
+                    func.coalesce(Wallet.balance, 0), func.coalesce(Wallet.bonus_balance, 0),
+                    literal(None, db.String), literal(datetime.utcnow(), db.DateTime)
+                ).where(Wallet.ledger_seq.is_(None))
+            )
+        )
+        db.session.commit()
+        return result.rowcount
+
+    @staticmethod
+    def balance_at(wallet_id, at=None, seq=None):
+        """Saldos da carteira em um momento (ou após o lançamento `seq`)
+
+        Parte do checkpoint mais próximo anterior e soma só os lançamentos
+        seguintes (no máximo CHECKPOINT_INTERVAL). Devolve (seq, balance, bonus_balance).
+        """
+        checkpoint_filter = [WalletCheckpoint.wallet_id == wallet_id]
+        entry_filter = [LedgerEntry.wallet_id == wallet_id]
+        if at is not None:
+            checkpoint_filter.append(WalletCheckpoint.created_at <= at)
+            entry_filter.append(LedgerEntry.created_at <= at)
+        if seq is not None:
+            checkpoint_filter.append(WalletCheckpoint.seq <= seq)
+            entry_filter.append(LedgerEntry.seq <= seq)
+
+        checkpoint = db.session.execute(
+            db.select(WalletCheckpoint.seq, WalletCheckpoint.balance, WalletCheckpoint.bonus_balance)
+            .where(*checkpoint_filter)
+            .order_by(WalletCheckpoint.seq.desc())
+            .limit(1)
+        ).first()
+        start_seq, balance, bonus_balance = checkpoint or (0, Decimal('0.00'), Decimal('0.00'))
+
+        last_seq, balance_delta, bonus_delta = db.session.execute(
+            db.select(
+                func.max(LedgerEntry.seq),
+                func.coalesce(func.sum(LedgerEntry.balance_delta), 0),
+                func.coalesce(func.sum(LedgerEntry.bonus_delta), 0)
+            ).where(*entry_filter, LedgerEntry.seq > start_seq)
+        ).one()
+
+        return last_seq or start_seq, balance + balance_delta, bonus_balance + bonus_delta
+
+    @staticmethod
+    def verify(wallet):
+        """Confere o retrato da carteira contra o replay do razão; devolve as divergências"""
+        seq, balance, bonus_balance = LedgerService.balance_at(wallet.id)
+
+        problems = []
+        if seq != (wallet.ledger_seq or 0):
+            problems.append(f'seq {wallet.ledger_seq} no retrato, {seq} no razão')
+        if balance != wallet.balance:
+            problems.append(f'saldo {wallet.balance} no retrato, {balance} no razão')
+        if bonus_balance != wallet.bonus_balance:
+            problems.append(f'bônus {wallet.bonus_balance} no retrato, {bonus_balance} no razão')
+        return problems
+
+    @staticmethod
+    def contra_balances():
+        """Saldo de cada conta de contrapartida (o oposto do que foi para as carteiras)"""
+        rows = db.session.execute(
+            db.select(
+                LedgerEntry.contra_account,
+                func.sum(LedgerEntry.balance_delta + LedgerEntry.bonus_delta)
+            ).group_by(LedgerEntry.contra_account)
+        ).all()
+        return {account: round(-float(total), 2) for account, total in rows}
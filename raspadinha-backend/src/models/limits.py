@@ -0,0 +1,338 @@
+from src.models.user import db
+from src.models.money import Money, money, to_decimal
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+KINDS = ('deposit', 'withdrawal', 'loss')
+PERIODS = ('day', 'week', 'month')
+
+KIND_LABELS = {'deposit': 'depósito', 'withdrawal': 'saque', 'loss': 'perda'}
+PERIOD_LABELS = {'day': 'diário', 'week': 'semanal', 'month': 'mensal'}
+
+# Limites iniciais por nível de fidelidade: (tipo, período) -> valor; o que não aparece fica sem limite
+DEFAULT_LIMITS = {
+    'bronze': {('withdrawal', 'day'): 5000},
+    'silver': {('withdrawal', 'day'): 5000},
+    'gold': {('withdrawal', 'day'): 10000},
+    'diamond': {('withdrawal', 'day'): 20000}
+}
+
+class LimitPolicy(db.Model):
+    """Limites de depósito, saque e perda por nível de fidelidade (NULL = sem limite)"""
+    __tablename__ = 'limit_policies'
+
+    loyalty_level = db.Column(db.String(20), primary_key=True)
+    deposit_day = db.Column(Money)
+    deposit_week = db.Column(Money)
+    deposit_month = db.Column(Money)
+    withdrawal_day = db.Column(Money)
+    withdrawal_week = db.Column(Money)
+    withdrawal_month = db.Column(Money)
+    loss_day = db.Column(Money)
+    loss_week = db.Column(Money)
+    loss_month = db.Column(Money)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<LimitPolicy {self.loyalty_level}>'
+
+    def limit(self, kind, period):
+        return getattr(self, f'{kind}_{period}')
+
+    def to_dict(self):
+        return {
+            'loyalty_level': self.loyalty_level,
+            'limits': {
+                kind: {
+                    period: float(self.limit(kind, period)) if self.limit(kind, period) is not None else None
+                    for period in PERIODS
+                }
+                for kind in KINDS
+            },
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+class LimitCounter(db.Model):
+    """Totais do usuário no dia, semana e mês correntes para um tipo de movimento
+
+    Uma linha por (usuário, tipo): a verificação de limite é uma leitura pela
+    chave primária. Cada total vale para o período que começa em `*_start`;
+    quando o período vira, o próximo lançamento recomeça a contagem.
+    """
+    __tablename__ = 'limit_counters'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    kind = db.Column(db.String(20), primary_key=True)  # deposit, withdrawal, loss
+    day_start = db.Column(db.Date, nullable=False)
+    day_total = db.Column(Money, nullable=False, default=Decimal('0.00'))
+    week_start = db.Column(db.Date, nullable=False)  # Segunda-feira
+    week_total = db.Column(Money, nullable=False, default=Decimal('0.00'))
+    month_start = db.Column(db.Date, nullable=False)
+    month_total = db.Column(Money, nullable=False, default=Decimal('0.00'))
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<LimitCounter User:{self.user_id} {self.kind}>'
+
+class LimitService:
+    """Verificação e contagem dos limites de depósito, saque e perda"""
+
+    @staticmethod
+    def period_starts(at=None):
+        """Início do dia, da semana (segunda-feira) e do mês de `at`"""
+        day = (at or datetime.utcnow()).date()
+        return {
+            'day': day,
+            'week': day - timedelta(days=day.weekday()),
+            'month': day.replace(day=1)
+        }
+
+    @staticmethod
+    def seed_policies():
+        """Cria as políticas padrão dos níveis que ainda não têm uma"""
+        existing = {level for (level,) in db.session.query(LimitPolicy.loyalty_level).all()}
+        for level, limits in DEFAULT_LIMITS.items():
+            if level not in existing:
+                db.session.add(LimitPolicy(
+                    loyalty_level=level,
+                    **{f'{kind}_{period}': Decimal(str(value)) for (kind, period), value in limits.items()}
+                ))
+        db.session.commit()
+
+    @staticmethod
+    def update_policy(loyalty_level, limits):
+        """Altera limites de um nível: {tipo: {período: valor ou None}}; o que não vier fica como está"""
+        if loyalty_level not in DEFAULT_LIMITS:
+            raise ValueError('Nível de fidelidade inválido')
+        if not isinstance(limits, dict) or not limits:
+            raise ValueError("Informe 'limits' como {tipo: {período: valor}}")
+
+        changes = {}
+        for kind, periods in limits.items():
+            if kind not in KINDS or not isinstance(periods, dict):
+                raise ValueError(f'Tipo de limite inválido: {kind}')
+            for period, value in periods.items():
+                if period not in PERIODS:
+                    raise ValueError(f'Período inválido: {period}')
+                if value is not None and (not isinstance(value, (int, float)) or isinstance(value, bool) or value <= 0):
+                    raise ValueError('Limite deve ser positivo ou null (sem limite)')
+                changes[f'{kind}_{period}'] = Decimal(str(value)) if value is not None else None
+
+        policy = db.session.get(LimitPolicy, loyalty_level) or LimitPolicy(loyalty_level=loyalty_level)
+        for column, value in changes.items():
+            setattr(policy, column, value)
+        policy.updated_at = datetime.utcnow()
+
+        db.session.add(policy)
+        db.session.commit()
+        return policy
+
+    @staticmethod
+    def policy_for(user):
+        return db.session.get(LimitPolicy, user.loyalty_level or 'bronze')
+
+    @staticmethod
+    def totals(user_id, kind, at=None):
+        """Totais do usuário nos períodos correntes (uma leitura pela chave primária)"""
+        counter = db.session.get(LimitCounter, (user_id, kind))
+        starts = LimitService.period_starts(at)
+
+        return {
+            period: getattr(counter, f'{period}_total')
+            if counter and getattr(counter, f'{period}_start') == starts[period] else Decimal('0.00')
+            for period in PERIODS
+        }
+
+    @staticmethod
+    def status(user):
+        """Limite, usado e disponível de cada tipo e período para o usuário"""
+        policy = LimitService.policy_for(user)
+        result = {}
+
+        for kind in KINDS:
+            totals = LimitService.totals(user.id, kind)
+            result[kind] = {}
+            for period in PERIODS:
+                limit = policy.limit(kind, period) if policy else None
+                result[kind][period] = {
+                    'limit': float(limit) if limit is not None else None,
+                    'used': float(totals[period]),
+                    'remaining': float(max(limit - totals[period], 0)) if limit is not None else None
+                }
+
+        return result
+
+    @staticmethod
+    def reserve(user, kind, amount, at=None):
+        """Soma `amount` aos contadores se nenhum limite do nível for ultrapassado (sem commit)
+
+        Verificação e soma são um único UPSERT condicional, então pedidos
+        simultâneos não passam juntos do limite. Levanta ValueError se exceder.
+        """
+        amount = to_decimal(amount)
+        policy = LimitService.policy_for(user)
+        limits = {
+            period: policy.limit(kind, period) for period in PERIODS
+        } if policy else {}
+        limits = {period: limit for period, limit in limits.items() if limit is not None}
+
+        # Primeiro lançamento do usuário (INSERT): só o próprio valor conta
+        for period, limit in limits.items():
+            if amount > limit:
+                raise LimitService._exceeded(kind, period, limit)
+
+        statement = LimitService._upsert(user.id, kind, amount, at)
+        if limits:
+            statement = statement.on_conflict_do_update(
+                index_elements=['user_id', 'kind'],
+                set_=LimitService._rolled(statement, at),
+                where=db.and_(*[
+                    LimitService._rolled_total(period, amount, at) <= limit for period, limit in limits.items()
+                ])
+            )
+        else:
+            statement = statement.on_conflict_do_update(
+                index_elements=['user_id', 'kind'], set_=LimitService._rolled(statement, at)
+            )
+
+        if db.session.execute(statement.returning(LimitCounter.user_id)).first() is None:
+            # O UPDATE não passou na condição: descobre qual limite para a mensagem
+            totals = LimitService.totals(user.id, kind, at)
+            for period, limit in limits.items():
+                if totals[period] + amount > limit:
+                    raise LimitService._exceeded(kind, period, limit)
+            raise ValueError('Limite excedido')
+
+    @staticmethod
+    def record(user_id, kind, amount, at=None):
+        """Soma `amount` (pode ser negativo) aos contadores sem verificar limites (sem commit)"""
+        statement = LimitService._upsert(user_id, kind, amount, at)
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=['user_id', 'kind'], set_=LimitService._rolled(statement, at)
+        ))
+
+    @staticmethod
+    def release(user_id, kind, amount, reserved_at):
+        """Devolve um valor reservado em `reserved_at` (ex.: saque recusado) aos períodos que ainda o contam"""
+        starts = LimitService.period_starts(reserved_at)
+
+        db.session.execute(
+            db.update(LimitCounter)
+            .where(LimitCounter.user_id == user_id, LimitCounter.kind == kind)
+            .values(**{
+                f'{period}_total': db.case(
+                    (getattr(LimitCounter, f'{period}_start') == starts[period],
+                     getattr(LimitCounter, f'{period}_total') - amount),
+                    else_=getattr(LimitCounter, f'{period}_total')
+                )
+                for period in PERIODS
+            })
+            .execution_options(synchronize_session=False)
+        )
+
+    @staticmethod
+    def rebuild(at=None):
+        """Recalcula todos os contadores dos períodos correntes a partir do extrato e faz commit
+
+        Para depois de correções manuais no extrato (a primeira implantação é
+        preenchida pela migração). Devolve quantos contadores foram gravados.
+        """
+        # Encerra a leitura: a reconstrução começa pelo DELETE, que pega o lock de escrita
+        db.session.commit()
+        counters = LimitService.rebuild_counters(db.session, at)
+        db.session.commit()
+        return counters
+
+    @staticmethod
+    def rebuild_counters(executor, at=None):
+        """Regrava os contadores dos períodos de `at` a partir do extrato (sem commit)
+
+        `executor` é a sessão ou uma conexão. Depósitos e saques contam
+        pendentes, em processamento e concluídos; perda é custo dos jogos menos
+        prêmios. O DELETE vem primeiro e pega o lock de escrita, então nenhuma
+        reserva entra entre a leitura do extrato e a gravação. Devolve quantos
+        contadores foram gravados.
+        """
+        from src.models.transaction import Transaction
+
+        starts = LimitService.period_starts(at)
+        since = datetime.combine(min(starts['week'], starts['month']), datetime.min.time())
+        day = db.func.date(Transaction.created_at)
+
+        signed = db.case(
+            (Transaction.type == 'prize_payout', -Transaction.amount),
+            else_=Transaction.amount
+        )
+        kind = db.case(
+            (Transaction.type.in_(('game_cost', 'prize_payout')), 'loss'),
+            else_=Transaction.type
+        )
+
+        def period_total(period):
+            return db.func.coalesce(db.func.sum(db.case((day >= starts[period].isoformat(), signed), else_=0)), 0)
+
+        executor.execute(db.delete(LimitCounter))
+        rows = executor.execute(
+            db.select(
+                Transaction.user_id, kind.label('kind'),
+                period_total('day'), period_total('week'), period_total('month')
+            ).where(
+                Transaction.created_at >= since,
+                db.or_(
+                    db.and_(Transaction.type.in_(('deposit', 'withdrawal')), Transaction.status.in_(('pending', 'processing', 'completed'))),
+                    db.and_(Transaction.type.in_(('game_cost', 'prize_payout')), Transaction.status == 'completed')
+                )
+            ).group_by(Transaction.user_id, kind)
+        ).all()
+
+        if rows:
+            now = datetime.utcnow()
+            executor.execute(db.insert(LimitCounter), [{
+                'user_id': user_id,
+                'kind': row_kind,
+                'day_start': starts['day'],
+                'day_total': day_total,
+                'week_start': starts['week'],
+                'week_total': week_total,
+                'month_start': starts['month'],
+                'month_total': month_total,
+                'updated_at': now
+            } for user_id, row_kind, day_total, week_total, month_total in rows])
+
+        return len(rows)
+
+    @staticmethod
+    def _upsert(user_id, kind, amount, at):
+        starts = LimitService.period_starts(at)
+        return sqlite_insert(LimitCounter).values(
+            user_id=user_id,
+            kind=kind,
+            day_start=starts['day'], day_total=amount,
+            week_start=starts['week'], week_total=amount,
+            month_start=starts['month'], month_total=amount,
+            updated_at=datetime.utcnow()
+        )
+
+    @staticmethod
+    def _rolled_total(period, amount, at):
+        """Total do período depois de somar `amount`, recomeçando se o período virou"""
+        start = getattr(LimitCounter, f'{period}_start')
+        total = getattr(LimitCounter, f'{period}_total')
+        return db.case(
+            (start == LimitService.period_starts(at)[period], total + amount),
+            else_=money(amount)
+        )
+
+    @staticmethod
+    def _rolled(statement, at):
+        """SET do UPSERT: cada período soma ao total corrente ou recomeça do valor novo"""
+        values = {'updated_at': statement.excluded.updated_at}
+        for period in PERIODS:
+            values[f'{period}_total'] = LimitService._rolled_total(period, statement.excluded.day_total, at)
+            values[f'{period}_start'] = getattr(statement.excluded, f'{period}_start')
+        return values
+
+    @staticmethod
+    def _exceeded(kind, period, limit):
+        return ValueError(f'Limite {PERIOD_LABELS[period]} de {KIND_LABELS[kind]} excedido (R$ {limit:.2f})')
@@ -0,0 +1,701 @@
+from src.models.user import db, User
+from src.models.game import Game, ScratchCard
+from src.models.transaction import Transaction
+from src.models.money import Money
+from src.models.schema import inline, sqlite_trigger
+from datetime import datetime, timedelta
+from decimal import Decimal
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+MINUTE = 'minute'
+HOUR = 'hour'
+DAY = 'day'
+TOTAL = 'total'
+
+# Balde único com o acumulado de todo o histórico
+TOTAL_BUCKET = datetime(1970, 1, 1)
+
+# Formato em que o SQLAlchemy grava DateTime no SQLite: os triggers precisam gerar o mesmo texto
+BUCKET_FORMATS = {
+    MINUTE: '%Y-%m-%d %H:%M:00.000000',
+    HOUR: '%Y-%m-%d %H:00:00.000000',
+    DAY: '%Y-%m-%d 00:00:00.000000'
+}
+
+BUCKET_STEPS = {
+    MINUTE: timedelta(minutes=1),
+    HOUR: timedelta(hours=1),
+    DAY: timedelta(days=1)
+}
+
+# Por quanto tempo os baldes de cada resolução são guardados (None: para sempre).
+# As horas precisam cobrir o primeiro dia do mês do painel (totals_since).
+RETENTION = {
+    MINUTE: timedelta(days=2),
+    HOUR: timedelta(days=90),
+    DAY: None
+}
+
+# Tipo da transação concluída -> coluna do balde
+TRANSACTION_COLUMNS = {
+    'game_cost': 'revenue',
+    'prize_payout': 'prizes',
+    'deposit': 'deposits',
+    'withdrawal': 'withdrawals'
+}
+
+# Período das séries quando a consulta não informa o início
+DEFAULT_SPANS = {
+    MINUTE: timedelta(hours=1),
+    HOUR: timedelta(days=1),
+    DAY: timedelta(days=30)
+}
+
+# Pontos por consulta de série (uma semana por minuto, ~7 meses por hora, ~13 anos por dia)
+MAX_SERIES_POINTS = 10080
+
+COUNT_COLUMNS = ('games', 'new_users')
+# Métricas que se somam entre baldes (o total e os períodos do painel são somas)
+METRIC_COLUMNS = COUNT_COLUMNS + tuple(TRANSACTION_COLUMNS.values())
+# Jogadores distintos no balde: não se soma entre baldes, só é lido balde a balde
+SERIES_COLUMNS = METRIC_COLUMNS + ('active_users',)
+
+class MetricBucket(db.Model):
+    """Totais da plataforma por minuto, hora, dia e de todo o histórico (painel e séries do admin)
+
+    Mantido pelos triggers de `users`, `games` e `transactions`: cada cadastro,
+    jogo ou transação concluída soma no balde do seu minuto, da sua hora, do
+    seu dia e no total. O painel lê algumas dezenas de baldes, qualquer que
+    seja o tamanho do histórico; minutos e horas antigos são apagados pelo
+    MetricsCompactor conforme RETENTION.
+    """
+    __tablename__ = 'metric_buckets'
+
+    granularity = db.Column(db.String(6), primary_key=True)  # minute, hour, day, total
+    bucket = db.Column(db.DateTime, primary_key=True)  # Início do minuto, da hora ou do dia; TOTAL_BUCKET no total
+    games = db.Column(db.Integer, nullable=False, default=0)
+    new_users = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(Money, nullable=False, default=Decimal('0.00'))
+    prizes = db.Column(Money, nullable=False, default=Decimal('0.00'))
+    deposits = db.Column(Money, nullable=False, default=Decimal('0.00'))
+    withdrawals = db.Column(Money, nullable=False, default=Decimal('0.00'))
+    active_users = db.Column(db.Integer, nullable=False, default=0)  # Jogadores distintos (0 no total)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<MetricBucket {self.granularity} {self.bucket}>'
+
+class MetricActiveUser(db.Model):
+    """Quem já jogou em cada balde ainda aberto: é o que permite contar jogadores distintos no trigger
+
+    Uma linha por (resolução, balde, usuário), gravada no primeiro jogo do
+    usuário no balde. Depois que o balde fecha a contagem em
+    MetricBucket.active_users não muda mais, e o MetricsCompactor apaga as
+    linhas: a tabela guarda só os jogadores do minuto, da hora e do dia atuais.
+    """
+    __tablename__ = 'metric_active_users'
+
+    granularity = db.Column(db.String(6), primary_key=True)
+    bucket = db.Column(db.DateTime, primary_key=True)
+    user_id = db.Column(db.Integer, primary_key=True)
+
+    def __repr__(self):
+        return f'<MetricActiveUser {self.granularity} {self.bucket} User:{self.user_id}>'
+
+# Os triggers são criados junto com esta tabela e precisam das tabelas de origem já criadas
+for source in (User, Game, Transaction):
+    MetricBucket.__table__.add_is_dependent_on(source.__table__)
+
+def _bucket_upserts(values, at, user_id=None):
+    """UPSERTs do balde do minuto, da hora, do dia e do total (corpo dos triggers)
+
+    `values`: coluna -> expressão SQL somada; as demais colunas recebem 0.
+    Com `user_id`, conta o usuário em active_users dos baldes em que ele
+    ainda não jogou e o registra em metric_active_users.
+    """
+    columns = ', '.join(SERIES_COLUMNS)
+    # DDL() formata o texto com %: os % do strftime vão dobrados
+    buckets = [
+        (granularity, f"strftime('{fmt.replace('%', '%%')}', {at})") for granularity, fmt in BUCKET_FORMATS.items()
+    ]
+    buckets.append((TOTAL, f"'{TOTAL_BUCKET:%Y-%m-%d %H:%M:%S.%f}'"))
+
+    statements = []
+    for granularity, bucket in buckets:
+        bucket_values = dict(values)
+        if user_id is not None and granularity != TOTAL:
+            bucket_values['active_users'] = f"""NOT EXISTS (
+        SELECT 1 FROM metric_active_users
+        WHERE granularity = '{granularity}' AND bucket = {bucket} AND user_id = {user_id})"""
+        expressions = ', '.join(bucket_values.get(column, '0') for column in SERIES_COLUMNS)
+        updates = ', '.join(f'{column} = {column} + excluded.{column}' for column in bucket_values)
+        statements.append(f"""
+    INSERT INTO metric_buckets (granularity, bucket, {columns}, updated_at)
+    VALUES ('{granularity}', {bucket}, {expressions}, CURRENT_TIMESTAMP)
+    ON CONFLICT (granularity, bucket) DO UPDATE SET {updates}, updated_at = excluded.updated_at;
+    """)
+        if user_id is not None and granularity != TOTAL:
+            statements.append(f"""
+    INSERT OR IGNORE INTO metric_active_users (granularity, bucket, user_id) VALUES ('{granularity}', {bucket}, {user_id});
+    """)
+    return '\n'.join(statements)
+
+def _transaction_upserts(sign):
+    values = {
+        column: f"CASE WHEN NEW.type = '{kind}' THEN {sign}NEW.amount ELSE 0 END"
+        for kind, column in TRANSACTION_COLUMNS.items()
+    }
+    return _bucket_upserts(values, 'COALESCE(NEW.created_at, CURRENT_TIMESTAMP)')
+
+_TRANSACTION_TYPES = ', '.join(f"'{kind}'" for kind in TRANSACTION_COLUMNS)
+
+sqlite_trigger(MetricBucket.__table__, f"""
+CREATE TRIGGER users_metric_buckets_insert AFTER INSERT ON users
+BEGIN
+    {_bucket_upserts({'new_users': '1'}, 'COALESCE(NEW.created_at, CURRENT_TIMESTAMP)')}
+END
+""")
+
+sqlite_trigger(MetricBucket.__table__, f"""
+CREATE TRIGGER games_metric_buckets_insert AFTER INSERT ON games
+BEGIN
+    {_bucket_upserts({'games': '1'}, 'COALESCE(NEW.played_at, CURRENT_TIMESTAMP)', 'NEW.user_id')}
+END
+""")
+
+# Mesmas transições do resumo mensal: conta ao entrar em 'completed' e sai se deixar de ser
+sqlite_trigger(MetricBucket.__table__, f"""
+CREATE TRIGGER transactions_metric_buckets_insert AFTER INSERT ON transactions
+WHEN NEW.status = 'completed' AND NEW.type IN ({_TRANSACTION_TYPES})
+BEGIN
+    {_transaction_upserts('')}
+END
+""")
+
+sqlite_trigger(MetricBucket.__table__, f"""
+CREATE TRIGGER transactions_metric_buckets_completed AFTER UPDATE OF status ON transactions
+WHEN NEW.status = 'completed' AND OLD.status IS NOT 'completed' AND NEW.type IN ({_TRANSACTION_TYPES})
+BEGIN
+    {_transaction_upserts('')}
+END
+""")
+
+sqlite_trigger(MetricBucket.__table__, f"""
+CREATE TRIGGER transactions_metric_buckets_reverted AFTER UPDATE OF status ON transactions
+WHEN OLD.status = 'completed' AND NEW.status IS NOT 'completed' AND NEW.type IN ({_TRANSACTION_TYPES})
+BEGIN
+    {_transaction_upserts('-')}
+END
+""")
+
+class CategoryPrizeCounter(db.Model):
+    """Jogos, receita e prêmios de cada categoria por valor de prêmio (faixa), em todo o histórico
+
+    Uma linha por (categoria, prêmio): a linha de prêmio 0 conta as
+    raspadinhas perdedoras. Mantido pelo trigger de `games`, na mesma
+    transação da jogada; a listagem de categorias do admin lê só estas linhas
+    (categorias x faixas), sem passar pelos jogos.
+    """
+    __tablename__ = 'category_prize_counters'
+
+    category_id = db.Column(db.Integer, db.ForeignKey('scratch_card_categories.id'), primary_key=True)
+    prize = db.Column(Money, primary_key=True)  # Valor do prêmio, já com multiplicador
+    games = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(Money, nullable=False, default=Decimal('0.00'))  # Soma de amount_paid
+    prizes = db.Column(Money, nullable=False, default=Decimal('0.00'))
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<CategoryPrizeCounter Category:{self.category_id} {self.prize}>'
+
+for source in (Game, ScratchCard):
+    CategoryPrizeCounter.__table__.add_is_dependent_on(source.__table__)
+
+sqlite_trigger(CategoryPrizeCounter.__table__, """
+CREATE TRIGGER games_category_prize_counters_insert AFTER INSERT ON games
+BEGIN
+    INSERT INTO category_prize_counters (category_id, prize, games, revenue, prizes, updated_at)
+    SELECT category_id, COALESCE(NEW.prize_won, 0), 1, NEW.amount_paid, COALESCE(NEW.prize_won, 0), CURRENT_TIMESTAMP
+    FROM scratch_cards WHERE id = NEW.scratch_card_id
+    ON CONFLICT (category_id, prize) DO UPDATE SET
+        games = games + 1,
+        revenue = revenue + excluded.revenue,
+        prizes = prizes + excluded.prizes,
+        updated_at = excluded.updated_at;
+END
+""")
+
+def start_of_day(at):
+    return datetime.combine(at.date(), datetime.min.time())
+
+def start_of_hour(at):
+    return at.replace(minute=0, second=0, microsecond=0)
+
+def start_of_bucket(at, granularity):
+    """Início do balde de `granularity` que contém `at`"""
+    if granularity == MINUTE:
+        return at.replace(second=0, microsecond=0)
+    if granularity == HOUR:
+        return start_of_hour(at)
+    return start_of_day(at)
+
+class MetricsService:
+    """Painel e categorias do admin a partir dos contadores agregados, e reconstrução dos contadores"""
+
+    # Painel montado por último neste processo: (expira em, painel)
+    _dashboard = None
+    _dashboard_lock = threading.Lock()
+
+    @staticmethod
+    def _sums(*conditions):
+        """Soma das métricas dos baldes que atendem às condições: coluna -> valor"""
+        row = db.session.execute(
+            db.select(*[db.func.coalesce(db.func.sum(getattr(MetricBucket, column)), 0) for column in METRIC_COLUMNS])
+            .where(*conditions)
+        ).one()
+        return dict(zip(METRIC_COLUMNS, row))
+
+    @staticmethod
+    def totals_between(granularity, start, end):
+        """Métricas somadas dos baldes de `granularity` em [start, end)"""
+        return MetricsService._sums(
+            MetricBucket.granularity == granularity,
+            MetricBucket.bucket >= start,
+            MetricBucket.bucket < end
+        )
+
+    @staticmethod
+    def totals_since(start):
+        """Métricas de `start` (arredondado para a hora) até agora
+
+        Horas só até o fim do primeiro dia; os dias seguintes vêm dos baldes
+        diários, então um mês custa no máximo 24 + 31 baldes.
+        """
+        start = start_of_hour(start)
+        next_day = start_of_day(start) + timedelta(days=1)
+        hours = MetricsService.totals_between(HOUR, start, next_day)
+        days = MetricsService._sums(MetricBucket.granularity == DAY, MetricBucket.bucket >= next_day)
+        return {column: hours[column] + days[column] for column in METRIC_COLUMNS}
+
+    @staticmethod
+    def totals():
+        """Métricas de todo o histórico"""
+        return MetricsService._sums(MetricBucket.granularity == TOTAL, MetricBucket.bucket == TOTAL_BUCKET)
+
+    @staticmethod
+    def series(granularity, start, end, metrics=SERIES_COLUMNS, now=None):
+        """Série de `granularity` em [start, end): um ponto por balde, com zero nos baldes sem movimento
+
+        `start` é arredondado para o início do seu balde e `end` para o início
+        do balde seguinte. Lê só os baldes do intervalo pela chave primária.
+        """
+        if granularity not in BUCKET_FORMATS:
+            raise ValueError(f"Granularidade inválida: use {', '.join(BUCKET_FORMATS)}")
+        invalid = [metric for metric in metrics if metric not in SERIES_COLUMNS]
+        if invalid or not metrics:
+            raise ValueError(f"Métrica inválida: use {', '.join(SERIES_COLUMNS)}")
+
+        now = now or datetime.utcnow()
+        step = BUCKET_STEPS[granularity]
+        start = start_of_bucket(start, granularity)
+        end = start_of_bucket(end, granularity) + (step if end != start_of_bucket(end, granularity) else timedelta(0))
+        if end <= start:
+            raise ValueError('O fim do período precisa ser depois do início')
+        retention = RETENTION[granularity]
+        if retention is not None and start < start_of_bucket(now - retention, granularity):
+            raise ValueError(f'Baldes por {granularity} só ficam guardados por {retention.days} dias')
+
+        if (end - start) // step > MAX_SERIES_POINTS:
+            raise ValueError(f'Período longo demais para a granularidade {granularity}: máximo de {MAX_SERIES_POINTS} pontos')
+
+        rows = {
+            row.bucket: row
+            for row in db.session.execute(
+                db.select(MetricBucket.bucket, *[getattr(MetricBucket, metric) for metric in metrics])
+                .where(
+                    MetricBucket.granularity == granularity,
+                    MetricBucket.bucket >= start,
+                    MetricBucket.bucket < end
+                )
+            )
+        }
+
+        points = []
+        bucket = start
+        while bucket < end:
+            row = rows.get(bucket)
+            point = {'bucket': bucket.isoformat()}
+            for metric in metrics:
+                value = getattr(row, metric) if row is not None else 0
+                point[metric] = float(value) if metric in TRANSACTION_COLUMNS.values() else value
+            points.append(point)
+            bucket += step
+        return points
+
+    @staticmethod
+    def build_dashboard(now=None):
+        """Painel principal: usuários, jogos, receita, prêmios e movimentação financeira"""
+
+        now = now or datetime.utcnow()
+        today = start_of_day(now)
+        tomorrow = today + timedelta(days=1)
+        yesterday = today - timedelta(days=1)
+
+        total = MetricsService.totals()
+        day = MetricsService.totals_between(DAY, today, tomorrow)
+        previous_day = MetricsService.totals_between(DAY, yesterday, today)
+        # Últimos 30 dias
+        month = MetricsService.totals_since(now - timedelta(days=30))
+
+        # Estados atuais (não são eventos): contagens pelos índices de status
+        total_users = User.query.filter_by(status='active').count()
+        pending_withdrawals = Transaction.query.filter(
+            Transaction.type == inline('withdrawal'),
+            Transaction.status.in_(('pending', 'processing'))
+        ).count()
+
+        total_revenue = total['revenue']
+        total_prizes = total['prizes']
+        profit_margin = ((float(total_revenue) - float(total_prizes)) / float(total_revenue) * 100) if total_revenue > 0 else 0
+        games_today = day['games']
+        games_yesterday = previous_day['games']
+
+        return {
+            'users': {
+                'total': total_users,
+                'new_today': day['new_users'],
+                'new_month': month['new_users']
+            },
+            'games': {
+                'total': total['games'],
+                'today': games_today,
+                'yesterday': games_yesterday,
+                'growth': ((games_today - games_yesterday) / games_yesterday * 100) if games_yesterday > 0 else 0
+            },
+            'revenue': {
+                'total': float(total_revenue),
+                'today': float(day['revenue']),
+                'month': float(month['revenue'])
+            },
+            'prizes': {
+                'total': float(total_prizes),
+                'today': float(day['prizes'])
+            },
+            'profit_margin': round(profit_margin, 2),
+            'financial': {
+                'total_deposits': float(total['deposits']),
+                'total_withdrawals': float(total['withdrawals']),
+                'pending_withdrawals': pending_withdrawals
+            },
+            'generated_at': now.isoformat()
+        }
+
+    @classmethod
+    def dashboard(cls, ttl=30, refresh=False):
+        """Painel com cache de `ttl` segundos por processo (`refresh` ignora o cache)"""
+        cached = cls._dashboard
+        if cached is not None and not refresh and cached[0] > time.monotonic():
+            return cached[1]
+
+        dashboard = cls.build_dashboard()
+        with cls._dashboard_lock:
+            cls._dashboard = (time.monotonic() + ttl, dashboard)
+        return dashboard
+
+    @classmethod
+    def reset_cache(cls):
+        with cls._dashboard_lock:
+            cls._dashboard = None
+
+    @staticmethod
+    def category_stats():
+        """Totais por categoria com o RTP observado por faixa de prêmio: category_id -> estatísticas"""
+        stats = {}
+        for counter in CategoryPrizeCounter.query.order_by(CategoryPrizeCounter.category_id, CategoryPrizeCounter.prize):
+            category = stats.setdefault(counter.category_id, {
+                'total_games': 0, 'total_winners': 0, 'total_revenue': Decimal('0.00'),
+                'total_prizes': Decimal('0.00'), 'tiers': []
+            })
+            category['total_games'] += counter.games
+            category['total_revenue'] += counter.revenue
+            category['total_prizes'] += counter.prizes
+            if counter.prize > 0:
+                category['total_winners'] += counter.games
+                category['tiers'].append(counter)
+
+        for category in stats.values():
+            revenue = float(category['total_revenue'])
+            games = category['total_games']
+            category['tiers'] = [
+                {
+                    'prize': float(counter.prize),
+                    'winners': counter.games,
+                    'frequency': counter.games / games if games else 0,
+                    'total_prizes': float(counter.prizes),
+                    'rtp': float(counter.prizes) / revenue if revenue > 0 else 0
+                }
+                for counter in category['tiers']
+            ]
+        return stats
+
+    @staticmethod
+    def rebuild_category_counters(executor):
+        """Recalcula os contadores por categoria e prêmio a partir dos jogos; devolve as linhas gravadas
+
+        Uma passada por todos os jogos, em uma única transação de escrita (o
+        DELETE pega o lock primeiro, como na reconstrução dos baldes).
+        """
+        prize = db.func.coalesce(Game.prize_won, 0)
+        executor.execute(db.delete(CategoryPrizeCounter))
+        return executor.execute(
+            db.insert(CategoryPrizeCounter).from_select(
+                ['category_id', 'prize', 'games', 'revenue', 'prizes', 'updated_at'],
+                db.select(
+                    ScratchCard.category_id, prize, db.func.count(), db.func.sum(Game.amount_paid), db.func.sum(prize),
+                    db.literal(datetime.utcnow(), db.DateTime)
+                )
+                .join(Game.scratch_card)
+                .group_by(ScratchCard.category_id, prize)
+            )
+        ).rowcount
+
+    @staticmethod
+    def first_day(executor):
+        """Dia do evento mais antigo (cadastro, jogo ou transação), ou None sem dados"""
+
+        firsts = [
+            executor.execute(db.select(db.func.min(column))).scalar()
+            for column in (User.created_at, Game.played_at, Transaction.created_at)
+        ]
+        firsts = [first for first in firsts if first is not None]
+        return start_of_day(min(firsts)) if firsts else None
+
+    @staticmethod
+    def compact(executor, now=None):
+        """Apaga os baldes além da retenção e a presença de jogadores dos baldes já fechados
+
+        Um DELETE por faixa da chave primária em cada resolução. Devolve
+        {resolução: baldes apagados}.
+        """
+        now = now or datetime.utcnow()
+        deleted = {}
+        for granularity in BUCKET_FORMATS:
+            executor.execute(
+                db.delete(MetricActiveUser).where(
+                    MetricActiveUser.granularity == granularity,
+                    MetricActiveUser.bucket < start_of_bucket(now, granularity)
+                )
+            )
+            retention = RETENTION[granularity]
+            if retention is not None:
+                deleted[granularity] = executor.execute(
+                    db.delete(MetricBucket).where(
+                        MetricBucket.granularity == granularity,
+                        MetricBucket.bucket < start_of_bucket(now - retention, granularity)
+                    )
+                ).rowcount
+        return deleted
+
+    @staticmethod
+    def rebuild_range(executor, start=None, end=None, now=None):
+        """Recalcula os baldes de [start, end) de cada resolução e o total a partir das tabelas de origem
+
+        `start` e `end` são inícios de dia (None: sem limite). `executor` é a
+        sessão ou uma conexão. O DELETE vem primeiro: ele pega o lock de
+        escrita, então as somas já enxergam tudo o que foi gravado antes e
+        nenhum trigger grava no intervalo até o commit. Minutos e horas só são
+        refeitos dentro da retenção. Devolve os baldes gravados.
+        """
+        now = now or datetime.utcnow()
+        written = 0
+        for granularity in BUCKET_FORMATS:
+            low = start
+            if RETENTION[granularity] is not None:
+                oldest = start_of_bucket(now - RETENTION[granularity], granularity)
+                low = max(start, oldest) if start is not None else oldest
+            written += MetricsService._rebuild_granularity(executor, granularity, low, end, now)
+
+        # Total a partir dos dias
+        executor.execute(db.delete(MetricBucket).where(MetricBucket.granularity == TOTAL))
+        executor.execute(
+            db.insert(MetricBucket).from_select(
+                ['granularity', 'bucket', *METRIC_COLUMNS, 'updated_at'],
+                db.select(
+                    db.literal(TOTAL), db.literal(TOTAL_BUCKET, db.DateTime),
+                    *[db.func.coalesce(db.func.sum(getattr(MetricBucket, column)), 0) for column in METRIC_COLUMNS],
+                    db.literal(now, db.DateTime)
+                )
+                .where(MetricBucket.granularity == DAY)
+            )
+        )
+
+        return written
+
+    @staticmethod
+    def _rebuild_granularity(executor, granularity, start, end, now):
+        """Recalcula os baldes de uma resolução em [start, end) e a presença de jogadores do balde aberto"""
+
+        def in_range(column):
+            conditions = []
+            if start is not None:
+                conditions.append(column >= start)
+            if end is not None:
+                conditions.append(column < end)
+            return conditions
+
+        executor.execute(
+            db.delete(MetricBucket).where(MetricBucket.granularity == granularity, *in_range(MetricBucket.bucket))
+        )
+        executor.execute(
+            db.delete(MetricActiveUser).where(MetricActiveUser.granularity == granularity, *in_range(MetricActiveUser.bucket))
+        )
+        if start is not None and end is not None and start >= end:
+            return 0
+
+        buckets = {}
+
+        def add(rows):
+            for bucket, *values in rows:
+                row = buckets.setdefault(bucket, dict.fromkeys(SERIES_COLUMNS, 0))
+                for column, value in zip(columns, values):
+                    row[column] += value
+
+        def bucket_of(column):
+            return db.func.strftime(BUCKET_FORMATS[granularity], column)
+
+        columns = ('new_users',)
+        bucket = bucket_of(User.created_at)
+        add(executor.execute(
+            db.select(bucket, db.func.count()).where(*in_range(User.created_at)).group_by(bucket)
+        ))
+
+        columns = ('games', 'active_users')
+        bucket = bucket_of(Game.played_at)
+        add(executor.execute(
+            db.select(bucket, db.func.count(), db.func.count(db.distinct(Game.user_id)))
+            .where(*in_range(Game.played_at))
+            .group_by(bucket)
+        ))
+
+        columns = tuple(TRANSACTION_COLUMNS.values())
+        bucket = bucket_of(Transaction.created_at)
+        add(executor.execute(
+            db.select(bucket, *[
+                db.func.coalesce(db.func.sum(db.case((Transaction.type == kind, Transaction.amount), else_=0)), 0)
+                for kind in TRANSACTION_COLUMNS
+            ])
+            .where(
+                *in_range(Transaction.created_at),
+                Transaction.status == 'completed',
+                Transaction.type.in_(TRANSACTION_COLUMNS)
+            )
+            .group_by(bucket)
+        ))
+
+        if buckets:
+            executor.execute(db.insert(MetricBucket), [
+                {'granularity': granularity, 'bucket': datetime.fromisoformat(bucket), 'updated_at': now, **values}
+                for bucket, values in buckets.items()
+            ])
+
+        # Jogadores do balde aberto, para o trigger continuar a contagem sem repetir ninguém
+        current = start_of_bucket(now, granularity)
+        if end is None or end > current:
+            start = current if start is None else max(start, current)
+            bucket = bucket_of(Game.played_at)
+            executor.execute(
+                db.insert(MetricActiveUser).from_select(
+                    ['granularity', 'bucket', 'user_id'],
+                    db.select(db.literal(granularity), bucket, Game.user_id)
+                    .where(*in_range(Game.played_at))
+                    .group_by(bucket, Game.user_id)
+                )
+            )
+
+        return len(buckets)
+
+    @staticmethod
+    def rebuild(since=None, chunk_days=7, report=None):
+        """Reconstrói os baldes desde `since` (padrão: o primeiro evento), em lotes de `chunk_days` dias
+
+        Cada lote é uma transação de escrita, então pode rodar com a aplicação
+        no ar e ser executado de novo a qualquer momento. Devolve (dias, baldes gravados).
+        """
+        start = start_of_day(since) if since else MetricsService.first_day(db.session)
+        # Cada lote começa pelo DELETE, sem uma leitura anterior aberta na mesma transação
+        db.session.commit()
+        if start is None:
+            return 0, 0
+
+        end_of_today = start_of_day(datetime.utcnow()) + timedelta(days=1)
+        days = 0
+        written = 0
+
+        while start < end_of_today:
+            end = min(start + timedelta(days=chunk_days), end_of_today)
+            # O último lote vai até o fim dos tempos: pega também o que chegar com data futura
+            written += MetricsService.rebuild_range(db.session, start, end if end < end_of_today else None)
+            db.session.commit()
+
+            days += (end - start).days
+            start = end
+            if report:
+                report(days, written, start)
+
+        return days, written
+
+class MetricsCompactor(threading.Thread):
+    """Thread em background que aplica a retenção dos baldes e limpa a presença dos baldes fechados"""
+
+    def __init__(self, app, interval=60):
+        super().__init__(name='metrics-compactor', daemon=True)
+        self.app = app
+        self.interval = interval
+
+        self.buckets_deleted = 0
+        self.last_run_at = None
+        self.last_error = None
+        self._stop_event = threading.Event()
+
+    @classmethod
+    def from_config(cls, app):
+        return cls(app, interval=app.config['METRICS_COMPACTION_INTERVAL'])
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                with self.app.app_context():
+                    self.compact_once()
+                self.last_error = None
+            except Exception as e:
+                db.session.rollback()
+                self.last_error = str(e)
+                logger.exception('Erro ao compactar os baldes de métricas')
+
+            self._stop_event.wait(self.interval)
+
+    def compact_once(self):
+        deleted = MetricsService.compact(db.session)
+        db.session.commit()
+        self.buckets_deleted += sum(deleted.values())
+        self.last_run_at = datetime.utcnow()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def to_dict(self):
+        return {
+            'running': self.is_alive(),
+            'interval': self.interval,
+            'retention_days': {
+                granularity: retention.days if retention is not None else None
+                for granularity, retention in RETENTION.items()
+            },
+            'buckets_deleted': self.buckets_deleted,
+            'last_run_at': self.last_run_at.isoformat() if self.last_run_at else None,
+            'last_error': self.last_error
+        }
@@ -0,0 +1,40 @@
+from sqlalchemy import literal
+from sqlalchemy.sql.expression import ClauseElement
+from sqlalchemy.types import Integer, TypeDecorator
+from decimal import Decimal, ROUND_HALF_UP
+
+def to_cents(value):
+    """Valor em reais (Decimal, int, float ou str) -> centavos inteiros"""
+    if isinstance(value, int):
+        return value * 100
+    if not isinstance(value, Decimal):
+        value = Decimal(str(value))
+    return int((value * 100).to_integral_value(ROUND_HALF_UP))
+
+def from_cents(cents):
+    """Centavos inteiros -> Decimal em reais com duas casas"""
+    return Decimal(cents).scaleb(-2)
+
+def to_decimal(value):
+    """Valor em reais como Decimal com duas casas (Decimal passa direto, sem conversão)"""
+    return value if isinstance(value, Decimal) else from_cents(to_cents(value))
+
+class Money(TypeDecorator):
+    """Valor monetário gravado como centavos inteiros (INTEGER no SQLite)
+
+    No Python continua Decimal com duas casas, então o código e o JSON não
+    mudam; no banco a aritmética (saldos, somas, triggers) é inteira e exata,
+    sem o REAL que o SQLite usa para NUMERIC.
+    """
+    impl = Integer
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return None if value is None else to_cents(value)
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else from_cents(value)
+
+def money(value):
+    """Valor em reais como expressão SQL em centavos (expressões SQL passam direto)"""
+    return value if isinstance(value, ClauseElement) else literal(value, Money)
@@ -0,0 +1,91 @@
+from src.models.user import db
+from datetime import datetime, timezone
+import base64
+import binascii
+import json
+
+DEFAULT_PER_PAGE = 20
+MAX_PER_PAGE = 100
+
+def encode_cursor(timestamp, row_id):
+    """Cursor opaco (base64 de JSON) com a chave do último item da página"""
+    payload = json.dumps([timestamp.isoformat(), row_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """Cursor -> (data, id); ValueError se o cursor não for um dos nossos"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        timestamp, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError):
+        raise ValueError('Cursor de paginação inválido')
+
+def parse_utc(value):
+    """Data ISO 8601 -> datetime UTC sem fuso, como as datas são gravadas no banco
+
+    Com fuso (`Z`, `-03:00`...) é convertida para UTC; sem fuso já é UTC.
+    ValueError se não for uma data.
+    """
+    try:
+        parsed = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ValueError('Data inválida')
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def page_size(per_page, default=DEFAULT_PER_PAGE):
+    """Tamanho de página pedido, limitado a 1..MAX_PER_PAGE"""
+    if per_page is None:
+        return default
+    return max(1, min(per_page, MAX_PER_PAGE))
+
+class KeysetPage:
+    """Página de uma listagem paginada por chave (data, id), do mais recente para o mais antigo"""
+
+    def __init__(self, items, per_page, next_cursor, total=None):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.total = total
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def to_dict(self):
+        pagination = {
+            'per_page': self.per_page,
+            'has_next': self.has_next,
+            'next_cursor': self.next_cursor
+        }
+        if self.total is not None:
+            pagination['total'] = self.total
+        return pagination
+
+def keyset_paginate(query, timestamp_column, id_column, cursor=None, per_page=None, with_total=False):
+    """Pagina `query` por (timestamp_column, id_column) decrescente, sem OFFSET
+
+    A próxima página começa logo depois da chave do cursor, então com um
+    índice terminando em (data, id) toda página custa o mesmo, por mais funda
+    que seja. O total exige um COUNT(*) sobre o filtro inteiro e só é
+    calculado quando pedido (`with_total`).
+    """
+    per_page = page_size(per_page)
+    total = query.order_by(None).count() if with_total else None
+
+    if cursor:
+        timestamp, row_id = decode_cursor(cursor)
+        query = query.filter(db.tuple_(timestamp_column, id_column) < db.tuple_(timestamp, row_id))
+
+    # Um item a mais só para saber se existe próxima página
+    rows = query.order_by(timestamp_column.desc(), id_column.desc()).limit(per_page + 1).all()
+    items = rows[:per_page]
+
+    next_cursor = None
+    if len(rows) > per_page:
+        last = items[-1]
+        next_cursor = encode_cursor(getattr(last, timestamp_column.key), getattr(last, id_column.key))
+
+    return KeysetPage(items, per_page, next_cursor, total)
@@ -0,0 +1,345 @@
+from src.models.user import db
+from src.models.transaction import Transaction
+from src.models.limits import LimitService
+from src.models.schema import inline
+from sqlalchemy import func
+from datetime import datetime, timedelta
+import importlib
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+class PayoutGateway:
+    """Interface do gateway que executa os pagamentos PIX dos saques
+
+    `submit` recebe um lote de dicts {'transaction_id', 'amount', 'pix_key',
+    'idempotency_key'} e devolve, na mesma ordem, {'status': 'paid' ou
+    'failed', 'reference', 'error'}. O mesmo `idempotency_key` enviado de novo
+    (worker que caiu no meio) precisa devolver o resultado anterior sem pagar
+    duas vezes.
+    """
+
+    name = None
+
+    def submit(self, payouts):
+        raise NotImplementedError
+
+class FakePayoutGateway(PayoutGateway):
+    """Gateway local para desenvolvimento e testes de carga: aprova tudo após `latency` segundos por lote
+
+    `failure_rate` recusa uma fração aleatória dos pagamentos (chave PIX
+    inválida, por exemplo) para exercitar o estorno.
+    """
+
+    name = 'fake'
+
+    def __init__(self, latency=0.05, failure_rate=0.0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self._results = {}  # idempotency_key -> resultado já devolvido
+        self._lock = threading.Lock()
+
+    def submit(self, payouts):
+        time.sleep(self.latency)  # Uma chamada HTTP por lote
+
+        results = []
+        with self._lock:
+            for payout in payouts:
+                result = self._results.get(payout['idempotency_key'])
+                if result is None:
+                    if random.random() < self.failure_rate:
+                        result = {'status': 'failed', 'reference': None, 'error': 'Pagamento recusado pelo gateway'}
+                    else:
+                        result = {'status': 'paid', 'reference': f'fake-{uuid.uuid4().hex}', 'error': None}
+                    self._results[payout['idempotency_key']] = result
+                results.append(result)
+        return results
+
+# Nome em PAYOUT_GATEWAY -> classe; outros gateways podem ser indicados como 'pacote.modulo:Classe'
+GATEWAYS = {
+    FakePayoutGateway.name: FakePayoutGateway
+}
+
+def load_gateway(name, **options):
+    """Instancia o gateway registrado como `name` ou importado de 'pacote.modulo:Classe'"""
+    if name in GATEWAYS:
+        return GATEWAYS[name](**options)
+    if ':' not in name:
+        raise ValueError(f'Gateway de pagamento desconhecido: {name}')
+
+    module_name, class_name = name.split(':', 1)
+    return getattr(importlib.import_module(module_name), class_name)(**options)
+
+class PayoutService:
+    """Saques em lote: reserva, débito, envio ao gateway e baixa"""
+
+    @staticmethod
+    def claim_batch(worker_id, batch_size=100, visibility_timeout=300):
+        """Reserva até `batch_size` saques pendentes e debita as carteiras em uma única transação
+
+        Saques `processing` cujo prazo venceu (worker caiu depois de debitar)
+        voltam no lote sem novo débito, para serem reenviados ao gateway com a
+        mesma chave de idempotência. Saque sem saldo vira failed e devolve o
+        limite. Faz commit; devolve os pagamentos a enviar.
+        """
+        from src.models.wallet import Wallet
+
+        now = datetime.utcnow()
+        locked_until = now + timedelta(seconds=visibility_timeout)
+
+        # type literal: a fila sai do índice parcial dos saques (ix_transactions_withdrawals)
+        ready = db.select(Transaction.id).where(
+            Transaction.type == inline('withdrawal'),
+            Transaction.status.in_(('pending', 'processing')),
+            db.or_(Transaction.status == 'pending', Transaction.locked_until < now)
+        ).order_by(Transaction.id).limit(batch_size)
+
+        rows = db.session.execute(
+            db.update(Transaction)
+            .where(Transaction.id.in_(ready))
+            .values(status='processing', locked_by=worker_id, locked_until=locked_until)
+            .returning(
+                Transaction.id, Transaction.user_id, Transaction.amount, Transaction.created_at,
+                Transaction.extra_data, Transaction.processed_at
+            )
+            .execution_options(synchronize_session=False)
+        ).all()
+
+        wallets = {
+            wallet.user_id: wallet
+            for wallet in Wallet.query.filter(Wallet.user_id.in_({row.user_id for row in rows})).all()
+        } if rows else {}
+
+        payouts = []
+        for row in sorted(rows, key=lambda row: row.id):
+            # processed_at marca o débito já feito: retomada de um lote interrompido
+            if row.processed_at is None:
+                wallet = wallets.get(row.user_id)
+                try:
+                    if not wallet:
+                        raise ValueError("Carteira não encontrada")
+                    wallet.subtract_balance(
+                        row.amount, use_bonus_first=False, entry_type='withdrawal', reference=f'transaction:{row.id}'
+                    )
+                except ValueError as e:
+                    PayoutService._fail(row, str(e))
+                    continue
+
+            payouts.append({
+                'transaction_id': row.id,
+                'amount': row.amount,
+                'pix_key': (row.extra_data or {}).get('pix_key'),
+                'idempotency_key': f'withdrawal:{row.id}'
+            })
+
+        if payouts:
+            db.session.execute(
+                db.update(Transaction)
+                .where(Transaction.id.in_([payout['transaction_id'] for payout in payouts]), Transaction.processed_at.is_(None))
+                .values(processed_at=now)
+                .execution_options(synchronize_session=False)
+            )
+        db.session.commit()
+        return payouts
+
+    @staticmethod
+    def settle(worker_id, payouts, results):
+        """Grava o resultado do gateway: paid conclui o saque, failed estorna a carteira (faz commit)
+
+        Só altera saques ainda reservados por este worker; devolve (pagos, recusados).
+        """
+        from src.models.wallet import Wallet
+
+        paid = []
+        failed = []
+        for payout, result in zip(payouts, results):
+            (paid if result.get('status') == 'paid' else failed).append((payout, result))
+
+        now = datetime.utcnow()
+        completed = 0
+        if paid:
+            table = Transaction.__table__
+            completed = db.session.execute(
+                table.update()
+                .where(
+                    table.c.id == db.bindparam('transaction_id'),
+                    table.c.status == 'processing',
+                    table.c.locked_by == worker_id
+                )
+                .values(
+                    status='completed', processed_at=now, locked_by=None, locked_until=None,
+                    external_transaction_id=db.bindparam('reference')
+                ),
+                [{'transaction_id': payout['transaction_id'], 'reference': result.get('reference')} for payout, result in paid]
+            ).rowcount
+
+        refused = 0
+        for payout, result in failed:
+            row = db.session.execute(
+                db.update(Transaction)
+                .where(
+                    Transaction.id == payout['transaction_id'],
+                    Transaction.status == 'processing',
+                    Transaction.locked_by == worker_id
+                )
+                .values(locked_by=None, locked_until=None)
+                .returning(Transaction.id, Transaction.user_id, Transaction.amount, Transaction.created_at, Transaction.extra_data)
+                .execution_options(synchronize_session=False)
+            ).first()
+            if row is None:
+                continue
+
+            # Estorno: lançamento de saque com valor positivo (desconta de total_withdrawn)
+            wallet = Wallet.query.filter_by(user_id=row.user_id).first()
+            wallet.add_balance(row.amount, entry_type='withdrawal', reference=f'transaction:{row.id}')
+            PayoutService._fail(row, result.get('error') or 'Pagamento recusado pelo gateway')
+            refused += 1
+
+        db.session.commit()
+        return completed, refused
+
+    @staticmethod
+    def _fail(row, reason):
+        """Marca o saque como falho e devolve o valor ao limite de saque (sem commit)"""
+        db.session.execute(
+            db.update(Transaction)
+            .where(Transaction.id == row.id)
+            .values(
+                status='failed', processed_at=datetime.utcnow(), locked_by=None, locked_until=None,
+                extra_data={**(row.extra_data or {}), 'failure_reason': reason}
+            )
+            .execution_options(synchronize_session=False)
+        )
+        LimitService.release(row.user_id, 'withdrawal', row.amount, row.created_at)
+
+    @staticmethod
+    def run_batch(gateway, worker_id, batch_size=100, visibility_timeout=300):
+        """Um ciclo completo: reserva e debita, envia ao gateway e dá baixa
+
+        Devolve {'claimed', 'paid', 'failed', 'gateway_ms'}. Se o gateway
+        falhar, os saques ficam processing e voltam após o prazo de visibilidade.
+        """
+        payouts = PayoutService.claim_batch(worker_id, batch_size, visibility_timeout)
+        if not payouts:
+            return {'claimed': 0, 'paid': 0, 'failed': 0, 'gateway_ms': 0}
+
+        started_at = time.perf_counter()
+        results = gateway.submit(payouts)
+        gateway_ms = (time.perf_counter() - started_at) * 1000
+
+        paid, failed = PayoutService.settle(worker_id, payouts, results)
+        return {'claimed': len(payouts), 'paid': paid, 'failed': failed, 'gateway_ms': gateway_ms}
+
+    @staticmethod
+    def stats(window=timedelta(hours=1)):
+        """Fila de saques por estado, vazão e latência (pedido até pagamento) dos saques recentes"""
+        now = datetime.utcnow()
+
+        by_status = dict(db.session.query(Transaction.status, func.count(Transaction.id)).filter(
+            Transaction.type == inline('withdrawal'), Transaction.status.in_(('pending', 'processing'))
+        ).group_by(Transaction.status).all())
+        oldest_pending = db.session.query(func.min(Transaction.created_at)).filter(
+            Transaction.type == inline('withdrawal'), Transaction.status == 'pending'
+        ).scalar()
+
+        latency = func.julianday(Transaction.processed_at) - func.julianday(Transaction.created_at)
+        count, average, maximum = db.session.query(
+            func.count(Transaction.id), func.avg(latency), func.max(latency)
+        ).filter(
+            Transaction.type == inline('withdrawal'), Transaction.status == 'completed', Transaction.processed_at >= now - window
+        ).one()
+
+        return {
+            'pending': by_status.get('pending', 0),
+            'processing': by_status.get('processing', 0),
+            'oldest_pending_seconds': round((now - oldest_pending).total_seconds(), 3) if oldest_pending else 0,
+            'paid_last_window': count,
+            'paid_per_minute': round(count / (window.total_seconds() / 60), 2),
+            'avg_latency_seconds': round(average * 86400, 3) if average is not None else None,
+            'max_latency_seconds': round(maximum * 86400, 3) if maximum is not None else None
+        }
+
+class PayoutWorker(threading.Thread):
+    """Thread em background que drena os saques pendentes em lotes (uma por processo)"""
+
+    def __init__(self, app, gateway, batch_size=100, poll_interval=2.0, visibility_timeout=300):
+        super().__init__(name='payout-worker', daemon=True)
+        self.app = app
+        self.gateway = gateway
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.visibility_timeout = visibility_timeout
+        self.worker_id = f'payout-{os.getpid()}'
+
+        self.batches = 0
+        self.paid = 0
+        self.failed = 0
+        self.last_batch = None
+        self.last_error = None
+        self._busy_seconds = 0.0
+        self._stop_event = threading.Event()
+
+    @classmethod
+    def from_config(cls, app):
+        return cls(
+            app,
+            gateway=load_gateway(app.config['PAYOUT_GATEWAY'], **app.config['PAYOUT_GATEWAY_OPTIONS']),
+            batch_size=app.config['PAYOUT_BATCH_SIZE'],
+            poll_interval=app.config['PAYOUT_POLL_INTERVAL'],
+            visibility_timeout=app.config['PAYOUT_VISIBILITY_TIMEOUT']
+        )
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                started_at = time.perf_counter()
+                with self.app.app_context():
+                    batch = PayoutService.run_batch(self.gateway, self.worker_id, self.batch_size, self.visibility_timeout)
+                elapsed = time.perf_counter() - started_at
+                self.last_error = None
+            except Exception as e:
+                batch = None
+                self.last_error = str(e)
+                logger.exception('Erro no worker de saques')
+
+            if batch and batch['claimed']:
+                self.batches += 1
+                self.paid += batch['paid']
+                self.failed += batch['failed']
+                self._busy_seconds += elapsed
+                self.last_batch = {**batch, 'total_ms': round(elapsed * 1000, 1), 'gateway_ms': round(batch['gateway_ms'], 1)}
+
+            # Lote cheio: provavelmente há mais na fila, segue sem esperar
+            if not batch or batch['claimed'] < self.batch_size:
+                self._stop_event.wait(self.poll_interval)
+
+    def stop(self, timeout=None):
+        self._stop_event.set()
+        if self.is_alive():
+            self.join(timeout)
+
+    def to_dict(self):
+        """Contadores desta thread, desde que o processo subiu (a vazão do servidor está em PayoutService.stats)"""
+        processed = self.paid + self.failed
+        return {
+            'scope': 'process',
+            'pid': os.getpid(),
+            'worker_id': self.worker_id,
+            'running': self.is_alive(),
+            'gateway': getattr(self.gateway, 'name', None) or type(self.gateway).__name__,
+            'batch_size': self.batch_size,
+            'poll_interval': self.poll_interval,
+            'visibility_timeout': self.visibility_timeout,
+            'batches': self.batches,
+            'paid': self.paid,
+            'failed': self.failed,
+            'avg_batch_size': round(processed / self.batches, 1) if self.batches else 0,
+            'payouts_per_second': round(processed / self._busy_seconds, 1) if self._busy_seconds else 0,
+            'last_batch': self.last_batch,
+            'last_error': self.last_error
+        }
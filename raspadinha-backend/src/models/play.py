@@ -0,0 +1,326 @@
+from src.models.user import db
+from src.models.game import Game, GameEngine
+from src.models.transaction import PaymentService
+from src.models.bonus import Bonus, BonusService
+from src.models.pool import CardPool
+from src.models.series import SeriesService
+from src.models.limits import LimitService
+from src.models.money import to_decimal
+from contextlib import contextmanager
+from datetime import datetime
+from decimal import Decimal
+import threading
+import time
+
+class PlayPipeline:
+    """Pipeline de uma jogada: todas as etapas rodam em uma única transação (um único commit)"""
+
+    STAGES = ('validate', 'card', 'game', 'wallet', 'ledger', 'bonus', 'loyalty', 'missions', 'commit')
+
+    # Tempos agregados por etapa no processo atual: etapa -> [jogadas, total_ms, max_ms]
+    _stage_stats = {}
+    _stats_lock = threading.Lock()
+
+    def __init__(self, user, category, use_bonus=False):
+        self.user = user
+        self.wallet = user.wallet
+        self.category = category
+        self.use_bonus = use_bonus
+        self.game_cost = to_decimal(category.price)
+
+        self.bonus = None
+        self.scratch_card = None
+        self.game = None
+        self.card_bonus = None
+        self.completed_missions = []
+        self.timings = {}
+
+    @contextmanager
+    def stage(self, name):
+        """Mede o tempo (ms) de uma etapa da jogada"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = (time.perf_counter() - start) * 1000
+
+    def run(self):
+        """Executa a jogada; em caso de erro desfaz tudo"""
+        try:
+            with self.stage('validate'):
+                self._validate()
+            with self.stage('card'):
+                # Série aberta tem prioridade; depois o pool pré-gerado; se vazio, gera na hora
+                self.scratch_card = (
+                    SeriesService.draw_card(self.category)
+                    or CardPool.claim(self.category.id)
+                    or GameEngine.generate_scratch_card(self.category.id, self.user.id)
+                )
+            with self.stage('game'):
+                self._create_game()
+            with self.stage('wallet'):
+                self._update_wallet()
+            with self.stage('ledger'):
+                self._create_transactions()
+            with self.stage('bonus'):
+                self._award_card_bonus()
+            with self.stage('loyalty'):
+                # Pontos de fidelidade apenas para jogos pagos
+                if not self.use_bonus:
+                    BonusService.update_loyalty_points(self.user.id, self.game_cost)
+            with self.stage('missions'):
+                self._update_missions()
+            with self.stage('commit'):
+                db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        self._record(self.timings)
+        return self
+
+    def _validate(self):
+        """Verifica jogo grátis disponível ou saldo suficiente"""
+        if self.use_bonus:
+            self.bonus = Bonus.query.filter_by(
+                user_id=self.user.id,
+                status='active'
+            ).filter(
+                Bonus.free_games > 0
+            ).filter(
+                db.or_(Bonus.expires_at.is_(None), Bonus.expires_at > datetime.utcnow())
+            ).first()
+
+            if not self.bonus:
+                raise ValueError('Nenhum jogo grátis disponível')
+        elif self.wallet.get_total_balance() < float(self.game_cost):
+            raise ValueError('Saldo insuficiente')
+
+    def _create_game(self):
+        self.game = Game(
+            user_id=self.user.id,
+            scratch_card_id=self.scratch_card.id,
+            amount_paid=self.game_cost,
+            prize_won=self.scratch_card.prize_amount,
+            is_bonus_game=self.use_bonus
+        )
+
+        db.session.add(self.game)
+        db.session.flush()  # Para obter o ID do jogo
+
+    def _update_wallet(self):
+        """Debita o jogo (ou consome jogo grátis) e credita o prêmio"""
+        if self.use_bonus:
+            self.bonus.free_games -= 1
+            if self.bonus.free_games <= 0:
+                self.bonus.status = 'claimed'
+                self.bonus.claimed_at = datetime.utcnow()
+        else:
+            # Limite de perda do nível: o custo conta antes do resultado, o prêmio desconta
+            LimitService.reserve(self.user, 'loss', self.game_cost)
+            self.wallet.subtract_balance(
+                self.game_cost, use_bonus_first=True, entry_type='game_cost', reference=f'game:{self.game.id}'
+            )
+
+        if self.scratch_card.is_winner and self.scratch_card.prize_amount > 0:
+            LimitService.record(self.user.id, 'loss', -self.scratch_card.prize_amount)
+            self.wallet.add_balance(
+                self.scratch_card.prize_amount, entry_type='prize_payout', reference=f'game:{self.game.id}'
+            )
+
+    def _create_transactions(self):
+        """Registra custo do jogo e prêmio no extrato"""
+        PaymentService.create_game_transaction(
+            self.user.id, 0 if self.use_bonus else self.game_cost, self.game.id, is_bonus=self.use_bonus
+        )
+
+        if self.scratch_card.is_winner and self.scratch_card.prize_amount > 0:
+            PaymentService.create_prize_transaction(
+                self.user.id, self.scratch_card.prize_amount, self.game.id
+            )
+
+    def _award_card_bonus(self):
+        """Jogos grátis do símbolo de bônus da raspadinha, se houver"""
+        bonus = (self.scratch_card.winning_combination or {}).get('bonus')
+        if bonus:
+            self.card_bonus = BonusService.create_card_bonus(
+                self.user.id, bonus['free_games'], self.scratch_card.id
+            )
+
+    def _update_missions(self):
+        self.completed_missions = BonusService.update_user_missions(self.user.id, 'game_played')
+
+        if self.scratch_card.is_winner:
+            self.completed_missions.extend(BonusService.update_user_missions(self.user.id, 'prize_won'))
+
+    def server_timing(self):
+        """Tempos das etapas no formato do header Server-Timing"""
+        return ', '.join(f'{name};dur={ms:.2f}' for name, ms in self.timings.items())
+
+    @classmethod
+    def _record(cls, timings):
+        with cls._stats_lock:
+            for name, ms in timings.items():
+                stats = cls._stage_stats.setdefault(name, [0, 0.0, 0.0])
+                stats[0] += 1
+                stats[1] += ms
+                stats[2] = max(stats[2], ms)
+
+    @classmethod
+    def stage_stats(cls):
+        """Resumo dos tempos por etapa desde o início do processo"""
+        with cls._stats_lock:
+            return {
+                name: {
+                    'count': count,
+                    'avg_ms': round(total / count, 3) if count else 0,
+                    'max_ms': round(max_ms, 3),
+                    'total_ms': round(total, 3)
+                }
+                for name, (count, total, max_ms) in cls._stage_stats.items()
+            }
+
+class BatchPlayPipeline(PlayPipeline):
+    """Compra de várias raspadinhas da mesma categoria em uma única transação
+
+    Um débito na carteira, inserts em massa de raspadinhas, jogos e extrato, e
+    fidelidade/missões aplicadas uma vez para o lote.
+    """
+
+    # Tempos do lote separados dos da jogada individual
+    _stage_stats = {}
+    _stats_lock = threading.Lock()
+
+    def __init__(self, user, category, count, use_bonus=False):
+        super().__init__(user, category, use_bonus)
+        self.count = count
+        self.total_cost = self.game_cost * count
+
+        self.bonuses = []
+        self.scratch_cards = []
+        self.games = []
+        self.card_bonuses = []
+
+    def run(self):
+        """Executa o lote; em caso de erro desfaz tudo"""
+        try:
+            with self.stage('validate'):
+                self._validate()
+            with self.stage('card'):
+                self._claim_cards()
+            with self.stage('game'):
+                self._create_games()
+            with self.stage('wallet'):
+                self._update_wallet()
+            with self.stage('ledger'):
+                PaymentService.create_play_transactions(self.user.id, self.games, is_bonus=self.use_bonus)
+            with self.stage('bonus'):
+                self._award_card_bonus()
+            with self.stage('loyalty'):
+                if not self.use_bonus:
+                    BonusService.update_loyalty_points(self.user.id, self.total_cost)
+            with self.stage('missions'):
+                self._update_missions()
+            with self.stage('commit'):
+                db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        self._record(self.timings)
+        return self
+
+    @property
+    def total_prize(self):
+        return sum((card.prize_amount for card in self.scratch_cards if card.is_winner), Decimal('0'))
+
+    def _validate(self):
+        """Verifica jogos grátis suficientes (somando os bônus ativos) ou saldo para o lote"""
+        if self.use_bonus:
+            # Consome primeiro os bônus que vencem antes
+            self.bonuses = Bonus.query.filter_by(
+                user_id=self.user.id,
+                status='active'
+            ).filter(
+                Bonus.free_games > 0
+            ).filter(
+                db.or_(Bonus.expires_at.is_(None), Bonus.expires_at > datetime.utcnow())
+            ).order_by(Bonus.expires_at.is_(None), Bonus.expires_at, Bonus.id).all()
+
+            if sum(bonus.free_games for bonus in self.bonuses) < self.count:
+                raise ValueError('Jogos grátis insuficientes')
+        elif self.wallet.get_total_balance() < float(self.total_cost):
+            raise ValueError('Saldo insuficiente')
+
+    def _claim_cards(self):
+        """Série aberta, depois pool pré-gerado e, para o que faltar, geração em lote"""
+        self.scratch_cards = SeriesService.draw_cards(self.category, self.count)
+
+        missing = self.count - len(self.scratch_cards)
+        if missing:
+            self.scratch_cards += CardPool.claim_many(self.category.id, missing)
+
+        missing = self.count - len(self.scratch_cards)
+        if missing:
+            self.scratch_cards += GameEngine.generate_scratch_cards(self.category, missing, self.user.id)
+
+    def _create_games(self):
+        now = datetime.utcnow()
+        # O RETURNING em lote do SQLite não garante a ordem das linhas: cada jogo volta para a sua raspadinha
+        games = db.session.scalars(
+            db.insert(Game).returning(Game),
+            [{
+                'user_id': self.user.id,
+                'scratch_card_id': card.id,
+                'amount_paid': self.game_cost,
+                'prize_won': card.prize_amount,
+                'is_bonus_game': self.use_bonus,
+                'status': 'completed',
+                'played_at': now
+            } for card in self.scratch_cards]
+        )
+        by_card = {game.scratch_card_id: game for game in games}
+        self.games = [by_card[card.id] for card in self.scratch_cards]
+
+    def _update_wallet(self):
+        """Um débito para o lote (ou consumo dos jogos grátis) e um crédito com a soma dos prêmios"""
+        if self.use_bonus:
+            remaining = self.count
+            for bonus in self.bonuses:
+                used = min(bonus.free_games, remaining)
+                bonus.free_games -= used
+                remaining -= used
+                if bonus.free_games <= 0:
+                    bonus.status = 'claimed'
+                    bonus.claimed_at = datetime.utcnow()
+                if not remaining:
+                    break
+        else:
+            LimitService.reserve(self.user, 'loss', self.total_cost)
+            self.wallet.subtract_balance(
+                self.total_cost, use_bonus_first=True, entry_type='game_cost', reference=self._reference()
+            )
+
+        if self.total_prize > 0:
+            LimitService.record(self.user.id, 'loss', -self.total_prize)
+            self.wallet.add_balance(self.total_prize, entry_type='prize_payout', reference=self._reference())
+
+    def _reference(self):
+        """Jogos do lote no razão da carteira"""
+        ids = [game.id for game in self.games]
+        return f'games:{min(ids)}-{max(ids)}'
+
+    def _award_card_bonus(self):
+        for card in self.scratch_cards:
+            bonus = (card.winning_combination or {}).get('bonus')
+            if bonus:
+                self.card_bonuses.append(
+                    BonusService.create_card_bonus(self.user.id, bonus['free_games'], card.id)
+                )
+
+    def _update_missions(self):
+        self.completed_missions = BonusService.update_user_missions(self.user.id, 'game_played', self.count)
+
+        winners = sum(1 for card in self.scratch_cards if card.is_winner)
+        if winners:
+            self.completed_missions.extend(BonusService.update_user_missions(self.user.id, 'prize_won', winners))
@@ -0,0 +1,201 @@
+from src.models.user import db
+from src.models.game import ScratchCardCategory, ScratchCard, GameEngine
+from datetime import datetime
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+class CardPoolEntry(db.Model):
+    """Raspadinha pré-gerada aguardando um jogador"""
+    __tablename__ = 'card_pool'
+
+    id = db.Column(db.Integer, primary_key=True)
+    category_id = db.Column(db.Integer, db.ForeignKey('scratch_card_categories.id'), nullable=False)
+    scratch_card_id = db.Column(db.Integer, db.ForeignKey('scratch_cards.id'), nullable=False)
+    claimed_at = db.Column(db.DateTime)  # NULL enquanto disponível
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        # Índice parcial: só as entradas disponíveis, na ordem em que serão consumidas
+        db.Index('ix_card_pool_available', 'category_id', 'id', sqlite_where=claimed_at.is_(None)),
+    )
+
+    def __repr__(self):
+        return f'<CardPoolEntry {self.id} Category:{self.category_id} Card:{self.scratch_card_id}>'
+
+class CardPool:
+    """Pool de raspadinhas pré-geradas por categoria"""
+
+    @staticmethod
+    def claim(category_id):
+        """Reserva a próxima raspadinha livre da categoria com um único UPDATE atômico (sem commit)"""
+        next_entry = db.select(CardPoolEntry.id).where(
+            CardPoolEntry.category_id == category_id,
+            CardPoolEntry.claimed_at.is_(None)
+        ).order_by(CardPoolEntry.id).limit(1).scalar_subquery()
+
+        scratch_card_id = db.session.execute(
+            db.update(CardPoolEntry)
+            .where(CardPoolEntry.id == next_entry)
+            .values(claimed_at=datetime.utcnow())
+            .returning(CardPoolEntry.scratch_card_id)
+            .execution_options(synchronize_session=False)
+        ).scalar()
+
+        if scratch_card_id is None:
+            return None
+
+        return ScratchCard.query.get(scratch_card_id)
+
+    @staticmethod
+    def claim_many(category_id, count):
+        """Reserva até `count` raspadinhas livres da categoria com um único UPDATE (sem commit)"""
+        next_entries = db.select(CardPoolEntry.id).where(
+            CardPoolEntry.category_id == category_id,
+            CardPoolEntry.claimed_at.is_(None)
+        ).order_by(CardPoolEntry.id).limit(count)
+
+        scratch_card_ids = db.session.scalars(
+            db.update(CardPoolEntry)
+            .where(CardPoolEntry.id.in_(next_entries))
+            .values(claimed_at=datetime.utcnow())
+            .returning(CardPoolEntry.scratch_card_id)
+            .execution_options(synchronize_session=False)
+        ).all()
+
+        if not scratch_card_ids:
+            return []
+
+        return ScratchCard.query.filter(ScratchCard.id.in_(scratch_card_ids)).order_by(ScratchCard.id).all()
+
+    @staticmethod
+    def available_counts():
+        """Quantidade de raspadinhas disponíveis por categoria"""
+        rows = db.session.query(
+            CardPoolEntry.category_id, db.func.count(CardPoolEntry.id)
+        ).filter(
+            CardPoolEntry.claimed_at.is_(None)
+        ).group_by(CardPoolEntry.category_id).all()
+
+        return {category_id: count for category_id, count in rows}
+
+    @staticmethod
+    def refill(category, count, batch_size=1000):
+        """Gera `count` raspadinhas para o pool, com um commit a cada lote de até `batch_size`"""
+        created = 0
+
+        while created < count:
+            size = min(batch_size, count - created)
+            rows = GameEngine.generate_batch(category, size).to_rows()
+
+            # Todas do mesmo lote e categoria: a ordem dos ids devolvidos não importa. Com render_nulls
+            # o winning_symbol NULL das perdedoras não separa o lote em vários INSERTs
+            card_ids = db.session.scalars(
+                db.insert(ScratchCard).returning(ScratchCard.id).execution_options(render_nulls=True), rows
+            ).all()
+            db.session.execute(
+                db.insert(CardPoolEntry),
+                [{'category_id': category.id, 'scratch_card_id': card_id} for card_id in card_ids]
+            )
+            db.session.commit()
+
+            created += size
+
+        return created
+
+    @staticmethod
+    def purge_claimed():
+        """Remove do pool as entradas já consumidas"""
+        deleted = db.session.execute(
+            db.delete(CardPoolEntry).where(CardPoolEntry.claimed_at.isnot(None))
+        ).rowcount
+        db.session.commit()
+        return deleted
+
+    @staticmethod
+    def discard(category_id):
+        """Descarta as raspadinhas ainda não usadas da categoria (ex.: após mudar a configuração)"""
+        unused = db.select(CardPoolEntry.scratch_card_id).where(
+            CardPoolEntry.category_id == category_id,
+            CardPoolEntry.claimed_at.is_(None)
+        )
+
+        db.session.execute(
+            db.delete(ScratchCard).where(ScratchCard.id.in_(unused)).execution_options(synchronize_session=False)
+        )
+        deleted = db.session.execute(
+            db.delete(CardPoolEntry).where(
+                CardPoolEntry.category_id == category_id,
+                CardPoolEntry.claimed_at.is_(None)
+            )
+        ).rowcount
+        db.session.commit()
+        return deleted
+
+class CardPoolRefiller(threading.Thread):
+    """Thread em background que mantém o pool de cada categoria entre as marcas baixa e alta"""
+
+    def __init__(self, app, low_watermark=200, high_watermark=2000, batch_size=1000, interval=5):
+        super().__init__(name='card-pool-refiller', daemon=True)
+        self.app = app
+        self.low_watermark = low_watermark
+        self.high_watermark = high_watermark
+        self.batch_size = batch_size
+        self.interval = interval
+
+        self.cards_generated = 0
+        self.last_run_at = None
+        self.last_error = None
+        self._stop_event = threading.Event()
+
+    @classmethod
+    def from_config(cls, app):
+        return cls(
+            app,
+            low_watermark=app.config['CARD_POOL_LOW_WATERMARK'],
+            high_watermark=app.config['CARD_POOL_HIGH_WATERMARK'],
+            batch_size=app.config['CARD_POOL_BATCH_SIZE'],
+            interval=app.config['CARD_POOL_REFILL_INTERVAL']
+        )
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                with self.app.app_context():
+                    self.refill_once()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                logger.exception('Erro ao reabastecer o pool de raspadinhas')
+
+            self._stop_event.wait(self.interval)
+
+    def refill_once(self):
+        """Completa até a marca alta as categorias ativas que estão abaixo da marca baixa"""
+        CardPool.purge_claimed()
+        counts = CardPool.available_counts()
+
+        for category in ScratchCardCategory.query.filter_by(is_active=True).all():
+            available = counts.get(category.id, 0)
+            if available < self.low_watermark:
+                self.cards_generated += CardPool.refill(
+                    category, self.high_watermark - available, self.batch_size
+                )
+
+        self.last_run_at = datetime.utcnow()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def to_dict(self):
+        return {
+            'running': self.is_alive(),
+            'low_watermark': self.low_watermark,
+            'high_watermark': self.high_watermark,
+            'batch_size': self.batch_size,
+            'interval': self.interval,
+            'cards_generated': self.cards_generated,
+            'last_run_at': self.last_run_at.isoformat() if self.last_run_at else None,
+            'last_error': self.last_error
+        }
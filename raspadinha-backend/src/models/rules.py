@@ -0,0 +1,309 @@
+import threading
+import numpy as np
+
+# Símbolos usados quando a categoria não define os seus
+DEFAULT_SYMBOLS = ['🍀', '💎', '💰', '⭐', '🎯', '🏆', '🎁', '🔥']
+
+# Regra usada quando a categoria não define win_rules
+DEFAULT_WIN_RULES = {'type': '3_of_a_kind'}
+
+# Linhas do grid 3x3 (posições 0-8, linha a linha)
+LINES = {
+    'rows': [(0, 1, 2), (3, 4, 5), (6, 7, 8)],
+    'columns': [(0, 3, 6), (1, 4, 7), (2, 5, 8)],
+    'diagonals': [(0, 4, 8), (2, 4, 6)]
+}
+
+# Tentativas de reamostragem antes de desistir de uma configuração impossível
+MAX_ATTEMPTS = 100
+
+def category_version(category):
+    """Versão da configuração da categoria, usada para invalidar o que foi compilado a partir dela"""
+    return (category.updated_at, category.price, category.max_prize)
+
+class RuleCards:
+    """Lote de grids com o resultado da regra (arrays NumPy)
+
+    grids: (n, 9) índices em WinRule.symbol_table; is_winner: (n,);
+    winning_symbol: (n,) índice ou -1; winning_positions: (n, tamanho do padrão) ou -1;
+    multiplier: (n,) fator do prêmio (1 sem multiplicador); bonus_free_games: (n,).
+    """
+
+    def __init__(self, grids, is_winner, winning_symbol, winning_positions, multiplier, bonus_free_games):
+        self.grids = grids
+        self.is_winner = is_winner
+        self.winning_symbol = winning_symbol
+        self.winning_positions = winning_positions
+        self.multiplier = multiplier
+        self.bonus_free_games = bonus_free_games
+
+class WinRule:
+    """Regra de vitória de uma categoria (ScratchCardCategory.win_rules) compilada para NumPy
+
+    Tipos suportados:
+        {'type': '3_of_a_kind'}                        3 símbolos iguais em qualquer posição
+        {'type': 'n_of_a_kind', 'count': 4}            N símbolos iguais em qualquer posição
+        {'type': 'line', 'lines': ['rows', 'columns', 'diagonals']}
+                                                       3 iguais em uma linha, coluna ou diagonal
+    Extras opcionais (qualquer tipo):
+        'multipliers': {'🔥': 2, '⚡': 5}, 'multiplier_probability': 0.1
+            em uma raspadinha vencedora, com essa probabilidade, um símbolo
+            multiplicador aparece e multiplica o prêmio (limitado ao prêmio máximo)
+        'bonus_symbol': '🎁', 'bonus_probability': 0.02, 'bonus_free_games': 1
+            com essa probabilidade o símbolo de bônus aparece e dá jogos grátis
+
+    Símbolos especiais (multiplicadores e bônus) nunca fazem parte de um padrão.
+    A geração parte do resultado já sorteado: perdedoras nunca formam um padrão
+    e vencedoras formam exatamente um.
+    """
+
+    # category_id -> WinRule; a versão guardada invalida a entrada quando a categoria muda
+    _cache = {}
+    _cache_lock = threading.Lock()
+
+    def __init__(self, win_rules, symbols, version=None):
+        config = dict(win_rules or DEFAULT_WIN_RULES)
+        symbols = list(symbols or DEFAULT_SYMBOLS)
+
+        self.version = version
+        self.config = config
+        self.type = config.get('type', DEFAULT_WIN_RULES['type'])
+
+        multipliers = config.get('multipliers') or {}
+        bonus_symbol = config.get('bonus_symbol')
+        specials = list(multipliers) + ([bonus_symbol] if bonus_symbol else [])
+
+        # Índices seguem a lista de símbolos da categoria; especiais que não estão nela vão para o fim
+        self.symbol_table = symbols + [symbol for symbol in specials if symbol not in symbols]
+        if len(self.symbol_table) > 255:
+            raise ValueError('Máximo de 255 símbolos por categoria')
+        index = {symbol: i for i, symbol in enumerate(self.symbol_table)}
+
+        self.filler = np.array([i for i, symbol in enumerate(self.symbol_table) if symbol not in specials], dtype=np.uint8)
+        fillers = len(self.filler)
+
+        if self.type in ('3_of_a_kind', 'n_of_a_kind'):
+            self.count = 3 if self.type == '3_of_a_kind' else config.get('count', 3)
+            if not isinstance(self.count, int) or not 2 <= self.count <= 9:
+                raise ValueError("'count' deve ser um inteiro entre 2 e 9")
+            # Perdedoras precisam caber com no máximo count-1 de cada símbolo
+            if fillers * (self.count - 1) < 9 or (fillers - 1) * (self.count - 1) < 9 - self.count:
+                raise ValueError('Símbolos insuficientes para a regra')
+            self.patterns = None
+            self.pattern_size = self.count
+        elif self.type == 'line':
+            names = config.get('lines') or list(LINES)
+            if not isinstance(names, list) or any(name not in LINES for name in names):
+                raise ValueError(f"'lines' deve conter apenas {', '.join(LINES)}")
+            if fillers < 2:
+                raise ValueError('Símbolos insuficientes para a regra')
+            self.patterns = np.array([pattern for name in names for pattern in LINES[name]], dtype=np.int64)
+            self.pattern_size = 3
+        else:
+            raise ValueError(f'Tipo de regra desconhecido: {self.type}')
+
+        if specials and self.pattern_size > 7:
+            raise ValueError('Padrão grande demais para incluir símbolos especiais')
+
+        for symbol, factor in multipliers.items():
+            if not isinstance(factor, int) or isinstance(factor, bool) or factor < 2:
+                raise ValueError(f'Multiplicador de {symbol} deve ser um inteiro maior que 1')
+        self.multiplier_symbols = np.array([index[symbol] for symbol in multipliers], dtype=np.uint8)
+        self.multiplier_values = np.array(list(multipliers.values()), dtype=np.int64)
+        self.multiplier_probability = WinRule._probability(config, 'multiplier_probability') if multipliers else 0.0
+
+        # Fator de cada símbolo da tabela (1 para os comuns)
+        self._factor_of_symbol = np.ones(len(self.symbol_table), dtype=np.int64)
+        self._factor_of_symbol[self.multiplier_symbols] = self.multiplier_values
+
+        self.bonus_symbol = index[bonus_symbol] if bonus_symbol else None
+        self.bonus_probability = WinRule._probability(config, 'bonus_probability') if bonus_symbol else 0.0
+        self.bonus_free_games = config.get('bonus_free_games', 1)
+        if not isinstance(self.bonus_free_games, int) or self.bonus_free_games < 1:
+            raise ValueError("'bonus_free_games' deve ser um inteiro positivo")
+
+        self._is_special = np.zeros(len(self.symbol_table), dtype=bool)
+        self._is_special[[index[symbol] for symbol in specials]] = True
+
+    @staticmethod
+    def _probability(config, key):
+        value = config.get(key, 0.0)
+        if not isinstance(value, (int, float)) or isinstance(value, bool) or not 0 <= value <= 1:
+            raise ValueError(f"'{key}' deve estar entre 0 e 1")
+        return float(value)
+
+    @classmethod
+    def for_category(cls, category):
+        """Regra compilada da categoria, recompilada se a categoria mudou"""
+        version = category_version(category)
+        rule = cls._cache.get(category.id)
+
+        if rule is None or rule.version != version:
+            rule = cls(category.win_rules, category.symbols, version)
+            if category.id is not None:
+                with cls._cache_lock:
+                    cls._cache[category.id] = rule
+
+        return rule
+
+    @classmethod
+    def invalidate(cls, category_id=None):
+        """Descarta a regra compilada de uma categoria (ou de todas)"""
+        with cls._cache_lock:
+            if category_id is None:
+                cls._cache.clear()
+            else:
+                cls._cache.pop(category_id, None)
+
+    def generate(self, is_winner, rng, extras=True):
+        """Monta grids coerentes com o resultado já sorteado de cada raspadinha
+
+        Com extras=False não sorteia multiplicadores nem bônus (prêmio já fixado, ex.: séries).
+        """
+        n = len(is_winner)
+        grids = np.empty((n, 9), dtype=np.uint8)
+        winning_symbol = np.full(n, -1, dtype=np.int16)
+        winning_positions = np.full((n, self.pattern_size), -1, dtype=np.int8)
+
+        winners = np.flatnonzero(is_winner)
+        losers = np.flatnonzero(~is_winner)
+
+        if self.patterns is None:
+            self._fill_kind_losers(grids, losers, rng)
+            self._fill_kind_winners(grids, winners, winning_symbol, winning_positions, rng)
+        else:
+            self._fill_line_losers(grids, losers, rng)
+            self._fill_line_winners(grids, winners, winning_symbol, winning_positions, rng)
+
+        multiplier = np.ones(n, dtype=np.int64)
+        bonus_free_games = np.zeros(n, dtype=np.int64)
+
+        if extras and (self.multiplier_probability or self.bonus_probability):
+            # Casas livres (fora do padrão vencedor) em ordem aleatória para os símbolos especiais
+            keys = rng.random((n, 9))
+            keys[winners[:, None], winning_positions[winners]] = 2.0
+            free_cells = np.argsort(keys, axis=1)
+
+            if self.multiplier_probability and len(winners):
+                applied = winners[rng.random(len(winners)) < self.multiplier_probability]
+                choice = rng.integers(0, len(self.multiplier_symbols), len(applied))
+                grids[applied, free_cells[applied, 0]] = self.multiplier_symbols[choice]
+                multiplier[applied] = self.multiplier_values[choice]
+
+            if self.bonus_probability:
+                awarded = np.flatnonzero(rng.random(n) < self.bonus_probability)
+                grids[awarded, free_cells[awarded, 1]] = self.bonus_symbol
+                bonus_free_games[awarded] = self.bonus_free_games
+
+        return RuleCards(grids, is_winner, winning_symbol, winning_positions, multiplier, bonus_free_games)
+
+    def _fill_kind_losers(self, grids, rows, rng):
+        # Cada símbolo disponível no máximo count-1 vezes: nenhum grupo vencedor
+        pool = np.repeat(self.filler, self.count - 1)
+        order = np.argsort(rng.random((len(rows), len(pool))), axis=1)[:, :9]
+        grids[rows] = pool[order]
+
+    def _fill_kind_winners(self, grids, rows, winning_symbol, winning_positions, rng):
+        m, k = len(rows), self.count
+        fillers = len(self.filler)
+
+        chosen = rng.integers(0, fillers, m)
+        cells = np.argsort(rng.random((m, 9)), axis=1)
+        pattern, rest = np.sort(cells[:, :k], axis=1), cells[:, k:]
+
+        # Demais casas com os outros símbolos, no máximo count-1 de cada
+        pool = np.repeat(np.arange(fillers - 1), k - 1)
+        others = pool[np.argsort(rng.random((m, len(pool))), axis=1)[:, :9 - k]]
+        others += others >= chosen[:, None]
+
+        block = np.empty((m, 9), dtype=np.uint8)
+        r = np.arange(m)[:, None]
+        block[r, pattern] = self.filler[chosen][:, None]
+        block[r, rest] = self.filler[others]
+
+        grids[rows] = block
+        winning_symbol[rows] = self.filler[chosen]
+        winning_positions[rows] = pattern
+
+    def _fill_line_losers(self, grids, rows, rng):
+        pending = rows
+        for _ in range(MAX_ATTEMPTS):
+            if not len(pending):
+                return
+            grids[pending] = self.filler[rng.integers(0, len(self.filler), (len(pending), 9))]
+            pending = pending[self._match_lines(grids[pending]).any(axis=1)]
+
+        raise RuntimeError('Não foi possível gerar raspadinhas perdedoras para a regra')
+
+    def _fill_line_winners(self, grids, rows, winning_symbol, winning_positions, rng):
+        m = len(rows)
+        lines = self.patterns[rng.integers(0, len(self.patterns), m)]
+        symbols = self.filler[rng.integers(0, len(self.filler), m)]
+
+        block = np.empty((m, 9), dtype=np.uint8)
+        pending = np.arange(m)
+        for _ in range(MAX_ATTEMPTS):
+            if not len(pending):
+                break
+            block[pending] = self.filler[rng.integers(0, len(self.filler), (len(pending), 9))]
+            block[pending[:, None], lines[pending]] = symbols[pending][:, None]
+            # Só pode haver a linha escolhida
+            pending = pending[self._match_lines(block[pending]).sum(axis=1) > 1]
+        else:
+            if len(pending):
+                raise RuntimeError('Não foi possível gerar raspadinhas vencedoras para a regra')
+
+        grids[rows] = block
+        winning_symbol[rows] = symbols
+        winning_positions[rows] = lines
+
+    def _match_lines(self, grids):
+        cells = grids[:, self.patterns]
+        return (cells[:, :, 0] == cells[:, :, 1]) & (cells[:, :, 1] == cells[:, :, 2])
+
+    def evaluate(self, grids):
+        """Aplica a regra a grids já montados (índices em symbol_table)"""
+        grids = np.asarray(grids, dtype=np.uint8).reshape(-1, 9)
+        n = len(grids)
+        r = np.arange(n)
+
+        if self.patterns is None:
+            counts = (grids[:, :, None] == np.arange(len(self.symbol_table))).sum(axis=1)
+            counts[:, self._is_special] = 0
+            best = counts.argmax(axis=1)
+            is_winner = counts[r, best] >= self.count
+            # Posições do símbolo vencedor (as primeiras `count`, em ordem)
+            positions = np.argsort(grids != best[:, None], axis=1, kind='stable')[:, :self.count]
+        else:
+            matches = self._match_lines(grids)
+            is_winner = matches.any(axis=1)
+            positions = self.patterns[matches.argmax(axis=1)]
+            best = grids[r, positions[:, 0]].astype(np.int16)
+
+        winning_symbol = np.where(is_winner, best, -1).astype(np.int16)
+        winning_positions = np.where(is_winner[:, None], positions, -1).astype(np.int8)
+        multiplier = np.where(is_winner, self._factor_of_symbol[grids].max(axis=1), 1)
+
+        bonus_free_games = np.zeros(n, dtype=np.int64)
+        if self.bonus_symbol is not None:
+            bonus_free_games[(grids == self.bonus_symbol).any(axis=1)] = self.bonus_free_games
+
+        return RuleCards(grids, is_winner, winning_symbol, winning_positions, multiplier, bonus_free_games)
+
+    def verify(self, symbols):
+        """Avalia uma raspadinha (lista de 9 símbolos) e devolve o resultado pela regra"""
+        index = {symbol: i for i, symbol in enumerate(self.symbol_table)}
+        if len(symbols) != 9 or any(symbol not in index for symbol in symbols):
+            raise ValueError('Raspadinha com símbolos inválidos para a categoria')
+
+        result = self.evaluate([[index[symbol] for symbol in symbols]])
+        is_winner = bool(result.is_winner[0])
+
+        return {
+            'is_winner': is_winner,
+            'symbol': self.symbol_table[result.winning_symbol[0]] if is_winner else None,
+            'positions': result.winning_positions[0].tolist() if is_winner else [],
+            'multiplier': int(result.multiplier[0]),
+            'bonus_free_games': int(result.bonus_free_games[0]),
+            'rule': self.type
+        }
@@ -0,0 +1,236 @@
+from src.models.user import db
+from src.models.money import Money
+from sqlalchemy import DDL, event, inspect, text
+import re
+
+# Migrações versionadas: versão -> (descrição, função(connection)); a versão aplicada fica em PRAGMA user_version
+MIGRATIONS = {}
+
+# Triggers registrados com sqlite_trigger: nome -> (tabela, DDL)
+TRIGGERS = {}
+
+def sqlite_trigger(table, sql):
+    """Registra um trigger do SQLite criado junto com `table` (e recriado pelas migrações)"""
+    ddl = DDL(sql).execute_if(dialect='sqlite')
+    event.listen(table, 'after_create', ddl)
+    TRIGGERS[re.search(r'CREATE TRIGGER (\w+)', sql).group(1)] = (table, ddl)
+
+def inline(value):
+    """Valor escrito no SQL como literal, e não como parâmetro `?`
+
+    O SQLite só usa um índice parcial quando o WHERE da consulta repete o
+    termo do índice com os mesmos literais: com parâmetros ele não consegue
+    provar que as linhas procuradas estão no índice.
+    """
+    return db.literal(value, literal_execute=True)
+
+def migration(version, description):
+    """Registra uma migração do esquema: roda uma única vez por banco, em ordem de versão"""
+    def register(function):
+        MIGRATIONS[version] = (description, function)
+        return function
+    return register
+
+def latest_version():
+    return max(MIGRATIONS, default=0)
+
+def import_models():
+    """Todas as tabelas (e seus triggers) precisam estar registradas antes de criar ou migrar o banco"""
+    from src.models import wallet, game, transaction, bonus, series, ledger, limits, stats, metrics, pool, symbols, jobs
+
+def missing_columns(connection):
+    """Colunas declaradas nos modelos que ainda não existem nas tabelas do banco: [(tabela, coluna)]"""
+    inspector = inspect(connection)
+    existing_tables = set(inspector.get_table_names())
+    missing = []
+    
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        
+        existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+        missing.extend((table, column) for column in table.columns if column.name not in existing_columns)
+    
+    return missing
+
+def missing_indexes(connection):
+    """Índices declarados nos modelos que ainda não existem no banco"""
+    inspector = inspect(connection)
+    existing_tables = set(inspector.get_table_names())
+    missing = []
+    
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        
+        existing_indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+        missing.extend(index for index in table.indexes if index.name not in existing_indexes)
+    
+    return missing
+
+def add_missing_columns(connection):
+    """Adiciona às tabelas já existentes as colunas novas dos modelos (ALTER TABLE ... ADD COLUMN)
+    
+    db.create_all() só cria tabelas que ainda não existem; colunas acrescentadas
+    depois a um modelo precisam ser criadas nos bancos antigos. Linhas antigas
+    ficam com NULL na coluna nova.
+    """
+    added = []
+    for table, column in missing_columns(connection):
+        column_type = column.type.compile(dialect=connection.dialect)
+        connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+        added.append(f'{table.name}.{column.name}')
+    return added
+
+def add_missing_indexes(connection):
+    """Cria nas tabelas já existentes os índices novos dos modelos
+    
+    Assim como as colunas, índices declarados depois que a tabela foi criada
+    não são criados por db.create_all().
+    """
+    added = []
+    for index in missing_indexes(connection):
+        index.create(connection)
+        added.append(index.name)
+    return added
+
+def schema_version(connection):
+    return connection.exec_driver_sql('PRAGMA user_version').scalar()
+
+def upgrade():
+    """Cria as tabelas novas e aplica as migrações pendentes; devolve [(versão, descrição)] aplicadas
+    
+    Tudo roda em uma única transação IMMEDIATE: vários workers subindo juntos
+    esperam o primeiro terminar e depois encontram o banco já na última
+    versão. Um banco novo nasce do zero já no formato atual, então só recebe
+    o número da última versão.
+    """
+    import_models()
+    if db.engine.dialect.name != 'sqlite':
+        db.create_all()
+        return []
+    
+    applied = []
+    with db.engine.begin() as connection:
+        connection.exec_driver_sql('BEGIN IMMEDIATE')
+        current = schema_version(connection)
+        fresh = not inspect(connection).has_table('users')
+        
+        db.metadata.create_all(connection)
+        
+        if not fresh:
+            for version in sorted(MIGRATIONS):
+                if version <= current:
+                    continue
+                description, function = MIGRATIONS[version]
+                function(connection)
+                applied.append((version, description))
+        
+        if current < latest_version():
+            connection.exec_driver_sql(f'PRAGMA user_version = {latest_version()}')
+    
+    return applied
+
+@migration(1, 'Valores monetários em centavos inteiros')
+def migrate_money_to_cents(connection):
+    """Converte os valores monetários de bancos antigos (reais em NUMERIC) para centavos
+
+    Antes completa as colunas que faltarem (como a inicialização fazia até
+    aqui). Só as colunas Money ainda declaradas como NUMERIC são convertidas
+    (tabelas criadas depois já nascem INTEGER). Os triggers são recriados com
+    a aritmética inteira.
+    """
+    add_missing_columns(connection)
+    
+    inspector = inspect(connection)
+    existing_tables = set(inspector.get_table_names())
+    
+    # O razão bloqueia UPDATE por trigger: os triggers saem durante a conversão
+    for name in TRIGGERS:
+        connection.exec_driver_sql(f'DROP TRIGGER IF EXISTS {name}')
+    
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        
+        declared = {column['name']: str(column['type']).upper() for column in inspector.get_columns(table.name)}
+        columns = [
+            column.name for column in table.columns
+            if isinstance(column.type, Money) and declared.get(column.name, '').startswith(('NUMERIC', 'DECIMAL'))
+        ]
+        if columns:
+            assignments = ', '.join(f'{name} = CAST(ROUND({name} * 100) AS INTEGER)' for name in columns)
+            connection.execute(text(f'UPDATE {table.name} SET {assignments}'))
+    
+    for table, ddl in TRIGGERS.values():
+        if table.name in existing_tables:
+            connection.execute(ddl)
+
+@migration(2, 'Índices das consultas quentes (carteira, bônus, missões, histórico, extrato, saques e painéis)')
+def create_hot_query_indexes(connection):
+    """Cria os índices declarados nos modelos que ainda não existem no banco
+
+    Em tabelas grandes a criação leva um tempo proporcional ao tamanho, uma
+    única vez. Também cria os índices declarados antes do versionamento que
+    um banco antigo ainda não tenha.
+    """
+    add_missing_indexes(connection)
+
+@migration(3, 'Baldes agregados do painel do admin (por hora, por dia e total)')
+def backfill_metric_buckets(connection):
+    """Preenche os baldes do painel com todo o histórico
+
+    A tabela e os triggers acabaram de ser criados; daqui em diante os
+    triggers mantêm os baldes. Lê cada tabela de origem uma vez.
+    """
+    from src.models.metrics import MetricsService
+    MetricsService.rebuild_range(connection)
+
+@migration(4, 'Totais de jogo por usuário (listagem e detalhes do admin)')
+def backfill_user_stats(connection):
+    """Preenche user_stats com todo o histórico; daqui em diante os triggers mantêm a tabela"""
+    from src.models.stats import StatsService
+    StatsService.rebuild_user_stats_range(connection)
+
+@migration(5, 'Contadores por categoria e faixa de prêmio (categorias do admin)')
+def backfill_category_prize_counters(connection):
+    """Preenche os contadores por categoria com todos os jogos; daqui em diante o trigger de `games` os mantém"""
+    from src.models.metrics import MetricsService
+    MetricsService.rebuild_category_counters(connection)
+
+@migration(6, 'Baldes por minuto, jogadores ativos por balde e retenção das séries')
+def backfill_metric_series(connection):
+    """Acrescenta os minutos e os jogadores ativos aos baldes do painel
+
+    Os triggers dos baldes são recriados para gravar também o minuto e a
+    presença dos jogadores; depois os baldes são refeitos a partir das
+    tabelas de origem (minutos e horas só dentro da retenção) e as horas
+    mais antigas que a retenção são apagadas.
+    """
+    from src.models.metrics import MetricBucket, MetricsService
+    add_missing_columns(connection)
+
+    for name, (table, ddl) in TRIGGERS.items():
+        if table is MetricBucket.__table__:
+            connection.exec_driver_sql(f'DROP TRIGGER IF EXISTS {name}')
+            connection.execute(ddl)
+
+    MetricsService.rebuild_range(connection)
+    MetricsService.compact(connection)
+
+@migration(7, 'Resumo mensal por usuário (resumo da carteira)')
+def backfill_user_monthly_stats(connection):
+    """Preenche user_monthly_stats com todo o extrato; daqui em diante os triggers de `transactions` mantêm a tabela"""
+    from src.models.stats import StatsService
+    StatsService.rebuild_monthly_range(connection)
+
+@migration(8, 'Contadores de limite dos períodos correntes')
+def backfill_limit_counters(connection):
+    """Preenche os contadores de limite com o extrato do dia, da semana e do mês correntes
+
+    Sem isso os depósitos e saques já feitos no dia da implantação não
+    contariam para os limites; daqui em diante cada operação atualiza o seu
+    contador.
+    """
+    from src.models.limits import LimitService
+    LimitService.rebuild_counters(connection)
@@ -0,0 +1,332 @@
+from src.models.user import db
+from src.models.game import ScratchCard, GameEngine
+from src.models.money import Money
+from datetime import datetime
+from decimal import Decimal
+import threading
+import numpy as np
+
+MAX_TICKETS = 20_000_000
+MAX_TIERS = 255  # Baralho com 1 byte por bilhete (0 = sem prêmio)
+
+class TicketSeries(db.Model):
+    """Série impressa de bilhetes: quantidade fixa e tabela de prêmios exata
+
+    O resultado de cada bilhete fica no baralho (`deck`): um array embaralhado
+    com o índice da faixa de prêmio de cada posição (0 = sem prêmio). Cada
+    jogada só avança o cursor.
+    """
+    __tablename__ = 'ticket_series'
+
+    id = db.Column(db.Integer, primary_key=True)
+    category_id = db.Column(db.Integer, db.ForeignKey('scratch_card_categories.id'), nullable=False)
+    name = db.Column(db.String(100))
+    ticket_price = db.Column(Money, nullable=False)  # Preço da categoria na abertura
+    total_tickets = db.Column(db.Integer, nullable=False)
+    cursor = db.Column(db.Integer, nullable=False, default=0)  # Bilhetes já vendidos
+    prizes = db.Column(db.JSON, nullable=False)  # Faixas: [{'amount', 'count'}]; faixa i do baralho = prizes[i-1]
+    deck = db.deferred(db.Column(db.LargeBinary, nullable=False))  # uint8 por bilhete, só carregado quando preciso
+    status = db.Column(db.String(20), default='open')  # open, closed, sold_out
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    closed_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_ticket_series_open', 'category_id', 'status'),
+    )
+
+    # Relacionamentos
+    category = db.relationship('ScratchCardCategory', backref='series')
+
+    def __repr__(self):
+        return f'<TicketSeries {self.id} Category:{self.category_id} {self.cursor}/{self.total_tickets}>'
+
+    def to_dict(self):
+        total_prize = sum(Decimal(str(tier['amount'])) * tier['count'] for tier in self.prizes)
+        winning_tickets = sum(tier['count'] for tier in self.prizes)
+
+        return {
+            'id': self.id,
+            'category_id': self.category_id,
+            'name': self.name,
+            'status': self.status,
+            'ticket_price': float(self.ticket_price),
+            'total_tickets': self.total_tickets,
+            'sold': self.cursor,
+            'remaining': self.total_tickets - self.cursor,
+            'prizes': self.prizes,
+            'winning_tickets': winning_tickets,
+            'total_prize': float(total_prize),
+            'rtp': float(total_prize / (self.ticket_price * self.total_tickets)),
+            'created_at': self.created_at.isoformat(),
+            'closed_at': self.closed_at.isoformat() if self.closed_at else None
+        }
+
+class SeriesService:
+    """Abertura, venda e acompanhamento de séries de bilhetes"""
+
+    # series_id -> (baralho, prêmio em centavos por faixa, probabilidade de vitória); o baralho não muda depois de aberto
+    _decks = {}
+    _decks_lock = threading.Lock()
+
+    @staticmethod
+    def tiers_from_category(category, total_tickets):
+        """Faixas exatas de uma série a partir da probabilidade e da distribuição de prêmios da categoria"""
+        win_probability = GameEngine._calculate_win_probability(category)
+
+        prizes = []
+        for prize, probability in GameEngine._prize_distribution(category):
+            count = round(total_tickets * win_probability * probability)
+            if count > 0:
+                prizes.append({'amount': round(prize, 2), 'count': count})
+        return prizes
+
+    @staticmethod
+    def validate_prizes(category, total_tickets, prizes):
+        """Valida as faixas da série e devolve os valores absolutos: [{'amount', 'count'}]"""
+        if not isinstance(total_tickets, int) or isinstance(total_tickets, bool) or not 1 <= total_tickets <= MAX_TICKETS:
+            raise ValueError(f'Quantidade de bilhetes deve estar entre 1 e {MAX_TICKETS}')
+        if not isinstance(prizes, list) or not prizes:
+            raise ValueError('A série deve ter uma lista não vazia de faixas de prêmio')
+        if len(prizes) > MAX_TIERS:
+            raise ValueError(f'Máximo de {MAX_TIERS} faixas por série')
+
+        price = float(category.price)
+        max_prize = float(category.max_prize)
+        resolved = []
+
+        for tier in prizes:
+            if not isinstance(tier, dict) or ('multiplier' in tier) == ('amount' in tier):
+                raise ValueError("Cada faixa deve ter 'multiplier' ou 'amount'")
+            value = tier.get('multiplier', tier.get('amount'))
+            count = tier.get('count')
+            if not isinstance(value, (int, float)) or isinstance(value, bool) or value <= 0:
+                raise ValueError('Valor da faixa deve ser positivo')
+            if not isinstance(count, int) or isinstance(count, bool) or count < 1:
+                raise ValueError("Cada faixa deve ter 'count' inteiro positivo")
+
+            amount = round(float(price * value if 'multiplier' in tier else value), 2)
+            if amount > max_prize:
+                raise ValueError('Prêmio da faixa acima do prêmio máximo da categoria')
+            resolved.append({'amount': amount, 'count': count})
+
+        if sum(tier['count'] for tier in resolved) > total_tickets:
+            raise ValueError('Mais bilhetes premiados que bilhetes na série')
+
+        return resolved
+
+    @staticmethod
+    def build_deck(total_tickets, prizes, rng=None):
+        """Baralho embaralhado: índice da faixa (1..n) de cada bilhete premiado, 0 nos demais"""
+        rng = rng if rng is not None else np.random.default_rng()
+        counts = [tier['count'] for tier in prizes]
+
+        deck = np.zeros(total_tickets, dtype=np.uint8)
+        deck[:sum(counts)] = np.repeat(np.arange(1, len(prizes) + 1, dtype=np.uint8), counts)
+        rng.shuffle(deck)
+        return deck
+
+    @staticmethod
+    def open_series(category, total_tickets, prizes=None, name=None):
+        """Abre uma série da categoria; sem `prizes`, deriva as faixas da configuração da categoria"""
+        if prizes is None:
+            prizes = SeriesService.tiers_from_category(category, total_tickets)
+        prizes = SeriesService.validate_prizes(category, total_tickets, prizes)
+
+        series = TicketSeries(
+            category_id=category.id,
+            name=name,
+            ticket_price=category.price,
+            total_tickets=total_tickets,
+            cursor=0,
+            prizes=prizes,
+            deck=SeriesService.build_deck(total_tickets, prizes).tobytes(),
+            status='open'
+        )
+
+        db.session.add(series)
+        db.session.commit()
+
+        return series
+
+    @staticmethod
+    def close_series(series):
+        """Encerra a venda de uma série aberta"""
+        if series.status != 'open':
+            raise ValueError('A série não está aberta')
+
+        series.status = 'closed'
+        series.closed_at = datetime.utcnow()
+        db.session.commit()
+
+        SeriesService._forget(series.id)
+        return series
+
+    @staticmethod
+    def draw_card(category):
+        """Vende o próximo bilhete da série aberta mais antiga da categoria (sem commit)
+
+        O cursor avança com um único UPDATE atômico; o resultado do bilhete é
+        lido do baralho em memória. Devolve a ScratchCard do bilhete ou None se
+        a categoria não tem série com bilhetes disponíveis.
+        """
+        next_series = db.select(TicketSeries.id).where(
+            TicketSeries.category_id == category.id,
+            TicketSeries.status == 'open',
+            TicketSeries.cursor < TicketSeries.total_tickets
+        ).order_by(TicketSeries.id).limit(1).scalar_subquery()
+
+        sold = db.session.execute(
+            db.update(TicketSeries)
+            .where(TicketSeries.id == next_series, TicketSeries.cursor < TicketSeries.total_tickets)
+            .values(cursor=TicketSeries.cursor + 1)
+            .returning(TicketSeries.id, TicketSeries.cursor, TicketSeries.total_tickets)
+            .execution_options(synchronize_session=False)
+        ).first()
+
+        if sold is None:
+            return None
+
+        series_id, ticket_number, total_tickets = sold
+        if ticket_number == total_tickets:
+            db.session.execute(
+                db.update(TicketSeries)
+                .where(TicketSeries.id == series_id)
+                .values(status='sold_out', closed_at=datetime.utcnow())
+                .execution_options(synchronize_session=False)
+            )
+
+        deck, prize_cents, probability = SeriesService._deck(series_id)
+        prize = prize_cents[deck[ticket_number - 1]]
+        if ticket_number == total_tickets:
+            SeriesService._forget(series_id)
+
+        row = GameEngine.generate_batch(category, 1, outcomes=([prize], probability)).to_rows()[0]
+        scratch_card = ScratchCard(**row, series_id=series_id, ticket_number=ticket_number)
+
+        db.session.add(scratch_card)
+        db.session.flush()  # Para obter o ID da raspadinha
+
+        return scratch_card
+
+    @staticmethod
+    def draw_cards(category, count):
+        """Vende até `count` bilhetes das séries abertas da categoria, em ordem (sem commit)
+
+        Avança o cursor de cada série de uma vez (UPDATE condicional no valor
+        lido) e insere as raspadinhas em massa. Pode devolver menos que `count`
+        se as séries acabarem.
+        """
+        tickets = {}  # series_id -> números dos bilhetes vendidos
+        sold_out = []
+        sold = 0
+
+        while sold < count:
+            series = db.session.execute(
+                db.select(TicketSeries.id, TicketSeries.cursor, TicketSeries.total_tickets).where(
+                    TicketSeries.category_id == category.id,
+                    TicketSeries.status == 'open',
+                    TicketSeries.cursor < TicketSeries.total_tickets
+                ).order_by(TicketSeries.id).limit(1)
+            ).first()
+            if series is None:
+                break
+
+            series_id, cursor, total_tickets = series
+            take = min(count - sold, total_tickets - cursor)
+            values = {'cursor': cursor + take}
+            if cursor + take == total_tickets:
+                values.update(status='sold_out', closed_at=datetime.utcnow())
+
+            updated = db.session.execute(
+                db.update(TicketSeries)
+                .where(TicketSeries.id == series_id, TicketSeries.cursor == cursor)
+                .values(**values)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            if not updated:
+                continue  # Outro processo vendeu antes: lê o cursor de novo
+
+            tickets.setdefault(series_id, []).extend(range(cursor + 1, cursor + take + 1))
+            sold += take
+            if 'status' in values:
+                sold_out.append(series_id)
+
+        rows = []
+        for series_id, numbers in tickets.items():
+            deck, prize_cents, probability = SeriesService._deck(series_id)
+            prizes = prize_cents[deck[np.array(numbers) - 1]]
+
+            batch = GameEngine.generate_batch(category, len(numbers), outcomes=(prizes, probability))
+            for row, number in zip(batch.to_rows(), numbers):
+                rows.append({**row, 'series_id': series_id, 'ticket_number': number})
+
+        # Séries esgotadas não vendem mais: o baralho sai da memória
+        for series_id in sold_out:
+            SeriesService._forget(series_id)
+
+        if not rows:
+            return []
+        # Cada bilhete devolvido traz série e número: a ordem do RETURNING não importa
+        return db.session.scalars(db.insert(ScratchCard).returning(ScratchCard).execution_options(render_nulls=True), rows).all()
+
+    @staticmethod
+    def inspect(series):
+        """Situação da série: bilhetes e prêmios vendidos e restantes por faixa"""
+        deck, prize_cents, _ = SeriesService._deck(series.id)
+        sold = np.bincount(deck[:series.cursor], minlength=len(prize_cents))
+
+        tiers = [{
+            'amount': tier['amount'],
+            'count': tier['count'],
+            'sold': int(sold[i]),
+            'remaining': tier['count'] - int(sold[i])
+        } for i, tier in enumerate(series.prizes, start=1)]
+
+        paid_cents = int((sold * prize_cents).sum())
+        sold_revenue = series.ticket_price * series.cursor
+
+        return {
+            **series.to_dict(),
+            'tiers': tiers,
+            'prizes_paid': paid_cents / 100,
+            'prizes_remaining': sum(tier['amount'] * tier['remaining'] for tier in tiers),
+            'realized_rtp': float(Decimal(paid_cents).scaleb(-2) / sold_revenue) if series.cursor else None
+        }
+
+    @staticmethod
+    def _deck(series_id):
+        """Baralho da série em memória (lido do banco uma vez por processo)
+
+        Cada série nova lida também tira do cache as que deixaram de estar
+        abertas: quem vende o último bilhete esquece o baralho, mas os outros
+        processos que o tinham em memória só descobrem aqui.
+        """
+        cached = SeriesService._decks.get(series_id)
+        if cached is not None:
+            return cached
+
+        cached_ids = list(SeriesService._decks)
+        if cached_ids:
+            still_open = set(db.session.scalars(
+                db.select(TicketSeries.id).where(TicketSeries.id.in_(cached_ids), TicketSeries.status == 'open')
+            ))
+            for stale_id in set(cached_ids) - still_open:
+                SeriesService._forget(stale_id)
+
+        deck, prizes, total_tickets = db.session.execute(
+            db.select(TicketSeries.deck, TicketSeries.prizes, TicketSeries.total_tickets)
+            .where(TicketSeries.id == series_id)
+        ).one()
+
+        prize_cents = np.array([0] + [round(tier['amount'] * 100) for tier in prizes], dtype=np.int64)
+        probability = sum(tier['count'] for tier in prizes) / total_tickets
+        cached = (np.frombuffer(deck, dtype=np.uint8), prize_cents, probability)
+
+        with SeriesService._decks_lock:
+            SeriesService._decks[series_id] = cached
+        return cached
+
+    @staticmethod
+    def _forget(series_id):
+        with SeriesService._decks_lock:
+            SeriesService._decks.pop(series_id, None)
@@ -0,0 +1,346 @@
+from src.models.user import db, User
+from src.models.game import Game
+from src.models.transaction import Transaction
+from src.models.money import Money
+from src.models.schema import sqlite_trigger
+from datetime import datetime
+from decimal import Decimal
+
+# Tipo da transação -> coluna do resumo mensal
+MONTHLY_COLUMNS = {
+    'deposit': 'deposits',
+    'withdrawal': 'withdrawals',
+    'game_cost': 'games_spent',
+    'prize_payout': 'prizes_won'
+}
+
+class UserMonthlyStats(db.Model):
+    """Totais concluídos do usuário no mês (mês de criação da transação)
+
+    Mantido pelos triggers de `transactions`: a transação conta quando é
+    inserida já concluída ou quando passa a concluída, e sai se deixar de ser.
+    O resumo da carteira vira uma leitura pela chave primária.
+    """
+    __tablename__ = 'user_monthly_stats'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    month = db.Column(db.Date, primary_key=True)  # Primeiro dia do mês
+    deposits = db.Column(Money, nullable=False, default=Decimal('0.00'))
+    withdrawals = db.Column(Money, nullable=False, default=Decimal('0.00'))
+    games_spent = db.Column(Money, nullable=False, default=Decimal('0.00'))
+    prizes_won = db.Column(Money, nullable=False, default=Decimal('0.00'))
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<UserMonthlyStats User:{self.user_id} {self.month}>'
+
+    def to_dict(self):
+        return {
+            'deposits': float(self.deposits),
+            'withdrawals': float(self.withdrawals),
+            'games_spent': float(self.games_spent),
+            'prizes_won': float(self.prizes_won),
+            'net_result': float(self.prizes_won) - float(self.games_spent)
+        }
+
+def _monthly_upsert(sign):
+    """UPSERT do resumo mensal a partir de NEW (corpo dos triggers de transactions)"""
+    values = ', '.join(
+        f"CASE WHEN NEW.type = '{kind}' THEN {sign}NEW.amount ELSE 0 END" for kind in MONTHLY_COLUMNS
+    )
+    updates = ', '.join(
+        f'{column} = {column} + excluded.{column}' for column in MONTHLY_COLUMNS.values()
+    )
+    return f"""
+    INSERT INTO user_monthly_stats (user_id, month, {', '.join(MONTHLY_COLUMNS.values())}, updated_at)
+    VALUES (NEW.user_id, date(COALESCE(NEW.created_at, CURRENT_TIMESTAMP), 'start of month'), {values}, CURRENT_TIMESTAMP)
+    ON CONFLICT (user_id, month) DO UPDATE SET {updates}, updated_at = excluded.updated_at;
+    """
+
+_MONTHLY_TYPES = ', '.join(f"'{kind}'" for kind in MONTHLY_COLUMNS)
+
+# Os triggers ficam junto da tabela do resumo: são criados quando ela é criada, também em bancos antigos
+sqlite_trigger(UserMonthlyStats.__table__, f"""
+CREATE TRIGGER transactions_monthly_stats_insert AFTER INSERT ON transactions
+WHEN NEW.status = 'completed' AND NEW.type IN ({_MONTHLY_TYPES})
+BEGIN
+    {_monthly_upsert('')}
+END
+""")
+
+sqlite_trigger(UserMonthlyStats.__table__, f"""
+CREATE TRIGGER transactions_monthly_stats_completed AFTER UPDATE OF status ON transactions
+WHEN NEW.status = 'completed' AND OLD.status IS NOT 'completed' AND NEW.type IN ({_MONTHLY_TYPES})
+BEGIN
+    {_monthly_upsert('')}
+END
+""")
+
+sqlite_trigger(UserMonthlyStats.__table__, f"""
+CREATE TRIGGER transactions_monthly_stats_reverted AFTER UPDATE OF status ON transactions
+WHEN OLD.status = 'completed' AND NEW.status IS NOT 'completed' AND NEW.type IN ({_MONTHLY_TYPES})
+BEGIN
+    {_monthly_upsert('-')}
+END
+""")
+
+class UserStats(db.Model):
+    """Totais de jogo do usuário em todo o histórico (listagem e detalhes do admin)
+
+    Mantido pelos triggers de `games` (jogos, vitórias, maior prêmio e última
+    jogada, inclusive jogos grátis) e de `transactions` (custo pago e prêmios
+    creditados, só o que está concluído), que cobrem a jogada avulsa, o lote
+    e o pagamento do prêmio na mesma transação da jogada.
+    """
+    __tablename__ = 'user_stats'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    games = db.Column(db.Integer, nullable=False, default=0)
+    wins = db.Column(db.Integer, nullable=False, default=0)
+    spent = db.Column(Money, nullable=False, default=Decimal('0.00'))  # Custo dos jogos pagos (extrato)
+    won = db.Column(Money, nullable=False, default=Decimal('0.00'))  # Prêmios creditados (extrato)
+    biggest_win = db.Column(Money, nullable=False, default=Decimal('0.00'))
+    last_played_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    user = db.relationship('User', backref=db.backref('stats', uselist=False, cascade='all, delete-orphan'))
+
+    def __repr__(self):
+        return f'<UserStats User:{self.user_id}>'
+
+    def to_dict(self):
+        # Usuário que nunca jogou não tem linha: um UserStats novo (sem valores) vale zero
+        return {
+            'total_games': self.games or 0,
+            'total_wins': self.wins or 0,
+            'total_spent': float(self.spent or 0),
+            'total_won': float(self.won or 0),
+            'biggest_win': float(self.biggest_win or 0),
+            'last_played_at': self.last_played_at.isoformat() if self.last_played_at else None
+        }
+
+# Os triggers são criados junto com esta tabela e precisam de `games` e `transactions` já criadas
+for source in (Game, Transaction):
+    UserStats.__table__.add_is_dependent_on(source.__table__)
+
+# Tipo da transação -> coluna dos totais do usuário
+USER_STATS_COLUMNS = {
+    'game_cost': 'spent',
+    'prize_payout': 'won'
+}
+
+sqlite_trigger(UserStats.__table__, """
+CREATE TRIGGER games_user_stats_insert AFTER INSERT ON games
+BEGIN
+    INSERT INTO user_stats (user_id, games, wins, spent, won, biggest_win, last_played_at, updated_at)
+    VALUES (
+        NEW.user_id, 1, COALESCE(NEW.prize_won, 0) > 0, 0, 0, COALESCE(NEW.prize_won, 0),
+        COALESCE(NEW.played_at, CURRENT_TIMESTAMP), CURRENT_TIMESTAMP
+    )
+    ON CONFLICT (user_id) DO UPDATE SET
+        games = games + 1,
+        wins = wins + excluded.wins,
+        biggest_win = max(biggest_win, excluded.biggest_win),
+        last_played_at = max(COALESCE(last_played_at, excluded.last_played_at), excluded.last_played_at),
+        updated_at = excluded.updated_at;
+END
+""")
+
+def _user_stats_upsert(sign):
+    """UPSERT dos totais do usuário a partir de NEW (corpo dos triggers de transactions)"""
+    values = ', '.join(
+        f"CASE WHEN NEW.type = '{kind}' THEN {sign}NEW.amount ELSE 0 END" for kind in USER_STATS_COLUMNS
+    )
+    updates = ', '.join(
+        f'{column} = {column} + excluded.{column}' for column in USER_STATS_COLUMNS.values()
+    )
+    return f"""
+    INSERT INTO user_stats (user_id, games, wins, {', '.join(USER_STATS_COLUMNS.values())}, biggest_win, updated_at)
+    VALUES (NEW.user_id, 0, 0, {values}, 0, CURRENT_TIMESTAMP)
+    ON CONFLICT (user_id) DO UPDATE SET {updates}, updated_at = excluded.updated_at;
+    """
+
+_USER_STATS_TYPES = ', '.join(f"'{kind}'" for kind in USER_STATS_COLUMNS)
+
+sqlite_trigger(UserStats.__table__, f"""
+CREATE TRIGGER transactions_user_stats_insert AFTER INSERT ON transactions
+WHEN NEW.status = 'completed' AND NEW.type IN ({_USER_STATS_TYPES})
+BEGIN
+    {_user_stats_upsert('')}
+END
+""")
+
+sqlite_trigger(UserStats.__table__, f"""
+CREATE TRIGGER transactions_user_stats_completed AFTER UPDATE OF status ON transactions
+WHEN NEW.status = 'completed' AND OLD.status IS NOT 'completed' AND NEW.type IN ({_USER_STATS_TYPES})
+BEGIN
+    {_user_stats_upsert('')}
+END
+""")
+
+sqlite_trigger(UserStats.__table__, f"""
+CREATE TRIGGER transactions_user_stats_reverted AFTER UPDATE OF status ON transactions
+WHEN OLD.status = 'completed' AND NEW.status IS NOT 'completed' AND NEW.type IN ({_USER_STATS_TYPES})
+BEGIN
+    {_user_stats_upsert('-')}
+END
+""")
+
+class StatsService:
+    """Leitura e reconstrução dos resumos agregados de transações"""
+
+    @staticmethod
+    def monthly_summary(user_id, at=None):
+        """Resumo do mês de `at` (padrão: mês atual) para o usuário"""
+        month = (at or datetime.utcnow()).date().replace(day=1)
+        stats = db.session.get(UserMonthlyStats, (user_id, month))
+        if not stats:
+            return {**{column: 0.0 for column in MONTHLY_COLUMNS.values()}, 'net_result': 0.0}
+        return stats.to_dict()
+
+    @staticmethod
+    def rebuild_monthly_range(executor, first=None, last=None):
+        """Recalcula os meses dos usuários com id entre `first` e `last` (None: todos)
+
+        `executor` é a sessão ou uma conexão; como nos totais por usuário, o
+        DELETE vem primeiro e pega o lock de escrita. Devolve as linhas gravadas.
+        """
+        def in_range(column):
+            return [column.between(first, last)] if first is not None else []
+
+        month = db.func.date(Transaction.created_at, 'start of month')
+        sums = [
+            db.func.coalesce(db.func.sum(
+                db.case((Transaction.type == kind, Transaction.amount), else_=0)
+            ), 0)
+            for kind in MONTHLY_COLUMNS
+        ]
+
+        executor.execute(db.delete(UserMonthlyStats).where(*in_range(UserMonthlyStats.user_id)))
+        return executor.execute(
+            db.insert(UserMonthlyStats).from_select(
+                ['user_id', 'month', *MONTHLY_COLUMNS.values(), 'updated_at'],
+                db.select(Transaction.user_id, month, *sums, db.literal(datetime.utcnow(), db.DateTime))
+                .where(
+                    *in_range(Transaction.user_id),
+                    Transaction.status == 'completed',
+                    Transaction.type.in_(MONTHLY_COLUMNS)
+                )
+                .group_by(Transaction.user_id, month)
+            )
+        ).rowcount
+
+    @staticmethod
+    def rebuild_monthly(chunk_size=1000, report=None):
+        """Recalcula o resumo mensal a partir do extrato, em lotes de `chunk_size` usuários
+
+        Cada lote apaga e regrava os meses dos seus usuários em uma única
+        transação de escrita, então pode rodar com a aplicação no ar: os
+        triggers não somam em dobro nem se perdem. Pode ser interrompido e
+        executado de novo. Devolve (usuários, linhas gravadas).
+        """
+        last_id = 0
+        users = 0
+        written = 0
+
+        while True:
+            user_ids = db.session.execute(
+                db.select(User.id).where(User.id > last_id).order_by(User.id).limit(chunk_size)
+            ).scalars().all()
+            # Encerra a leitura: o lote começa pelo DELETE, que pega o lock de escrita
+            db.session.commit()
+            if not user_ids:
+                break
+
+            first, last = user_ids[0], user_ids[-1]
+            written += StatsService.rebuild_monthly_range(db.session, first, last)
+            db.session.commit()
+
+            users += len(user_ids)
+            last_id = last
+            if report:
+                report(users, written, last_id)
+
+        return users, written
+
+    @staticmethod
+    def rebuild_user_stats_range(executor, first=None, last=None):
+        """Recalcula os totais dos usuários com id entre `first` e `last` (None: todos)
+
+        `executor` é a sessão ou uma conexão. O DELETE vem primeiro e pega o
+        lock de escrita, então os totais lidos em seguida já incluem tudo o
+        que foi gravado antes e nenhum trigger soma no intervalo até o commit.
+        Devolve as linhas gravadas.
+        """
+        def in_range(column):
+            return [column.between(first, last)] if first is not None else []
+
+        executor.execute(db.delete(UserStats).where(*in_range(UserStats.user_id)))
+
+        rows = {}
+
+        def row(user_id):
+            return rows.setdefault(user_id, {
+                'user_id': user_id, 'games': 0, 'wins': 0, 'spent': 0, 'won': 0, 'biggest_win': 0, 'last_played_at': None
+            })
+
+        prize = db.func.coalesce(Game.prize_won, 0)
+        for user_id, games, wins, biggest_win, last_played_at in executor.execute(
+            db.select(
+                Game.user_id, db.func.count(), db.func.sum(db.case((prize > 0, 1), else_=0)),
+                db.func.max(prize), db.func.max(Game.played_at)
+            )
+            .where(*in_range(Game.user_id))
+            .group_by(Game.user_id)
+        ):
+            row(user_id).update(games=games, wins=wins, biggest_win=biggest_win, last_played_at=last_played_at)
+
+        for user_id, *sums in executor.execute(
+            db.select(Transaction.user_id, *[
+                db.func.coalesce(db.func.sum(db.case((Transaction.type == kind, Transaction.amount), else_=0)), 0)
+                for kind in USER_STATS_COLUMNS
+            ])
+            .where(
+                *in_range(Transaction.user_id),
+                Transaction.status == 'completed',
+                Transaction.type.in_(USER_STATS_COLUMNS)
+            )
+            .group_by(Transaction.user_id)
+        ):
+            row(user_id).update(zip(USER_STATS_COLUMNS.values(), sums))
+
+        if rows:
+            now = datetime.utcnow()
+            executor.execute(db.insert(UserStats), [{**values, 'updated_at': now} for values in rows.values()])
+        return len(rows)
+
+    @staticmethod
+    def rebuild_user_stats(chunk_size=1000, report=None):
+        """Recalcula os totais de jogo dos usuários a partir de jogos e extrato, em lotes de `chunk_size` usuários
+
+        Como no resumo mensal, cada lote é uma transação de escrita e o comando
+        pode rodar com a aplicação no ar. Devolve (usuários, linhas gravadas).
+        """
+        last_id = 0
+        users = 0
+        written = 0
+
+        while True:
+            user_ids = db.session.execute(
+                db.select(User.id).where(User.id > last_id).order_by(User.id).limit(chunk_size)
+            ).scalars().all()
+            # Encerra a leitura: o lote começa pelo DELETE, que pega o lock de escrita
+            db.session.commit()
+            if not user_ids:
+                break
+
+            first, last = user_ids[0], user_ids[-1]
+            written += StatsService.rebuild_user_stats_range(db.session, first, last)
+            db.session.commit()
+
+            users += len(user_ids)
+            last_id = last
+            if report:
+                report(users, written, last_id)
+
+        return users, written
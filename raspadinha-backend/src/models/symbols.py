@@ -0,0 +1,137 @@
+from src.models.user import db
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from datetime import datetime
+import hashlib
+import json
+import threading
+
+class SymbolSet(db.Model):
+    """Tabela de símbolos usada para codificar raspadinhas (imutável depois de criada)
+
+    As raspadinhas guardam índices nesta tabela em vez dos emojis; uma mudança
+    nos símbolos da categoria cria outro conjunto e não altera as já geradas.
+    """
+    __tablename__ = 'symbol_sets'
+
+    id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(40), unique=True, nullable=False)  # sha1 do conteúdo, para reaproveitar o conjunto
+    symbols = db.Column(db.JSON, nullable=False)
+    rule_type = db.Column(db.String(30))  # Vai para winning_combination['rule']; NULL em raspadinhas antigas
+    bonus_symbol = db.Column(db.SmallInteger)  # Índice do símbolo de bônus, se houver
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # id -> SymbolSet e conteúdo -> id, preenchidos sob demanda (conjuntos nunca mudam). Só entram
+    # conjuntos já confirmados: um criado em uma transação desfeita não existe, e o SQLite
+    # reaproveita o id dele para o próximo conjunto novo.
+    _by_id = {}
+    _by_content = {}
+    _cache_lock = threading.Lock()
+
+    def __repr__(self):
+        return f'<SymbolSet {self.id} ({len(self.symbols)} símbolos)>'
+
+    @staticmethod
+    def content_key(symbols, rule_type=None, bonus_symbol=None):
+        payload = json.dumps([list(symbols), rule_type, bonus_symbol], ensure_ascii=False)
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+    @classmethod
+    def id_for(cls, symbols, rule_type=None, bonus_symbol=None):
+        """ID do conjunto com esse conteúdo, criando-o se ainda não existir (sem commit)
+
+        O ID vai para o cache do processo só quando a transação da sessão for
+        confirmada; até lá fica em session.info.
+        """
+        content = (tuple(symbols), rule_type, bonus_symbol)
+        set_id = cls._by_content.get(content)
+        if set_id is not None:
+            return set_id
+
+        pending = db.session.info.setdefault(PENDING_SYMBOL_SETS, {})
+        if content in pending:
+            return pending[content]
+
+        key = cls.content_key(symbols, rule_type, bonus_symbol)
+        # Outro processo pode criar o mesmo conjunto ao mesmo tempo: a chave única resolve
+        db.session.execute(
+            sqlite_insert(cls).values(
+                key=key, symbols=list(symbols), rule_type=rule_type,
+                bonus_symbol=bonus_symbol, created_at=datetime.utcnow()
+            ).on_conflict_do_nothing(index_elements=['key'])
+        )
+        set_id = db.session.execute(db.select(cls.id).where(cls.key == key)).scalar_one()
+
+        pending[content] = set_id
+        return set_id
+
+    @classmethod
+    def lookup(cls, set_id):
+        """Conjunto pelo ID (lido do banco uma vez por processo); ValueError se não existir"""
+        symbol_set = cls._by_id.get(set_id)
+        if symbol_set is None:
+            symbol_set = db.session.get(cls, set_id)
+            if symbol_set is None:
+                raise ValueError(f'Conjunto de símbolos {set_id} não encontrado')
+            # Criado na transação atual, ainda sem commit: não vai para o cache
+            if set_id in db.session.info.get(PENDING_SYMBOL_SETS, {}).values():
+                return symbol_set
+            db.session.expunge(symbol_set)
+            with cls._cache_lock:
+                cls._by_id[set_id] = symbol_set
+        return symbol_set
+
+    @classmethod
+    def reset_cache(cls):
+        """Esquece os conjuntos em memória (ex.: após trocar de banco)"""
+        with cls._cache_lock:
+            cls._by_id.clear()
+            cls._by_content.clear()
+
+# Chave em session.info dos conjuntos criados na transação atual: conteúdo -> id
+PENDING_SYMBOL_SETS = 'pending_symbol_sets'
+
+@event.listens_for(Session, 'after_commit')
+def _cache_committed_symbol_sets(session):
+    pending = session.info.pop(PENDING_SYMBOL_SETS, None)
+    if pending:
+        with SymbolSet._cache_lock:
+            SymbolSet._by_content.update(pending)
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _forget_rolled_back_symbol_sets(session, previous_transaction):
+    session.info.pop(PENDING_SYMBOL_SETS, None)
+
+def positions_to_mask(positions):
+    """Posições do grid (0..8) -> máscara de bits"""
+    mask = 0
+    for position in positions:
+        mask |= 1 << position
+    return mask
+
+def mask_to_positions(mask):
+    """Máscara de bits -> posições do grid em ordem crescente"""
+    return [position for position in range(9) if mask >> position & 1]
+
+def decode_combination(symbol_set, winning_symbol, winning_mask, multiplier, bonus_free_games):
+    """Monta winning_combination (formato da API) a partir das colunas codificadas"""
+    combination = None
+
+    if winning_symbol is not None:
+        combination = {
+            'symbol': symbol_set.symbols[winning_symbol],
+            'positions': mask_to_positions(winning_mask)
+        }
+        if symbol_set.rule_type:
+            combination['rule'] = symbol_set.rule_type
+        if multiplier and multiplier > 1:
+            combination['multiplier'] = multiplier
+    if bonus_free_games:
+        combination = combination or {}
+        combination['bonus'] = {
+            'symbol': symbol_set.symbols[symbol_set.bonus_symbol],
+            'free_games': bonus_free_games
+        }
+
+    return combination
@@ -1,6 +1,10 @@
 from src.models.user import db
+from src.models.jobs import JobQueue
+from src.models.limits import LimitService
+from src.models.money import Money, to_decimal
 from datetime import datetime
 from decimal import Decimal
+import uuid
 
 class Transaction(db.Model):
     __tablename__ = 'transactions'
@@ -8,14 +12,34 @@ class Transaction(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     type = db.Column(db.String(20), nullable=False)  # deposit, withdrawal, game_cost, prize_payout
-    amount = db.Column(db.Numeric(10, 2), nullable=False)
-    status = db.Column(db.String(20), default='pending')  # pending, completed, failed, cancelled
+    amount = db.Column(Money, nullable=False)
+    status = db.Column(db.String(20), default='pending')  # pending, processing (saque), completed, failed, cancelled
     payment_method = db.Column(db.String(50))  # pix, credit_card, bonus
     external_transaction_id = db.Column(db.String(255))  # ID do gateway de pagamento
     description = db.Column(db.Text)
     extra_data = db.Column(db.JSON)  # Dados adicionais específicos do tipo
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     processed_at = db.Column(db.DateTime)
+    locked_by = db.Column(db.String(50))  # Worker de saques que reservou o saque (processing)
+    locked_until = db.Column(db.DateTime)  # Prazo da reserva; depois disso outro worker retoma
+
+    __table_args__ = (
+        # Chave de idempotência dos eventos do gateway (webhook); NULL em jogos e prêmios
+        db.Index(
+            'ix_transactions_external_id', 'external_transaction_id', unique=True,
+            sqlite_where=db.text('external_transaction_id IS NOT NULL')
+        ),
+        # Extrato do usuário (paginado por (created_at, id): o SQLite guarda o id no fim de todo índice)
+        # e reconstrução dos resumos por faixa de usuários
+        db.Index('ix_transactions_user_created', 'user_id', 'created_at'),
+        # Listagem de todas as transações no admin, paginada por (created_at, id)
+        db.Index('ix_transactions_created', 'created_at', 'id'),
+        # Fila e métricas de saques (só os saques entram no índice)
+        db.Index(
+            'ix_transactions_withdrawals', 'status', 'processed_at',
+            sqlite_where=db.text("type = 'withdrawal'")
+        ),
+    )
 
     def __repr__(self):
         return f'<Transaction {self.id} {self.type} {self.amount}>'
@@ -30,9 +54,8 @@ class Transaction(db.Model):
         self.status = 'failed'
         self.processed_at = datetime.utcnow()
         if reason:
-            if not self.extra_data:
-                self.extra_data = {}
-            self.extra_data['failure_reason'] = reason
+            # Novo dicionário: alterar o JSON no lugar não é detectado pelo SQLAlchemy
+            self.extra_data = {**(self.extra_data or {}), 'failure_reason': reason}
 
     def to_dict(self):
         return {
@@ -52,24 +75,38 @@ class Transaction(db.Model):
 class PaymentService:
     """Serviço para processamento de pagamentos"""
     
+    PIX_SIMULATION_DELAY = 2  # Segundos até a aprovação simulada do PIX
+    
     @staticmethod
     def create_deposit(user_id, amount, payment_method='pix'):
-        """Cria uma transação de depósito"""
+        """Cria uma transação de depósito (conta no limite de depósito do nível do usuário)"""
+        from src.models.user import User
+        
+        user = db.session.get(User, user_id)
+        LimitService.reserve(user, 'deposit', amount)
+        
         transaction = Transaction(
             user_id=user_id,
             type='deposit',
-            amount=Decimal(str(amount)),
+            amount=to_decimal(amount),
             payment_method=payment_method,
+            # txid do PIX (em produção, viria do gateway); chave de idempotência do webhook
+            external_transaction_id=uuid.uuid4().hex if payment_method == 'pix' else None,
             description=f'Depósito via {payment_method.upper()}'
         )
         
         db.session.add(transaction)
-        db.session.commit()
+        db.session.flush()  # Para obter o ID da transação
         
         # TODO: Integrar com gateway de pagamento real
-        # Por enquanto, simula aprovação automática para PIX
+        # Por enquanto, simula aprovação automática para PIX (job na fila, no mesmo commit)
         if payment_method == 'pix':
-            PaymentService._simulate_pix_payment(transaction)
+            JobQueue.enqueue(
+                'pix.confirm_deposit', {'transaction_id': transaction.id},
+                delay=PaymentService.PIX_SIMULATION_DELAY
+            )
+        
+        db.session.commit()
         
         return transaction
     
@@ -78,35 +115,40 @@ class PaymentService:
         """Cria uma transação de saque"""
         from src.models.wallet import Wallet
         
-        wallet = Wallet.query.filter_by(user_id=user_id).first()
+        from src.models.user import User
+        
+        # Limites de saque do nível do usuário (contador atualizado no mesmo commit). O UPSERT
+        # abre a transação de escrita: daqui até o commit, nenhum outro saque do banco é gravado
+        LimitService.reserve(db.session.get(User, user_id), 'withdrawal', amount)
+        
+        # Saldo e saques em aberto lidos já com o lock: dois pedidos simultâneos não comprometem o mesmo saldo
+        wallet = Wallet.query.filter_by(user_id=user_id).populate_existing().first()
         if not wallet or not wallet.can_withdraw(amount):
+            db.session.rollback()
             raise ValueError("Saldo insuficiente para saque")
         
         transaction = Transaction(
             user_id=user_id,
             type='withdrawal',
-            amount=Decimal(str(amount)),
+            amount=to_decimal(amount),
             payment_method='pix',
             description=f'Saque via PIX',
             extra_data={'pix_key': pix_key}
         )
         
+        # Fica pendente até o worker de saques (src.models.payout) debitar e pagar em lote
         db.session.add(transaction)
         db.session.commit()
         
-        # TODO: Integrar com gateway de pagamento real
-        # Por enquanto, simula processamento automático
-        PaymentService._process_withdrawal(transaction)
-        
         return transaction
     
     @staticmethod
     def create_game_transaction(user_id, amount, game_id, is_bonus=False):
-        """Cria uma transação de custo de jogo"""
+        """Cria uma transação de custo de jogo (sem commit; faz parte da transação da jogada)"""
         transaction = Transaction(
             user_id=user_id,
             type='game_cost',
-            amount=Decimal(str(amount)),
+            amount=to_decimal(amount),
             payment_method='bonus' if is_bonus else 'wallet',
             description=f'Jogo de raspadinha #{game_id}',
             extra_data={'game_id': game_id, 'is_bonus': is_bonus}
@@ -114,17 +156,16 @@ class PaymentService:
         
         db.session.add(transaction)
         transaction.mark_as_completed()
-        db.session.commit()
         
         return transaction
     
     @staticmethod
     def create_prize_transaction(user_id, amount, game_id):
-        """Cria uma transação de pagamento de prêmio"""
+        """Cria uma transação de pagamento de prêmio (sem commit; faz parte da transação da jogada)"""
         transaction = Transaction(
             user_id=user_id,
             type='prize_payout',
-            amount=Decimal(str(amount)),
+            amount=to_decimal(amount),
             payment_method='wallet',
             description=f'Prêmio do jogo #{game_id}',
             extra_data={'game_id': game_id}
@@ -132,49 +173,186 @@ class PaymentService:
         
         db.session.add(transaction)
         transaction.mark_as_completed()
-        db.session.commit()
         
         return transaction
     
     @staticmethod
-    def _simulate_pix_payment(transaction):
-        """Simula processamento de pagamento PIX"""
-        import time
-        import threading
-        
-        def process_payment():
-            # Simula delay de processamento
-            time.sleep(2)
-            
-            # Atualiza saldo do usuário
-            from src.models.wallet import Wallet
-            wallet = Wallet.query.filter_by(user_id=transaction.user_id).first()
-            if wallet:
-                wallet.add_balance(float(transaction.amount))
-                wallet.total_deposited += transaction.amount
-                transaction.mark_as_completed()
-                db.session.commit()
-        
-        # Processa em background
-        thread = threading.Thread(target=process_payment)
-        thread.start()
+    def create_play_transactions(user_id, games, is_bonus=False):
+        """Custo e prêmio de vários jogos em um único insert em massa (sem commit)"""
+        now = datetime.utcnow()
+        rows = []
+        
+        for game in games:
+            rows.append({
+                'user_id': user_id,
+                'type': 'game_cost',
+                'amount': Decimal('0.00') if is_bonus else to_decimal(game.amount_paid),
+                'status': 'completed',
+                'payment_method': 'bonus' if is_bonus else 'wallet',
+                'description': f'Jogo de raspadinha #{game.id}',
+                'extra_data': {'game_id': game.id, 'is_bonus': is_bonus},
+                'created_at': now,
+                'processed_at': now
+            })
+            if game.prize_won and game.prize_won > 0:
+                rows.append({
+                    'user_id': user_id,
+                    'type': 'prize_payout',
+                    'amount': to_decimal(game.prize_won),
+                    'status': 'completed',
+                    'payment_method': 'wallet',
+                    'description': f'Prêmio do jogo #{game.id}',
+                    'extra_data': {'game_id': game.id},
+                    'created_at': now,
+                    'processed_at': now
+                })
+        
+        if rows:
+            db.session.execute(db.insert(Transaction), rows)
+        
+        return len(rows)
     
     @staticmethod
-    def _process_withdrawal(transaction):
-        """Processa saque"""
+    def confirm_deposit(transaction_id):
+        """Aprova um depósito pendente e credita a carteira (sem commit)
+        
+        A transição pending -> completed é um UPDATE condicional, então
+        confirmações repetidas (job, webhook reenviado) creditam uma vez só.
+        Devolve True se esta chamada aprovou o depósito.
+        """
         from src.models.wallet import Wallet
         
-        try:
-            wallet = Wallet.query.filter_by(user_id=transaction.user_id).first()
-            if wallet and wallet.can_withdraw(float(transaction.amount)):
-                wallet.subtract_balance(float(transaction.amount), use_bonus_first=False)
-                wallet.total_withdrawn += transaction.amount
-                transaction.mark_as_completed()
-                db.session.commit()
+        approved = db.session.execute(
+            db.update(Transaction)
+            .where(Transaction.id == transaction_id, Transaction.type == 'deposit', Transaction.status == 'pending')
+            .values(status='completed', processed_at=datetime.utcnow())
+            .returning(Transaction.user_id, Transaction.amount)
+            .execution_options(synchronize_session=False)
+        ).first()
+        if approved is None:
+            return False
+        
+        user_id, amount = approved
+        wallet = Wallet.query.filter_by(user_id=user_id).first()
+        if not wallet:
+            raise ValueError('Carteira não encontrada')
+        
+        wallet.add_balance(amount, entry_type='deposit', reference=f'transaction:{transaction_id}')
+        return True
+    
+    @staticmethod
+    def apply_pix_events(events):
+        """Aplica um lote de eventos do gateway PIX em uma única transação (sem commit)
+        
+        Cada evento é {'external_transaction_id', 'status': approved|rejected,
+        'amount' opcional}. As transições pending -> completed/failed são UPDATEs
+        condicionais pela chave de idempotência, então eventos reenviados, ou o
+        mesmo lote entregue duas vezes ao mesmo tempo, aplicam cada depósito uma
+        vez só. Devolve um resultado por evento, na ordem recebida: applied,
+        duplicate (já estava nesse estado), conflict (já estava no outro estado),
+        amount_mismatch ou not_found.
+        """
+        from src.models.wallet import Wallet
+        
+        results = [None] * len(events)
+        first = {}  # chave -> índice do primeiro evento com ela no lote
+        for i, event in enumerate(events):
+            key = event['external_transaction_id']
+            if key in first:
+                results[i] = 'duplicate'
+            else:
+                first[key] = i
+        
+        found = {
+            row.external_transaction_id: row
+            for row in db.session.execute(
+                db.select(Transaction.id, Transaction.external_transaction_id, Transaction.amount)
+                .where(Transaction.external_transaction_id.in_(first), Transaction.type == 'deposit')
+            )
+        }
+        
+        to_approve, to_reject = [], []
+        for key, i in first.items():
+            event = events[i]
+            transaction = found.get(key)
+            if transaction is None:
+                results[i] = 'not_found'
+            elif event.get('amount') is not None and Decimal(str(event['amount'])) != transaction.amount:
+                results[i] = 'amount_mismatch'
+            else:
+                (to_approve if event['status'] == 'approved' else to_reject).append(key)
+        
+        now = datetime.utcnow()
+        pending = [Transaction.type == 'deposit', Transaction.status == 'pending']
+        
+        approved = db.session.execute(
+            db.update(Transaction)
+            .where(Transaction.external_transaction_id.in_(to_approve), *pending)
+            .values(status='completed', processed_at=now)
+            .returning(Transaction.id, Transaction.external_transaction_id, Transaction.user_id, Transaction.amount)
+            .execution_options(synchronize_session=False)
+        ).all() if to_approve else []
+        
+        rejected = db.session.execute(
+            db.update(Transaction)
+            .where(Transaction.external_transaction_id.in_(to_reject), *pending)
+            .values(
+                status='failed', processed_at=now,
+                extra_data=db.func.json_set(
+                    db.func.coalesce(Transaction.extra_data, db.literal_column("'{}'")),
+                    '$.failure_reason', 'Pagamento rejeitado'
+                )
+            )
+            .returning(Transaction.external_transaction_id, Transaction.user_id, Transaction.amount, Transaction.created_at)
+            .execution_options(synchronize_session=False)
+        ).all() if to_reject else []
+        
+        # Depósito recusado deixa de contar no limite
+        for row in rejected:
+            LimitService.release(row.user_id, 'deposit', row.amount, row.created_at)
+        rejected = [row.external_transaction_id for row in rejected]
+        
+        # Crédito dos depósitos aprovados agora (um lançamento no razão por depósito)
+        wallets = {
+            wallet.user_id: wallet
+            for wallet in Wallet.query.filter(Wallet.user_id.in_({row.user_id for row in approved})).all()
+        } if approved else {}
+        for row in approved:
+            wallet = wallets.get(row.user_id)
+            if not wallet:
+                raise ValueError('Carteira não encontrada')
+            wallet.add_balance(row.amount, entry_type='deposit', reference=f'transaction:{row.id}')
+        
+        applied = {row.external_transaction_id for row in approved} | set(rejected)
+        target = {key: 'completed' for key in to_approve}
+        target.update({key: 'failed' for key in to_reject})
+        
+        # Os não aplicados já tinham saído de pending (reenvio ou outro lote ao mesmo tempo)
+        current = dict(db.session.execute(
+            db.select(Transaction.external_transaction_id, Transaction.status)
+            .where(Transaction.external_transaction_id.in_(set(target) - applied))
+        ).all()) if set(target) - applied else {}
+        
+        for key, status in target.items():
+            if key in applied:
+                results[first[key]] = 'applied'
             else:
-                transaction.mark_as_failed("Saldo insuficiente")
-                db.session.commit()
-        except Exception as e:
-            transaction.mark_as_failed(str(e))
-            db.session.commit()
+                results[first[key]] = 'duplicate' if current.get(key) == status else 'conflict'
+        
+        return [
+            {
+                'external_transaction_id': event['external_transaction_id'],
+                'transaction_id': found[event['external_transaction_id']].id if event['external_transaction_id'] in found else None,
+                'result': result
+            }
+            for event, result in zip(events, results)
+        ]
+
+@JobQueue.handler('pix.confirm_deposit')
+def _confirm_deposit_job(payload):
+    PaymentService.confirm_deposit(payload['transaction_id'])
 
+@JobQueue.handler('withdrawal.process')
+def _process_withdrawal_job(payload):
+    # Jobs de saque enfileirados antes do worker de saques: ele já drena todos os pendentes
+    pass
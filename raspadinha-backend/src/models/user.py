@@ -2,7 +2,8 @@ from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
 import bcrypt
 
-db = SQLAlchemy()
+# expire_on_commit=False: após o commit os objetos não são recarregados do banco
+db = SQLAlchemy(session_options={'expire_on_commit': False})
 
 class User(db.Model):
     __tablename__ = 'users'
@@ -30,6 +31,13 @@ class User(db.Model):
     transactions = db.relationship('Transaction', backref='user', lazy=True, cascade='all, delete-orphan')
     bonuses = db.relationship('Bonus', backref='user', lazy=True, cascade='all, delete-orphan')
 
+    __table_args__ = (
+        # Listagem do admin paginada por (created_at, id)
+        db.Index('ix_users_created', 'created_at', 'id'),
+        # Contagem de jogadores ativos (estatísticas públicas e painel)
+        db.Index('ix_users_status', 'status'),
+    )
+
     def __repr__(self):
         return f'<User {self.email}>'
 
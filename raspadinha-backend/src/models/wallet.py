@@ -1,4 +1,7 @@
 from src.models.user import db
+from src.models.money import Money, money
+from sqlalchemy import func
+from sqlalchemy.orm.attributes import set_committed_value
 from datetime import datetime
 from decimal import Decimal
 
@@ -7,13 +10,19 @@ class Wallet(db.Model):
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    balance = db.Column(db.Numeric(10, 2), default=Decimal('0.00'))
-    bonus_balance = db.Column(db.Numeric(10, 2), default=Decimal('0.00'))
-    total_deposited = db.Column(db.Numeric(10, 2), default=Decimal('0.00'))
-    total_withdrawn = db.Column(db.Numeric(10, 2), default=Decimal('0.00'))
+    balance = db.Column(Money, default=Decimal('0.00'))
+    bonus_balance = db.Column(Money, default=Decimal('0.00'))
+    total_deposited = db.Column(Money, default=Decimal('0.00'))
+    total_withdrawn = db.Column(Money, default=Decimal('0.00'))
+    ledger_seq = db.Column(db.Integer, default=0)  # Último lançamento do razão refletido nos saldos
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    __table_args__ = (
+        # Carteira do usuário: lida em toda jogada, depósito e saque
+        db.Index('ix_wallets_user', 'user_id'),
+    )
+
     def __repr__(self):
         return f'<Wallet User:{self.user_id} Balance:{self.balance}>'
 
@@ -21,37 +30,80 @@ class Wallet(db.Model):
         """Retorna o saldo total (principal + bônus)"""
         return float(self.balance) + float(self.bonus_balance)
 
-    def add_balance(self, amount, is_bonus=False):
-        """Adiciona saldo à carteira"""
-        if is_bonus:
-            self.bonus_balance += Decimal(str(amount))
-        else:
-            self.balance += Decimal(str(amount))
-        self.updated_at = datetime.utcnow()
+    def add_balance(self, amount, is_bonus=False, entry_type='adjustment', reference=None):
+        """Credita a carteira com um lançamento no razão (sem commit)
+        
+        O INSERT do lançamento atualiza o retrato em `wallets` no mesmo
+        comando; entry_type='deposit' também soma em total_deposited.
+        """
+        self._post(
+            entry_type, reference,
+            balance_delta=0 if is_bonus else amount,
+            bonus_delta=amount if is_bonus else 0
+        )
 
-    def subtract_balance(self, amount, use_bonus_first=True):
-        """Remove saldo da carteira, usando bônus primeiro se especificado"""
-        amount = Decimal(str(amount))
+    def subtract_balance(self, amount, use_bonus_first=True, entry_type='adjustment', reference=None):
+        """Debita a carteira com um lançamento no razão, usando bônus primeiro se especificado
         
-        if use_bonus_first and self.bonus_balance > 0:
-            if self.bonus_balance >= amount:
-                self.bonus_balance -= amount
-                amount = Decimal('0')
-            else:
-                amount -= self.bonus_balance
-                self.bonus_balance = Decimal('0')
+        O lançamento é calculado e gravado em um único comando condicional: só
+        debita se houver saldo suficiente no momento da escrita, então débitos
+        concorrentes (outros workers ou threads) nunca deixam o saldo negativo
+        nem se perdem. entry_type='withdrawal' também soma em total_withdrawn.
+        """
+        if use_bonus_first:
+            from_bonus = func.min(Wallet.bonus_balance, money(amount))
+            posted = self._post(
+                entry_type, reference,
+                balance_delta=from_bonus - amount,
+                bonus_delta=-from_bonus,
+                condition=Wallet.balance + Wallet.bonus_balance >= amount
+            )
+        else:
+            posted = self._post(
+                entry_type, reference,
+                balance_delta=-amount,
+                bonus_delta=0,
+                condition=Wallet.balance >= amount
+            )
         
-        if amount > 0:
-            if self.balance >= amount:
-                self.balance -= amount
-            else:
-                raise ValueError("Saldo insuficiente")
+        if not posted:
+            raise ValueError("Saldo insuficiente")
+
+    def _post(self, entry_type, reference, balance_delta, bonus_delta, condition=None):
+        """Grava o lançamento e copia para o objeto os saldos resultantes; False se não gravou"""
+        from src.models.ledger import LedgerService
         
-        self.updated_at = datetime.utcnow()
+        row = LedgerService.post(self.id, entry_type, balance_delta, bonus_delta, condition, reference)
+        if row is None:
+            return False
+        
+        # Valores já gravados: atualiza o objeto sem marcá-lo como alterado
+        seq, balance, bonus_balance = row
+        set_committed_value(self, 'ledger_seq', seq)
+        set_committed_value(self, 'balance', balance)
+        set_committed_value(self, 'bonus_balance', bonus_balance)
+        # Totais e data mudaram pelo trigger: recarregados quando forem lidos
+        db.session.expire(self, ['total_deposited', 'total_withdrawn', 'updated_at'])
+        return True
+
+    def outstanding_withdrawals(self):
+        """Soma dos saques pedidos que o worker ainda não debitou (pending, ou processing sem débito)"""
+        from src.models.transaction import Transaction
+
+        return db.session.query(func.coalesce(func.sum(Transaction.amount), 0)).filter(
+            Transaction.user_id == self.user_id,
+            Transaction.type == 'withdrawal',
+            Transaction.status.in_(('pending', 'processing')),
+            Transaction.processed_at.is_(None)
+        ).scalar()
 
     def can_withdraw(self, amount):
-        """Verifica se é possível sacar o valor (apenas saldo principal)"""
-        return float(self.balance) >= float(amount)
+        """Verifica se é possível sacar o valor (apenas saldo principal)
+
+        O saque só é debitado quando o worker o paga: os saques ainda não
+        debitados já comprometem o saldo.
+        """
+        return float(self.balance) - float(self.outstanding_withdrawals()) >= float(amount)
 
     def to_dict(self):
         return {
@@ -1,15 +1,27 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, current_app, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from marshmallow import Schema, fields, validate, ValidationError
 from datetime import datetime, timedelta
 from decimal import Decimal
-from sqlalchemy import func, and_, or_
+from sqlalchemy import and_, or_
 
 from src.models.user import db, User
 from src.models.wallet import Wallet
-from src.models.game import ScratchCardCategory, ScratchCard, Game
+from src.models.game import ScratchCardCategory, ScratchCard, Game, GameEngine, PrizeTable
 from src.models.transaction import Transaction
 from src.models.bonus import Bonus, Mission
+from src.models.play import PlayPipeline, BatchPlayPipeline
+from src.models.pool import CardPool
+from src.models.series import TicketSeries, SeriesService
+from src.models.rules import WinRule
+from src.models.ledger import LedgerEntry, LedgerService
+from src.models.jobs import Job, JobQueue
+from src.models.limits import LimitPolicy, LimitService
+from src.models.payout import PayoutService
+from src.models.metrics import MetricsService, DEFAULT_SPANS, SERIES_COLUMNS, HOUR, DAY
+from src.models.stats import UserStats
+from src.models.pagination import keyset_paginate, parse_utc
+from src.models.export import ExportService, FORMATS
 
 admin_bp = Blueprint('admin', __name__)
 
@@ -19,7 +31,7 @@ def admin_required(f):
     
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        current_user_id = get_jwt_identity()
+        current_user_id = int(get_jwt_identity())
         user = User.query.get(current_user_id)
         
         # Por simplicidade, vamos considerar que usuários com ID 1 são admins
@@ -37,109 +49,13 @@ def admin_required(f):
 def get_dashboard():
     """Dashboard principal com estatísticas gerais"""
     try:
-        # Período para análise (últimos 30 dias)
-        thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-        today = datetime.utcnow().date()
-        yesterday = today - timedelta(days=1)
-        
-        # Usuários
-        total_users = User.query.filter_by(status='active').count()
-        new_users_today = User.query.filter(
-            func.date(User.created_at) == today
-        ).count()
-        new_users_month = User.query.filter(
-            User.created_at >= thirty_days_ago
-        ).count()
-        
-        # Jogos
-        total_games = Game.query.count()
-        games_today = Game.query.filter(
-            func.date(Game.played_at) == today
-        ).count()
-        games_yesterday = Game.query.filter(
-            func.date(Game.played_at) == yesterday
-        ).count()
-        
-        # Receita
-        total_revenue = db.session.query(func.sum(Transaction.amount)).filter(
-            Transaction.type == 'game_cost',
-            Transaction.status == 'completed'
-        ).scalar() or 0
-        
-        revenue_today = db.session.query(func.sum(Transaction.amount)).filter(
-            Transaction.type == 'game_cost',
-            Transaction.status == 'completed',
-            func.date(Transaction.created_at) == today
-        ).scalar() or 0
-        
-        revenue_month = db.session.query(func.sum(Transaction.amount)).filter(
-            Transaction.type == 'game_cost',
-            Transaction.status == 'completed',
-            Transaction.created_at >= thirty_days_ago
-        ).scalar() or 0
-        
-        # Prêmios distribuídos
-        total_prizes = db.session.query(func.sum(Transaction.amount)).filter(
-            Transaction.type == 'prize_payout',
-            Transaction.status == 'completed'
-        ).scalar() or 0
-        
-        prizes_today = db.session.query(func.sum(Transaction.amount)).filter(
-            Transaction.type == 'prize_payout',
-            Transaction.status == 'completed',
-            func.date(Transaction.created_at) == today
-        ).scalar() or 0
-        
-        # Margem de lucro
-        profit_margin = ((float(total_revenue) - float(total_prizes)) / float(total_revenue) * 100) if total_revenue > 0 else 0
-        
-        # Depósitos e saques
-        total_deposits = db.session.query(func.sum(Transaction.amount)).filter(
-            Transaction.type == 'deposit',
-            Transaction.status == 'completed'
-        ).scalar() or 0
-        
-        total_withdrawals = db.session.query(func.sum(Transaction.amount)).filter(
-            Transaction.type == 'withdrawal',
-            Transaction.status == 'completed'
-        ).scalar() or 0
-        
-        # Transações pendentes
-        pending_withdrawals = Transaction.query.filter_by(
-            type='withdrawal',
-            status='pending'
-        ).count()
+        # Montado a partir dos baldes agregados por hora/dia e guardado em cache por alguns segundos
+        dashboard = MetricsService.dashboard(
+            ttl=current_app.config.get('DASHBOARD_CACHE_TTL', 30),
+            refresh=request.args.get('refresh', 'false').lower() == 'true'
+        )
         
-        return jsonify({
-            'dashboard': {
-                'users': {
-                    'total': total_users,
-                    'new_today': new_users_today,
-                    'new_month': new_users_month
-                },
-                'games': {
-                    'total': total_games,
-                    'today': games_today,
-                    'yesterday': games_yesterday,
-                    'growth': ((games_today - games_yesterday) / games_yesterday * 100) if games_yesterday > 0 else 0
-                },
-                'revenue': {
-                    'total': float(total_revenue),
-                    'today': float(revenue_today),
-                    'month': float(revenue_month)
-                },
-                'prizes': {
-                    'total': float(total_prizes),
-                    'today': float(prizes_today)
-                },
-                'profit_margin': round(profit_margin, 2),
-                'financial': {
-                    'total_deposits': float(total_deposits),
-                    'total_withdrawals': float(total_withdrawals),
-                    'pending_withdrawals': pending_withdrawals
-                }
-            }
-        }), 200
+        return jsonify({'dashboard': dashboard}), 200
         
     except Exception as e:
         return jsonify({'error': 'Erro interno do servidor'}), 500
@@ -150,18 +66,21 @@ def get_dashboard():
 def get_users():
     """Listar usuários com filtros"""
     try:
-        # Parâmetros de filtro
-        page = request.args.get('page', 1, type=int)
+        # Parâmetros de filtro e paginação (cursor da página anterior; total só se pedido)
+        cursor = request.args.get('cursor')
         per_page = request.args.get('per_page', 50, type=int)
+        with_total = request.args.get('include_total', 'false').lower() == 'true'
         status = request.args.get('status')
         search = request.args.get('search')
         
-        # Query base
-        query = User.query
+        # Usuários, carteiras e totais de jogo em uma única consulta
+        query = User.query.outerjoin(User.wallet).outerjoin(User.stats).options(
+            db.contains_eager(User.wallet), db.contains_eager(User.stats)
+        )
         
         # Aplicar filtros
         if status:
-            query = query.filter_by(status=status)
+            query = query.filter(User.status == status)
         
         if search:
             query = query.filter(
@@ -172,53 +91,26 @@ def get_users():
                 )
             )
         
-        # Ordenar por data de criação (mais recentes primeiro)
-        query = query.order_by(User.created_at.desc())
-        
-        # Paginação
-        users_paginated = query.paginate(
-            page=page, per_page=per_page, error_out=False
-        )
+        # Paginação por chave (created_at, id), mais recentes primeiro
+        page = keyset_paginate(query, User.created_at, User.id, cursor, per_page, with_total)
         
-        # Adicionar dados da carteira para cada usuário
         users_data = []
-        for user in users_paginated.items:
+        for user in page.items:
             user_dict = user.to_dict()
             user_dict['wallet'] = user.wallet.to_dict() if user.wallet else None
             
-            # Estatísticas do usuário
-            total_games = Game.query.filter_by(user_id=user.id).count()
-            total_spent = db.session.query(func.sum(Transaction.amount)).filter(
-                Transaction.user_id == user.id,
-                Transaction.type == 'game_cost',
-                Transaction.status == 'completed'
-            ).scalar() or 0
-            total_won = db.session.query(func.sum(Transaction.amount)).filter(
-                Transaction.user_id == user.id,
-                Transaction.type == 'prize_payout',
-                Transaction.status == 'completed'
-            ).scalar() or 0
-            
-            user_dict['stats'] = {
-                'total_games': total_games,
-                'total_spent': float(total_spent),
-                'total_won': float(total_won)
-            }
+            # Estatísticas do usuário (mantidas pelos triggers de jogos e extrato)
+            user_dict['stats'] = (user.stats or UserStats()).to_dict()
             
             users_data.append(user_dict)
         
         return jsonify({
             'users': users_data,
-            'pagination': {
-                'page': page,
-                'per_page': per_page,
-                'total': users_paginated.total,
-                'pages': users_paginated.pages,
-                'has_next': users_paginated.has_next,
-                'has_prev': users_paginated.has_prev
-            }
+            'pagination': page.to_dict()
         }), 200
         
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': 'Erro interno do servidor'}), 500
 
@@ -254,12 +146,7 @@ def get_user_details(user_id):
         
         # Estatísticas detalhadas
         stats = {
-            'total_games': Game.query.filter_by(user_id=user_id).count(),
-            'total_wins': Game.query.filter(
-                Game.user_id == user_id,
-                Game.prize_won > 0
-            ).count(),
-            'biggest_win': db.session.query(func.max(Game.prize_won)).filter_by(user_id=user_id).scalar() or 0,
+            **(user.stats or UserStats()).to_dict(),
             'total_deposited': user.wallet.total_deposited if user.wallet else 0,
             'total_withdrawn': user.wallet.total_withdrawn if user.wallet else 0
         }
@@ -304,21 +191,62 @@ def update_user_status(user_id):
         db.session.rollback()
         return jsonify({'error': 'Erro interno do servidor'}), 500
 
+@admin_bp.route('/users/<int:user_id>/ledger', methods=['GET'])
+@jwt_required()
+@admin_required
+def get_user_ledger(user_id):
+    """Razão da carteira: saldos em uma data (?at=ISO) ou após um lançamento (?seq=N) e últimos lançamentos"""
+    try:
+        wallet = Wallet.query.filter_by(user_id=user_id).first()
+        if not wallet:
+            return jsonify({'error': 'Carteira não encontrada'}), 404
+        
+        at = request.args.get('at')
+        seq = request.args.get('seq', type=int)
+        limit = min(request.args.get('limit', 50, type=int), 500)
+        
+        try:
+            at = parse_utc(at) if at else None
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        snapshot_seq, balance, bonus_balance = LedgerService.balance_at(wallet.id, at=at, seq=seq)
+        
+        entries = LedgerEntry.query.filter(
+            LedgerEntry.wallet_id == wallet.id,
+            LedgerEntry.seq <= snapshot_seq
+        ).order_by(LedgerEntry.seq.desc()).limit(limit).all()
+        
+        return jsonify({
+            'wallet': wallet.to_dict(),
+            'as_of': {
+                'seq': snapshot_seq,
+                'balance': float(balance),
+                'bonus_balance': float(bonus_balance)
+            },
+            'problems': LedgerService.verify(wallet),
+            'entries': [entry.to_dict() for entry in entries]
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': 'Erro interno do servidor'}), 500
+
 @admin_bp.route('/transactions', methods=['GET'])
 @jwt_required()
 @admin_required
 def get_all_transactions():
     """Listar todas as transações"""
     try:
-        # Parâmetros de filtro
-        page = request.args.get('page', 1, type=int)
+        # Parâmetros de filtro e paginação (cursor da página anterior; total só se pedido)
+        cursor = request.args.get('cursor')
         per_page = request.args.get('per_page', 50, type=int)
+        with_total = request.args.get('include_total', 'false').lower() == 'true'
         transaction_type = request.args.get('type')
         status = request.args.get('status')
         user_id = request.args.get('user_id', type=int)
         
-        # Query base
-        query = Transaction.query
+        # Query base, já com os usuários (sem uma consulta por transação)
+        query = Transaction.query.options(db.selectinload(Transaction.user))
         
         # Aplicar filtros
         if transaction_type:
@@ -328,33 +256,66 @@ def get_all_transactions():
         if user_id:
             query = query.filter_by(user_id=user_id)
         
-        # Ordenar por data (mais recentes primeiro)
-        query = query.order_by(Transaction.created_at.desc())
-        
-        # Paginação
-        transactions_paginated = query.paginate(
-            page=page, per_page=per_page, error_out=False
-        )
+        # Paginação por chave (created_at, id), mais recentes primeiro
+        page = keyset_paginate(query, Transaction.created_at, Transaction.id, cursor, per_page, with_total)
         
         # Adicionar dados do usuário para cada transação
         transactions_data = []
-        for transaction in transactions_paginated.items:
+        for transaction in page.items:
             transaction_dict = transaction.to_dict()
             transaction_dict['user'] = transaction.user.to_dict() if transaction.user else None
             transactions_data.append(transaction_dict)
         
         return jsonify({
             'transactions': transactions_data,
-            'pagination': {
-                'page': page,
-                'per_page': per_page,
-                'total': transactions_paginated.total,
-                'pages': transactions_paginated.pages,
-                'has_next': transactions_paginated.has_next,
-                'has_prev': transactions_paginated.has_prev
-            }
+            'pagination': page.to_dict()
         }), 200
         
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': 'Erro interno do servidor'}), 500
+
+@admin_bp.route('/export/<dataset>', methods=['GET'])
+@jwt_required()
+@admin_required
+def export_dataset(dataset):
+    """Exportação em fluxo de transações, jogos ou usuários
+    
+    ?format=csv|ndjson&gzip=true&start=ISO&end=ISO&type=&status=&user_id=&category_id=&loyalty_level=
+    """
+    try:
+        fmt = request.args.get('format', 'csv')
+        compress = request.args.get('gzip', 'false').lower() == 'true'
+        
+        try:
+            start = parse_utc(request.args['start']) if request.args.get('start') else None
+            end = parse_utc(request.args['end']) if request.args.get('end') else None
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        # Um id ilegível é erro, e não um filtro a menos: a exportação sairia com as linhas de todos
+        filters = {}
+        for name in ('type', 'status', 'user_id', 'category_id', 'loyalty_level'):
+            value = request.args.get(name)
+            if value and name.endswith('_id'):
+                if not value.isdigit():
+                    return jsonify({'error': f"Parâmetro '{name}' inválido"}), 400
+                value = int(value)
+            filters[name] = value or None
+        
+        # Consulta e formato validados antes do primeiro byte: depois disso o erro não vira mais um 400
+        query = ExportService.query(dataset, start, end, **filters)
+        chunks = ExportService.stream(query, fmt, compress, current_app.config.get('EXPORT_CHUNK_SIZE', 5000))
+        
+        return Response(
+            stream_with_context(chunks),
+            mimetype='application/gzip' if compress else FORMATS[fmt],
+            headers={'Content-Disposition': f'attachment; filename="{ExportService.filename(dataset, fmt, compress)}"'}
+        )
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': 'Erro interno do servidor'}), 500
 
@@ -366,29 +327,25 @@ def get_admin_categories():
     try:
         categories = ScratchCardCategory.query.all()
         
-        # Adicionar estatísticas para cada categoria
+        # Estatísticas de todas as categorias pelos contadores por faixa de prêmio (sem passar pelos jogos)
+        totals = MetricsService.category_stats()
+        
         categories_data = []
         for category in categories:
             category_dict = category.to_dict()
-            
-            # Estatísticas da categoria
-            total_games = Game.query.join(ScratchCard).filter(
-                ScratchCard.category_id == category.id
-            ).count()
-            
-            total_revenue = db.session.query(func.sum(Game.amount_paid)).join(ScratchCard).filter(
-                ScratchCard.category_id == category.id
-            ).scalar() or 0
-            
-            total_prizes = db.session.query(func.sum(Game.prize_won)).join(ScratchCard).filter(
-                ScratchCard.category_id == category.id
-            ).scalar() or 0
+            stats = totals.get(category.id, {})
+            total_revenue = float(stats.get('total_revenue', 0))
+            total_prizes = float(stats.get('total_prizes', 0))
             
             category_dict['stats'] = {
-                'total_games': total_games,
-                'total_revenue': float(total_revenue),
-                'total_prizes': float(total_prizes),
-                'profit_margin': ((float(total_revenue) - float(total_prizes)) / float(total_revenue) * 100) if total_revenue > 0 else 0
+                'total_games': stats.get('total_games', 0),
+                'total_winners': stats.get('total_winners', 0),
+                'total_revenue': total_revenue,
+                'total_prizes': total_prizes,
+                'profit_margin': ((total_revenue - total_prizes) / total_revenue * 100) if total_revenue > 0 else 0,
+                'rtp': total_prizes / total_revenue if total_revenue > 0 else 0,
+                'expected_rtp': GameEngine.expected_rtp(category),
+                'tiers': stats.get('tiers', [])
             }
             
             categories_data.append(category_dict)
@@ -424,58 +381,128 @@ def toggle_category_status(category_id):
         db.session.rollback()
         return jsonify({'error': 'Erro interno do servidor'}), 500
 
+@admin_bp.route('/categories/<int:category_id>/prize-table', methods=['PUT'])
+@jwt_required()
+@admin_required
+def update_category_prize_table(category_id):
+    """Atualizar a tabela de faixas de prêmio da categoria (null volta ao padrão)"""
+    try:
+        category = ScratchCardCategory.query.get(category_id)
+        if not category:
+            return jsonify({'error': 'Categoria não encontrada'}), 404
+        
+        data = request.json or {}
+        prize_table = data.get('prize_table')
+        
+        try:
+            PrizeTable.validate_config(prize_table)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        category.prize_table = prize_table
+        category.updated_at = datetime.utcnow()
+        db.session.commit()
+        
+        # Tabela compilada e raspadinhas pré-geradas usam a configuração antiga
+        PrizeTable.invalidate(category.id)
+        CardPool.discard(category.id)
+        
+        return jsonify({
+            'message': 'Tabela de prêmios atualizada com sucesso',
+            'category': category.to_dict(),
+            'tiers': [
+                {'prize': prize, 'probability': probability}
+                for prize, probability in GameEngine._prize_distribution(category)
+            ],
+            'expected_rtp': GameEngine.expected_rtp(category)
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Erro interno do servidor'}), 500
+
+@admin_bp.route('/categories/<int:category_id>/win-rules', methods=['PUT'])
+@jwt_required()
+@admin_required
+def update_category_win_rules(category_id):
+    """Atualizar a regra de vitória da categoria"""
+    try:
+        category = ScratchCardCategory.query.get(category_id)
+        if not category:
+            return jsonify({'error': 'Categoria não encontrada'}), 404
+        
+        data = request.json or {}
+        win_rules = data.get('win_rules')
+        
+        if not isinstance(win_rules, dict):
+            return jsonify({'error': 'Regra inválida'}), 400
+        try:
+            WinRule(win_rules, category.symbols)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        category.win_rules = win_rules
+        category.updated_at = datetime.utcnow()
+        db.session.commit()
+        
+        # Regra compilada e raspadinhas pré-geradas usam a configuração antiga
+        WinRule.invalidate(category.id)
+        CardPool.discard(category.id)
+        
+        return jsonify({
+            'message': 'Regra de vitória atualizada com sucesso',
+            'category': category.to_dict()
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Erro interno do servidor'}), 500
+
+@admin_bp.route('/cards/<int:card_id>/verify', methods=['GET'])
+@jwt_required()
+@admin_required
+def verify_scratch_card(card_id):
+    """Auditar uma raspadinha contra a regra de vitória da categoria"""
+    try:
+        scratch_card = ScratchCard.query.get(card_id)
+        if not scratch_card:
+            return jsonify({'error': 'Raspadinha não encontrada'}), 404
+        
+        try:
+            result = GameEngine.verify_card(scratch_card)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        return jsonify({
+            'scratch_card': scratch_card.to_dict(),
+            'valid': result['valid'],
+            'evaluation': result['evaluation']
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': 'Erro interno do servidor'}), 500
+
 @admin_bp.route('/analytics/revenue', methods=['GET'])
 @jwt_required()
 @admin_required
 def get_revenue_analytics():
-    """Analytics de receita por período"""
+    """Analytics de receita por período (baldes diários)"""
     try:
         # Parâmetros
         days = request.args.get('days', 30, type=int)
-        start_date = datetime.utcnow() - timedelta(days=days)
-        
-        # Receita por dia
-        daily_revenue = db.session.query(
-            func.date(Transaction.created_at).label('date'),
-            func.sum(Transaction.amount).label('revenue')
-        ).filter(
-            Transaction.type == 'game_cost',
-            Transaction.status == 'completed',
-            Transaction.created_at >= start_date
-        ).group_by(func.date(Transaction.created_at)).all()
-        
-        # Prêmios por dia
-        daily_prizes = db.session.query(
-            func.date(Transaction.created_at).label('date'),
-            func.sum(Transaction.amount).label('prizes')
-        ).filter(
-            Transaction.type == 'prize_payout',
-            Transaction.status == 'completed',
-            Transaction.created_at >= start_date
-        ).group_by(func.date(Transaction.created_at)).all()
-        
-        # Converter para dicionários para facilitar o merge
-        revenue_dict = {str(item.date): float(item.revenue) for item in daily_revenue}
-        prizes_dict = {str(item.date): float(item.prizes) for item in daily_prizes}
-        
-        # Combinar dados
-        analytics_data = []
-        current_date = start_date.date()
-        end_date = datetime.utcnow().date()
-        
-        while current_date <= end_date:
-            date_str = str(current_date)
-            revenue = revenue_dict.get(date_str, 0)
-            prizes = prizes_dict.get(date_str, 0)
-            
-            analytics_data.append({
-                'date': date_str,
-                'revenue': revenue,
-                'prizes': prizes,
-                'profit': revenue - prizes
-            })
-            
-            current_date += timedelta(days=1)
+        now = datetime.utcnow()
+        
+        try:
+            points = MetricsService.series(DAY, now - timedelta(days=days), now, ('revenue', 'prizes'), now=now)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        analytics_data = [{
+            'date': point['bucket'][:10],
+            'revenue': point['revenue'],
+            'prizes': point['prizes'],
+            'profit': point['revenue'] - point['prizes']
+        } for point in points]
         
         return jsonify({
             'analytics': analytics_data
@@ -484,3 +511,312 @@ def get_revenue_analytics():
     except Exception as e:
         return jsonify({'error': 'Erro interno do servidor'}), 500
 
+@admin_bp.route('/analytics/series', methods=['GET'])
+@jwt_required()
+@admin_required
+def get_metric_series():
+    """Série temporal das métricas da plataforma por minuto, hora ou dia
+    
+    ?granularity=minute|hour|day&start=ISO&end=ISO&metrics=games,revenue,...
+    """
+    try:
+        granularity = request.args.get('granularity', HOUR)
+        if granularity not in DEFAULT_SPANS:
+            return jsonify({'error': f"Granularidade inválida: use {', '.join(DEFAULT_SPANS)}"}), 400
+        
+        try:
+            end = parse_utc(request.args['end']) if request.args.get('end') else datetime.utcnow()
+            start = parse_utc(request.args['start']) if request.args.get('start') else end - DEFAULT_SPANS[granularity]
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        metrics = request.args.get('metrics')
+        metrics = tuple(metric.strip() for metric in metrics.split(',')) if metrics else SERIES_COLUMNS
+        
+        try:
+            points = MetricsService.series(granularity, start, end, metrics)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        compactor = current_app.extensions.get('metrics_compactor')
+        
+        return jsonify({
+            'granularity': granularity,
+            'metrics': list(metrics),
+            'series': points,
+            'compactor': compactor.to_dict() if compactor else None
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': 'Erro interno do servidor'}), 500
+
+@admin_bp.route('/metrics/play', methods=['GET'])
+@jwt_required()
+@admin_required
+def get_play_metrics():
+    """Tempos por etapa do pipeline de jogada (desde o início do processo)"""
+    try:
+        return jsonify({
+            'stages': PlayPipeline.stage_stats(),
+            'batch_stages': BatchPlayPipeline.stage_stats()
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': 'Erro interno do servidor'}), 500
+
+@admin_bp.route('/pools', methods=['GET'])
+@jwt_required()
+@admin_required
+def get_card_pools():
+    """Situação do pool de raspadinhas pré-geradas por categoria"""
+    try:
+        counts = CardPool.available_counts()
+        refiller = current_app.extensions.get('card_pool_refiller')
+        
+        pools = [{
+            'category_id': category.id,
+            'category_name': category.name,
+            'is_active': category.is_active,
+            'available': counts.get(category.id, 0)
+        } for category in ScratchCardCategory.query.all()]
+        
+        return jsonify({
+            'pools': pools,
+            'refiller': refiller.to_dict() if refiller else None
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': 'Erro interno do servidor'}), 500
+
+@admin_bp.route('/pools/<int:category_id>/refill', methods=['POST'])
+@jwt_required()
+@admin_required
+def refill_card_pool(category_id):
+    """Gera imediatamente raspadinhas para o pool de uma categoria"""
+    try:
+        category = ScratchCardCategory.query.get(category_id)
+        if not category:
+            return jsonify({'error': 'Categoria não encontrada'}), 404
+        
+        data = request.json or {}
+        count = data.get('count', current_app.config['CARD_POOL_HIGH_WATERMARK'])
+        
+        if not isinstance(count, int) or count < 1 or count > 100000:
+            return jsonify({'error': 'Quantidade inválida'}), 400
+        
+        created = CardPool.refill(category, count, current_app.config['CARD_POOL_BATCH_SIZE'])
+        
+        return jsonify({
+            'message': f'{created} raspadinhas adicionadas ao pool',
+            'available': CardPool.available_counts().get(category_id, 0)
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Erro interno do servidor'}), 500
+
+@admin_bp.route('/series', methods=['GET'])
+@jwt_required()
+@admin_required
+def get_ticket_series():
+    """Listar séries de bilhetes"""
+    try:
+        category_id = request.args.get('category_id', type=int)
+        status = request.args.get('status')
+        
+        query = TicketSeries.query
+        if category_id:
+            query = query.filter_by(category_id=category_id)
+        if status:
+            query = query.filter_by(status=status)
+        
+        series = query.order_by(TicketSeries.id.desc()).all()
+        
+        return jsonify({'series': [item.to_dict() for item in series]}), 200
+        
+    except Exception as e:
+        return jsonify({'error': 'Erro interno do servidor'}), 500
+
+@admin_bp.route('/categories/<int:category_id>/series', methods=['POST'])
+@jwt_required()
+@admin_required
+def open_ticket_series(category_id):
+    """Abrir uma série de bilhetes (sem 'prizes', usa a distribuição da categoria)"""
+    try:
+        category = ScratchCardCategory.query.get(category_id)
+        if not category:
+            return jsonify({'error': 'Categoria não encontrada'}), 404
+        
+        data = request.json or {}
+        
+        try:
+            series = SeriesService.open_series(
+                category, data.get('total_tickets'), data.get('prizes'), data.get('name')
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        return jsonify({
+            'message': 'Série aberta com sucesso',
+            'series': series.to_dict()
+        }), 201
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Erro interno do servidor'}), 500
+
+@admin_bp.route('/series/<int:series_id>', methods=['GET'])
+@jwt_required()
+@admin_required
+def inspect_ticket_series(series_id):
+    """Situação da série: vendidos, restantes e prêmios pagos por faixa"""
+    try:
+        series = TicketSeries.query.get(series_id)
+        if not series:
+            return jsonify({'error': 'Série não encontrada'}), 404
+        
+        return jsonify({'series': SeriesService.inspect(series)}), 200
+        
+    except Exception as e:
+        return jsonify({'error': 'Erro interno do servidor'}), 500
+
+@admin_bp.route('/series/<int:series_id>/close', methods=['POST'])
+@jwt_required()
+@admin_required
+def close_ticket_series(series_id):
+    """Encerrar a venda de uma série"""
+    try:
+        series = TicketSeries.query.get(series_id)
+        if not series:
+            return jsonify({'error': 'Série não encontrada'}), 404
+        
+        try:
+            SeriesService.close_series(series)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        return jsonify({
+            'message': 'Série encerrada com sucesso',
+            'series': series.to_dict()
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Erro interno do servidor'}), 500
+
+@admin_bp.route('/jobs', methods=['GET'])
+@jwt_required()
+@admin_required
+def get_job_queue():
+    """Profundidade e latência da fila de jobs, workers deste processo e jobs mortos recentes"""
+    try:
+        worker_pool = current_app.extensions.get('job_worker_pool')
+        dead_jobs = Job.query.filter_by(status='dead').order_by(Job.finished_at.desc()).limit(20).all()
+        
+        return jsonify({
+            'queue': JobQueue.stats(),
+            'workers': worker_pool.to_dict() if worker_pool else None,
+            'dead_jobs': [job.to_dict() for job in dead_jobs]
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': 'Erro interno do servidor'}), 500
+
+@admin_bp.route('/jobs/<int:job_id>/retry', methods=['POST'])
+@jwt_required()
+@admin_required
+def retry_job(job_id):
+    """Devolver um job morto para a fila"""
+    try:
+        job = Job.query.get(job_id)
+        if not job:
+            return jsonify({'error': 'Job não encontrado'}), 404
+        
+        try:
+            JobQueue.retry(job)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        return jsonify({
+            'message': 'Job reenviado para a fila',
+            'job': job.to_dict()
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Erro interno do servidor'}), 500
+
+@admin_bp.route('/limits', methods=['GET'])
+@jwt_required()
+@admin_required
+def get_limit_policies():
+    """Limites de depósito, saque e perda por nível de fidelidade"""
+    try:
+        policies = LimitPolicy.query.order_by(LimitPolicy.loyalty_level).all()
+        
+        return jsonify({
+            'policies': [policy.to_dict() for policy in policies]
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': 'Erro interno do servidor'}), 500
+
+@admin_bp.route('/limits/<string:loyalty_level>', methods=['PUT'])
+@jwt_required()
+@admin_required
+def update_limit_policy(loyalty_level):
+    """Alterar limites de um nível (null = sem limite)"""
+    try:
+        data = request.json or {}
+        
+        try:
+            policy = LimitService.update_policy(loyalty_level, data.get('limits'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        return jsonify({
+            'message': 'Limites atualizados com sucesso',
+            'policy': policy.to_dict()
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Erro interno do servidor'}), 500
+
+@admin_bp.route('/limits/rebuild', methods=['POST'])
+@jwt_required()
+@admin_required
+def rebuild_limit_counters():
+    """Recalcular os contadores de limite dos períodos correntes a partir do extrato"""
+    try:
+        counters = LimitService.rebuild()
+        
+        return jsonify({
+            'message': 'Contadores recalculados',
+            'counters': counters
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Erro interno do servidor'}), 500
+
+@admin_bp.route('/payouts', methods=['GET'])
+@jwt_required()
+@admin_required
+def get_payouts():
+    """Fila de saques, vazão, tamanho dos lotes e latência do worker de pagamentos
+    
+    `queue` vem do banco e vale para o servidor todo. `worker` são os
+    contadores do worker deste processo (scope 'process'), e fica None nos
+    processos web: o worker roda no processo src.worker.
+    """
+    try:
+        worker = current_app.extensions.get('payout_worker')
+        
+        return jsonify({
+            'queue': PayoutService.stats(),
+            'worker': worker.to_dict() if worker else None
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': 'Erro interno do servidor'}), 500
@@ -180,7 +180,7 @@ def login():
 def refresh():
     """Renovação do token de acesso"""
     try:
-        current_user_id = get_jwt_identity()
+        current_user_id = int(get_jwt_identity())
         new_token = create_access_token(identity=current_user_id)
         
         return jsonify({
@@ -195,7 +195,7 @@ def refresh():
 def get_profile():
     """Obter perfil do usuário"""
     try:
-        current_user_id = get_jwt_identity()
+        current_user_id = int(get_jwt_identity())
         user = User.query.get(current_user_id)
         
         if not user:
@@ -214,7 +214,7 @@ def get_profile():
 def update_profile():
     """Atualizar perfil do usuário"""
     try:
-        current_user_id = get_jwt_identity()
+        current_user_id = int(get_jwt_identity())
         user = User.query.get(current_user_id)
         
         if not user:
@@ -247,7 +247,7 @@ def update_profile():
 def change_password():
     """Alterar senha do usuário"""
     try:
-        current_user_id = get_jwt_identity()
+        current_user_id = int(get_jwt_identity())
         user = User.query.get(current_user_id)
         
         if not user:
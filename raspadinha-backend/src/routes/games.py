@@ -1,14 +1,15 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from marshmallow import Schema, fields, ValidationError
+from marshmallow import Schema, fields, validate, ValidationError
 from datetime import datetime, timedelta
-from decimal import Decimal
 
 from src.models.user import db, User
 from src.models.wallet import Wallet
-from src.models.game import ScratchCardCategory, ScratchCard, Game, GameEngine
-from src.models.transaction import Transaction, PaymentService
-from src.models.bonus import Bonus, BonusService
+from src.models.game import ScratchCardCategory, ScratchCard, Game
+from src.models.transaction import Transaction
+from src.models.bonus import Bonus
+from src.models.play import PlayPipeline, BatchPlayPipeline
+from src.models.pagination import keyset_paginate
 
 games_bp = Blueprint('games', __name__)
 
@@ -17,6 +18,11 @@ class PlayGameSchema(Schema):
     category_id = fields.Int(required=True)
     use_bonus = fields.Bool(load_default=False)
 
+class PlayBatchSchema(Schema):
+    category_id = fields.Int(required=True)
+    count = fields.Int(required=True, validate=validate.Range(min=1, max=50))
+    use_bonus = fields.Bool(load_default=False)
+
 @games_bp.route('/categories', methods=['GET'])
 def get_categories():
     """Listar todas as categorias de raspadinha"""
@@ -55,7 +61,7 @@ def play_game():
         schema = PlayGameSchema()
         data = schema.load(request.json)
         
-        current_user_id = get_jwt_identity()
+        current_user_id = int(get_jwt_identity())
         user = User.query.get(current_user_id)
         
         if not user:
@@ -66,98 +72,73 @@ def play_game():
         if not category or not category.is_active:
             return jsonify({'error': 'Categoria não encontrada'}), 404
         
-        # Verifica se vai usar bônus
-        use_bonus = data.get('use_bonus', False)
-        game_cost = float(category.price)
-        
-        # Verifica saldo
+        # Verifica carteira
         wallet = user.wallet
         if not wallet:
             return jsonify({'error': 'Carteira não encontrada'}), 404
         
-        if use_bonus:
-            # Verifica se tem jogos grátis disponíveis
-            available_bonus = Bonus.query.filter_by(
-                user_id=current_user_id,
-                status='active'
-            ).filter(
-                Bonus.free_games > 0
-            ).filter(
-                db.or_(Bonus.expires_at.is_(None), Bonus.expires_at > datetime.utcnow())
-            ).first()
-            
-            if not available_bonus:
-                return jsonify({'error': 'Nenhum jogo grátis disponível'}), 400
-        else:
-            # Verifica saldo suficiente
-            if wallet.get_total_balance() < game_cost:
-                return jsonify({'error': 'Saldo insuficiente'}), 400
-        
-        # Gera a raspadinha
-        scratch_card = GameEngine.generate_scratch_card(category.id, current_user_id)
-        
-        # Cria o jogo
-        game = Game(
-            user_id=current_user_id,
-            scratch_card_id=scratch_card.id,
-            amount_paid=Decimal(str(game_cost)),
-            prize_won=scratch_card.prize_amount,
-            is_bonus_game=use_bonus
-        )
-        
-        db.session.add(game)
-        db.session.flush()  # Para obter o ID do jogo
-        
-        # Processa pagamento
-        if use_bonus:
-            # Usa jogo grátis
-            available_bonus.free_games -= 1
-            if available_bonus.free_games <= 0:
-                available_bonus.status = 'claimed'
-                available_bonus.claimed_at = datetime.utcnow()
-            
-            # Cria transação de jogo grátis
-            PaymentService.create_game_transaction(
-                current_user_id, 0, game.id, is_bonus=True
-            )
-        else:
-            # Debita da carteira
-            wallet.subtract_balance(game_cost, use_bonus_first=True)
-            
-            # Cria transação de custo do jogo
-            PaymentService.create_game_transaction(
-                current_user_id, game_cost, game.id, is_bonus=False
-            )
-        
-        # Se ganhou, credita o prêmio
-        if scratch_card.is_winner and scratch_card.prize_amount > 0:
-            wallet.add_balance(float(scratch_card.prize_amount))
-            
-            # Cria transação de prêmio
-            PaymentService.create_prize_transaction(
-                current_user_id, float(scratch_card.prize_amount), game.id
-            )
+        # Executa a jogada (validação, raspadinha, débito, extrato, fidelidade e missões) com um único commit
+        pipeline = PlayPipeline(user, category, use_bonus=data.get('use_bonus', False)).run()
+        
+        response = jsonify({
+            'message': 'Jogo realizado com sucesso!',
+            'game': pipeline.game.to_dict(),
+            'scratch_card': pipeline.scratch_card.to_dict(),
+            'wallet': wallet.to_dict(),
+            'card_bonus': pipeline.card_bonus.to_dict() if pipeline.card_bonus else None,
+            'completed_missions': [mission.to_dict() for mission in pipeline.completed_missions]
+        })
+        response.headers['Server-Timing'] = pipeline.server_timing()
+        
+        return response, 200
+        
+    except ValidationError as e:
+        return jsonify({'error': 'Dados inválidos', 'details': e.messages}), 400
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Erro interno do servidor'}), 500
+
+@games_bp.route('/play-batch', methods=['POST'])
+@jwt_required()
+def play_batch():
+    """Comprar e jogar várias raspadinhas da mesma categoria de uma vez"""
+    try:
+        schema = PlayBatchSchema()
+        data = schema.load(request.json)
         
-        # Atualiza pontos de fidelidade (apenas para jogos pagos)
-        if not use_bonus:
-            BonusService.update_loyalty_points(current_user_id, game_cost)
+        current_user_id = int(get_jwt_identity())
+        user = User.query.get(current_user_id)
         
-        # Atualiza missões
-        completed_missions = BonusService.update_user_missions(current_user_id, 'game_played')
+        if not user:
+            return jsonify({'error': 'Usuário não encontrado'}), 404
         
-        if scratch_card.is_winner:
-            prize_missions = BonusService.update_user_missions(current_user_id, 'prize_won')
-            completed_missions.extend(prize_missions)
+        category = ScratchCardCategory.query.get(data['category_id'])
+        if not category or not category.is_active:
+            return jsonify({'error': 'Categoria não encontrada'}), 404
         
-        db.session.commit()
+        wallet = user.wallet
+        if not wallet:
+            return jsonify({'error': 'Carteira não encontrada'}), 404
         
-        return jsonify({
-            'message': 'Jogo realizado com sucesso!',
-            'game': game.to_dict(),
-            'scratch_card': scratch_card.to_dict(),
+        # Um débito, inserts em massa e um único commit para o lote
+        pipeline = BatchPlayPipeline(
+            user, category, data['count'], use_bonus=data.get('use_bonus', False)
+        ).run()
+        
+        response = jsonify({
+            'message': f'{data["count"]} jogos realizados com sucesso!',
+            'games': [game.to_dict() for game in pipeline.games],
+            'total_cost': 0 if pipeline.use_bonus else float(pipeline.total_cost),
+            'total_prize': float(pipeline.total_prize),
             'wallet': wallet.to_dict(),
-            'completed_missions': [mission.to_dict() for mission in completed_missions]
-        }), 200
+            'card_bonuses': [bonus.to_dict() for bonus in pipeline.card_bonuses],
+            'completed_missions': [mission.to_dict() for mission in pipeline.completed_missions]
+        })
+        response.headers['Server-Timing'] = pipeline.server_timing()
+        
+        return response, 200
         
     except ValidationError as e:
         return jsonify({'error': 'Dados inválidos', 'details': e.messages}), 400
@@ -172,32 +153,26 @@ def play_game():
 def get_game_history():
     """Obter histórico de jogos do usuário"""
     try:
-        current_user_id = get_jwt_identity()
+        current_user_id = int(get_jwt_identity())
         
-        # Parâmetros de paginação
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 20, type=int)
+        # Parâmetros de paginação (cursor da página anterior; total só se pedido)
+        cursor = request.args.get('cursor')
+        per_page = request.args.get('per_page', type=int)
+        with_total = request.args.get('include_total', 'false').lower() == 'true'
         
-        # Busca jogos do usuário
-        games_query = Game.query.filter_by(user_id=current_user_id).order_by(Game.played_at.desc())
+        # Busca jogos do usuário, já com as raspadinhas (sem uma consulta por jogo)
+        games_query = Game.query.filter_by(user_id=current_user_id).options(db.selectinload(Game.scratch_card))
         
-        # Paginação
-        games_paginated = games_query.paginate(
-            page=page, per_page=per_page, error_out=False
-        )
+        # Paginação por chave (played_at, id)
+        page = keyset_paginate(games_query, Game.played_at, Game.id, cursor, per_page, with_total)
         
         return jsonify({
-            'games': [game.to_dict() for game in games_paginated.items],
-            'pagination': {
-                'page': page,
-                'per_page': per_page,
-                'total': games_paginated.total,
-                'pages': games_paginated.pages,
-                'has_next': games_paginated.has_next,
-                'has_prev': games_paginated.has_prev
-            }
+            'games': [game.to_dict() for game in page.items],
+            'pagination': page.to_dict()
         }), 200
         
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': 'Erro interno do servidor'}), 500
 
@@ -248,15 +223,15 @@ def get_statistics():
         total_players = User.query.filter_by(status='active').count()
         
         # Prêmios distribuídos hoje
-        today = datetime.utcnow().date()
+        today = datetime.combine(datetime.utcnow().date(), datetime.min.time())
         today_prizes = db.session.query(db.func.sum(Game.prize_won)).filter(
-            db.func.date(Game.played_at) == today,
+            Game.played_at >= today,
             Game.prize_won > 0
         ).scalar() or 0
         
         # Jogos jogados hoje
         today_games = Game.query.filter(
-            db.func.date(Game.played_at) == today
+            Game.played_at >= today
         ).count()
         
         # Maior prêmio da semana
@@ -283,7 +258,7 @@ def get_statistics():
 def get_user_bonuses():
     """Obter bônus disponíveis do usuário"""
     try:
-        current_user_id = get_jwt_identity()
+        current_user_id = int(get_jwt_identity())
         
         # Busca bônus ativos
         active_bonuses = Bonus.query.filter_by(
@@ -10,6 +10,9 @@ from src.models.user import db, User
 from src.models.wallet import Wallet
 from src.models.transaction import Transaction, PaymentService
 from src.models.bonus import BonusService
+from src.models.limits import LimitService
+from src.models.stats import StatsService
+from src.models.pagination import keyset_paginate
 
 wallet_bp = Blueprint('wallet', __name__)
 
@@ -23,6 +26,14 @@ class WithdrawSchema(Schema):
     pix_key = fields.Str(required=True, validate=validate.Length(min=11, max=255))
     pix_key_type = fields.Str(required=True, validate=validate.OneOf(['cpf', 'email', 'phone', 'random']))
 
+class PixEventSchema(Schema):
+    external_transaction_id = fields.Str(required=True, validate=validate.Length(min=1, max=255))
+    status = fields.Str(required=True, validate=validate.OneOf(['approved', 'rejected']))
+    amount = fields.Float(load_default=None)
+
+class PixWebhookBatchSchema(Schema):
+    events = fields.List(fields.Dict(), required=True, validate=validate.Length(min=1, max=5000))
+
 def validate_pix_key(pix_key, pix_key_type):
     """Valida chave PIX baseada no tipo"""
     if pix_key_type == 'cpf':
@@ -47,7 +58,7 @@ def validate_pix_key(pix_key, pix_key_type):
 def get_balance():
     """Obter saldo da carteira"""
     try:
-        current_user_id = get_jwt_identity()
+        current_user_id = int(get_jwt_identity())
         user = User.query.get(current_user_id)
         
         if not user:
@@ -67,6 +78,25 @@ def get_balance():
     except Exception as e:
         return jsonify({'error': 'Erro interno do servidor'}), 500
 
+@wallet_bp.route('/limits', methods=['GET'])
+@jwt_required()
+def get_limits():
+    """Limites de depósito, saque e perda do usuário: limite, usado e disponível por período"""
+    try:
+        current_user_id = int(get_jwt_identity())
+        user = User.query.get(current_user_id)
+        
+        if not user:
+            return jsonify({'error': 'Usuário não encontrado'}), 404
+        
+        return jsonify({
+            'loyalty_level': user.loyalty_level,
+            'limits': LimitService.status(user)
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': 'Erro interno do servidor'}), 500
+
 @wallet_bp.route('/deposit', methods=['POST'])
 @jwt_required()
 def create_deposit():
@@ -76,7 +106,7 @@ def create_deposit():
         schema = DepositSchema()
         data = schema.load(request.json)
         
-        current_user_id = get_jwt_identity()
+        current_user_id = int(get_jwt_identity())
         user = User.query.get(current_user_id)
         
         if not user:
@@ -95,6 +125,7 @@ def create_deposit():
         pix_data = None
         if payment_method == 'pix':
             pix_data = {
+                'txid': transaction.external_transaction_id,
                 'qr_code': f"00020126580014br.gov.bcb.pix0136{uuid.uuid4()}5204000053039865802BR5925RASPADINHA ONLINE LTDA6009SAO PAULO62070503***6304",
                 'pix_key': f"{uuid.uuid4()}",
                 'expires_at': (datetime.utcnow() + timedelta(minutes=15)).isoformat(),
@@ -110,6 +141,8 @@ def create_deposit():
         
     except ValidationError as e:
         return jsonify({'error': 'Dados inválidos', 'details': e.messages}), 400
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': 'Erro interno do servidor'}), 500
 
@@ -122,7 +155,7 @@ def create_withdrawal():
         schema = WithdrawSchema()
         data = schema.load(request.json)
         
-        current_user_id = get_jwt_identity()
+        current_user_id = int(get_jwt_identity())
         user = User.query.get(current_user_id)
         
         if not user:
@@ -141,20 +174,7 @@ def create_withdrawal():
         if not wallet or not wallet.can_withdraw(amount):
             return jsonify({'error': 'Saldo insuficiente para saque'}), 400
         
-        # Verifica limite diário de saque (exemplo: R$ 5.000)
-        today = datetime.utcnow().date()
-        today_withdrawals = db.session.query(db.func.sum(Transaction.amount)).filter(
-            Transaction.user_id == current_user_id,
-            Transaction.type == 'withdrawal',
-            Transaction.status.in_(['pending', 'completed']),
-            db.func.date(Transaction.created_at) == today
-        ).scalar() or 0
-        
-        daily_limit = 5000
-        if float(today_withdrawals) + amount > daily_limit:
-            return jsonify({'error': f'Limite diário de saque excedido (R$ {daily_limit})'}), 400
-        
-        # Cria a transação de saque
+        # Cria a transação de saque (verifica os limites de saque do nível do usuário)
         transaction = PaymentService.create_withdrawal(current_user_id, amount, pix_key)
         
         return jsonify({
@@ -175,13 +195,14 @@ def create_withdrawal():
 def get_transactions():
     """Obter histórico de transações"""
     try:
-        current_user_id = get_jwt_identity()
+        current_user_id = int(get_jwt_identity())
         
-        # Parâmetros de filtro
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 20, type=int)
+        # Parâmetros de filtro e paginação (cursor da página anterior; total só se pedido)
+        cursor = request.args.get('cursor')
+        per_page = request.args.get('per_page', type=int)
+        with_total = request.args.get('include_total', 'false').lower() == 'true'
         transaction_type = request.args.get('type')  # deposit, withdrawal, game_cost, prize_payout
-        status = request.args.get('status')  # pending, completed, failed
+        status = request.args.get('status')  # pending, processing, completed, failed
         
         # Query base
         query = Transaction.query.filter_by(user_id=current_user_id)
@@ -192,26 +213,16 @@ def get_transactions():
         if status:
             query = query.filter_by(status=status)
         
-        # Ordenar por data (mais recentes primeiro)
-        query = query.order_by(Transaction.created_at.desc())
-        
-        # Paginação
-        transactions_paginated = query.paginate(
-            page=page, per_page=per_page, error_out=False
-        )
+        # Paginação por chave (created_at, id), mais recentes primeiro
+        page = keyset_paginate(query, Transaction.created_at, Transaction.id, cursor, per_page, with_total)
         
         return jsonify({
-            'transactions': [transaction.to_dict() for transaction in transactions_paginated.items],
-            'pagination': {
-                'page': page,
-                'per_page': per_page,
-                'total': transactions_paginated.total,
-                'pages': transactions_paginated.pages,
-                'has_next': transactions_paginated.has_next,
-                'has_prev': transactions_paginated.has_prev
-            }
+            'transactions': [transaction.to_dict() for transaction in page.items],
+            'pagination': page.to_dict()
         }), 200
         
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': 'Erro interno do servidor'}), 500
 
@@ -220,7 +231,7 @@ def get_transactions():
 def get_transaction(transaction_id):
     """Obter detalhes de uma transação específica"""
     try:
-        current_user_id = get_jwt_identity()
+        current_user_id = int(get_jwt_identity())
         
         transaction = Transaction.query.filter_by(
             id=transaction_id,
@@ -242,7 +253,7 @@ def get_transaction(transaction_id):
 def get_wallet_summary():
     """Obter resumo da carteira"""
     try:
-        current_user_id = get_jwt_identity()
+        current_user_id = int(get_jwt_identity())
         user = User.query.get(current_user_id)
         
         if not user:
@@ -252,88 +263,94 @@ def get_wallet_summary():
         if not wallet:
             return jsonify({'error': 'Carteira não encontrada'}), 404
         
-        # Estatísticas do mês atual
-        current_month = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        
-        # Depósitos do mês
-        month_deposits = db.session.query(db.func.sum(Transaction.amount)).filter(
-            Transaction.user_id == current_user_id,
-            Transaction.type == 'deposit',
-            Transaction.status == 'completed',
-            Transaction.created_at >= current_month
-        ).scalar() or 0
-        
-        # Saques do mês
-        month_withdrawals = db.session.query(db.func.sum(Transaction.amount)).filter(
-            Transaction.user_id == current_user_id,
-            Transaction.type == 'withdrawal',
-            Transaction.status == 'completed',
-            Transaction.created_at >= current_month
-        ).scalar() or 0
-        
-        # Gastos em jogos do mês
-        month_games = db.session.query(db.func.sum(Transaction.amount)).filter(
-            Transaction.user_id == current_user_id,
-            Transaction.type == 'game_cost',
-            Transaction.status == 'completed',
-            Transaction.created_at >= current_month
-        ).scalar() or 0
-        
-        # Prêmios ganhos do mês
-        month_prizes = db.session.query(db.func.sum(Transaction.amount)).filter(
-            Transaction.user_id == current_user_id,
-            Transaction.type == 'prize_payout',
-            Transaction.status == 'completed',
-            Transaction.created_at >= current_month
-        ).scalar() or 0
+        # Estatísticas do mês atual (resumo mantido a cada transação concluída)
+        monthly_summary = StatsService.monthly_summary(current_user_id)
         
         return jsonify({
             'wallet': wallet.to_dict(),
-            'monthly_summary': {
-                'deposits': float(month_deposits),
-                'withdrawals': float(month_withdrawals),
-                'games_spent': float(month_games),
-                'prizes_won': float(month_prizes),
-                'net_result': float(month_prizes) - float(month_games)
-            }
+            'monthly_summary': monthly_summary
         }), 200
         
     except Exception as e:
         return jsonify({'error': 'Erro interno do servidor'}), 500
 
-# Webhook simulado para confirmação de pagamentos PIX
+# Webhook para confirmação de pagamentos PIX (eventos do gateway, em lote)
 @wallet_bp.route('/webhook/pix', methods=['POST'])
 def pix_webhook():
-    """Webhook para confirmação de pagamentos PIX (simulado)"""
+    """Webhook para confirmação de pagamentos PIX
+    
+    Aceita {'events': [...]} com até 5000 eventos ou um único evento
+    {'external_transaction_id', 'status'}; o formato antigo com
+    'transaction_id' continua aceito. Eventos reenviados não são aplicados de
+    novo; a resposta traz o resultado de cada evento.
+    """
     try:
-        data = request.json
+        data = request.json or {}
         
         # Em produção, validaria a assinatura do webhook
-        transaction_id = data.get('transaction_id')
-        status = data.get('status')  # 'approved', 'rejected'
+        if 'transaction_id' in data:
+            return _legacy_pix_event(data)
+        
+        raw_events = PixWebhookBatchSchema().load(data)['events'] if 'events' in data else [data]
+        
+        # Eventos inválidos não derrubam o lote: recebem o próprio resultado
+        event_schema = PixEventSchema()
+        events, invalid = [], {}
+        for i, raw_event in enumerate(raw_events):
+            try:
+                events.append((i, event_schema.load(raw_event)))
+            except ValidationError as e:
+                invalid[i] = {
+                    'external_transaction_id': raw_event.get('external_transaction_id'),
+                    'transaction_id': None,
+                    'result': 'invalid',
+                    'details': e.messages
+                }
+        
+        applied = PaymentService.apply_pix_events([event for _, event in events]) if events else []
+        db.session.commit()
+        
+        results = dict(invalid)
+        results.update({i: result for (i, _), result in zip(events, applied)})
+        results = [results[i] for i in range(len(raw_events))]
+        
+        summary = {}
+        for result in results:
+            summary[result['result']] = summary.get(result['result'], 0) + 1
         
-        if not transaction_id or not status:
-            return jsonify({'error': 'Dados inválidos'}), 400
-        
-        transaction = Transaction.query.get(transaction_id)
-        if not transaction:
-            return jsonify({'error': 'Transação não encontrada'}), 404
-        
-        if status == 'approved' and transaction.status == 'pending':
-            # Processa o pagamento
-            if transaction.type == 'deposit':
-                wallet = Wallet.query.filter_by(user_id=transaction.user_id).first()
-                if wallet:
-                    wallet.add_balance(float(transaction.amount))
-                    wallet.total_deposited += transaction.amount
-                    transaction.mark_as_completed()
-                    db.session.commit()
-        elif status == 'rejected':
-            transaction.mark_as_failed('Pagamento rejeitado')
-            db.session.commit()
-        
-        return jsonify({'message': 'Webhook processado'}), 200
+        return jsonify({
+            'message': 'Webhook processado',
+            'processed': len(results),
+            'summary': summary,
+            'results': results
+        }), 200
         
+    except ValidationError as e:
+        return jsonify({'error': 'Dados inválidos', 'details': e.messages}), 400
     except Exception as e:
+        db.session.rollback()
         return jsonify({'error': 'Erro interno do servidor'}), 500
 
+def _legacy_pix_event(data):
+    """Evento único identificado pelo ID interno da transação (formato anterior)"""
+    transaction_id = data.get('transaction_id')
+    status = data.get('status')  # 'approved', 'rejected'
+    
+    if not transaction_id or not status:
+        return jsonify({'error': 'Dados inválidos'}), 400
+    
+    transaction = Transaction.query.get(transaction_id)
+    if not transaction:
+        return jsonify({'error': 'Transação não encontrada'}), 404
+    
+    if status == 'approved' and transaction.type == 'deposit':
+        # Aprovação condicional: não credita de novo se o job de confirmação já aprovou
+        PaymentService.confirm_deposit(transaction.id)
+        db.session.commit()
+    elif status == 'rejected' and transaction.status == 'pending':
+        transaction.mark_as_failed('Pagamento rejeitado')
+        if transaction.type == 'deposit':
+            LimitService.release(transaction.user_id, 'deposit', transaction.amount, transaction.created_at)
+        db.session.commit()
+    
+    return jsonify({'message': 'Webhook processado'}), 200
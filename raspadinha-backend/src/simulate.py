@@ -0,0 +1,258 @@
+"""Simulador Monte Carlo de RTP (retorno ao jogador) das categorias de raspadinha
+
+Usa o mesmo GameEngine.generate_batch da produção, com um processo por núcleo
+e um fluxo de números aleatórios independente por lote.
+
+Uso:
+    python -m src.simulate --plays 1000000000
+    python -m src.simulate --category 2 --plays 50000000 --workers 8 --json
+    python -m src.simulate --category 1 --price 5 --max-prize 2000
+    python -m src.simulate --category 3 --prize-table nova_tabela.json
+    python -m src.simulate --category 4 --win-rules regra_linhas.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from statistics import NormalDist
+
+import numpy as np
+from flask import Flask
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+# Todos os modelos precisam estar importados para o SQLAlchemy configurar os relacionamentos
+from src.models.user import db
+from src.models.wallet import Wallet
+from src.models.game import ScratchCardCategory, GameEngine, PrizeTable
+from src.models.transaction import Transaction
+from src.models.bonus import Bonus, Mission
+from src.models.series import TicketSeries
+from src.models.ledger import LedgerEntry, WalletCheckpoint
+from src.models.rules import WinRule
+from src.models.schema import upgrade
+
+DEFAULT_DATABASE_URI = f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'app.db')}"
+
+# Campos de ScratchCardCategory que influenciam o sorteio
+CATEGORY_FIELDS = ('id', 'name', 'price', 'max_prize', 'symbols', 'win_rules', 'prize_table', 'updated_at')
+
+def load_categories(database_uri=DEFAULT_DATABASE_URI, category_ids=None):
+    """Lê a configuração das categorias do banco como dicionários simples"""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_uri
+    db.init_app(app)
+
+    with app.app_context():
+        # Banco ainda não atualizado pela aplicação: aplica as migrações pendentes antes de ler
+        upgrade()
+        
+        query = ScratchCardCategory.query.order_by(ScratchCardCategory.id)
+        if category_ids:
+            query = query.filter(ScratchCardCategory.id.in_(category_ids))
+
+        return [{field: getattr(category, field) for field in CATEGORY_FIELDS} for category in query.all()]
+
+def _simulate_chunk(config, plays, seed_sequence):
+    """Executa `plays` jogadas de uma categoria em um processo e devolve estatísticas suficientes"""
+    category = ScratchCardCategory(**config)
+    batch = GameEngine.generate_batch(category, plays, rng=np.random.default_rng(seed_sequence))
+
+    prizes = batch.prize_cents[batch.is_winner]
+    tier_values, tier_counts = np.unique(prizes, return_counts=True)
+
+    return {
+        'plays': plays,
+        'winners': int(len(prizes)),
+        'prize_sum': int(prizes.sum()),
+        'prize_sq_sum': int((prizes.astype(np.float64) ** 2).sum()),
+        'multiplied_wins': int((batch.multiplier > 1).sum()),
+        'bonus_cards': int((batch.bonus_free_games > 0).sum()),
+        'bonus_free_games': int(batch.bonus_free_games.sum()),
+        'tiers': dict(zip(tier_values.tolist(), tier_counts.tolist()))
+    }
+
+class SimulationStats:
+    """Acumula os resultados dos lotes de uma categoria (valores em centavos)"""
+
+    def __init__(self, config, target_plays, confidence=0.95):
+        self.config = config
+        self.expected_rtp = GameEngine.expected_rtp(ScratchCardCategory(**config))
+        self.target_plays = target_plays
+        self.z = NormalDist().inv_cdf(0.5 + confidence / 2)
+        self.confidence = confidence
+        self.price_cents = round(float(config['price']) * 100)
+
+        self.plays = 0
+        self.winners = 0
+        self.prize_sum = 0
+        self.prize_sq_sum = 0
+        self.multiplied_wins = 0
+        self.bonus_cards = 0
+        self.bonus_free_games = 0
+        self.tiers = {}
+        self.started_at = time.perf_counter()
+
+    def add(self, chunk):
+        self.plays += chunk['plays']
+        self.winners += chunk['winners']
+        self.prize_sum += chunk['prize_sum']
+        self.prize_sq_sum += chunk['prize_sq_sum']
+        self.multiplied_wins += chunk['multiplied_wins']
+        self.bonus_cards += chunk['bonus_cards']
+        self.bonus_free_games += chunk['bonus_free_games']
+        for prize, count in chunk['tiers'].items():
+            self.tiers[prize] = self.tiers.get(prize, 0) + count
+
+    def to_dict(self):
+        n = self.plays
+        mean = self.prize_sum / n if n else 0.0
+        variance = max(self.prize_sq_sum / n - mean ** 2, 0.0) if n else 0.0
+        std = variance ** 0.5
+
+        rtp = mean / self.price_cents if n else 0.0
+        rtp_margin = self.z * std / (n ** 0.5) / self.price_cents if n else 0.0
+        hit_rate = self.winners / n if n else 0.0
+        hit_margin = self.z * (hit_rate * (1 - hit_rate) / n) ** 0.5 if n else 0.0
+        elapsed = time.perf_counter() - self.started_at
+
+        return {
+            'category_id': self.config['id'],
+            'category_name': self.config['name'],
+            'price': float(self.config['price']),
+            'plays': n,
+            'progress': n / self.target_plays if self.target_plays else 1.0,
+            'rtp': rtp,
+            'rtp_ci': [rtp - rtp_margin, rtp + rtp_margin],
+            'expected_rtp': self.expected_rtp,
+            'hit_rate': hit_rate,
+            'hit_rate_ci': [hit_rate - hit_margin, hit_rate + hit_margin],
+            'confidence': self.confidence,
+            'payout_mean': mean / 100,
+            'payout_variance': variance / 10000,
+            'payout_std': std / 100,
+            'multiplied_win_rate': self.multiplied_wins / self.winners if self.winners else 0.0,
+            'bonus_rate': self.bonus_cards / n if n else 0.0,
+            'bonus_free_games_per_play': self.bonus_free_games / n if n else 0.0,
+            'tiers': [{
+                'prize': prize / 100,
+                'count': count,
+                'frequency': count / n,
+                'share_of_winners': count / self.winners if self.winners else 0.0,
+                'rtp_contribution': prize * count / (n * self.price_cents)
+            } for prize, count in sorted(self.tiers.items())],
+            'elapsed_seconds': elapsed,
+            'plays_per_second': n / elapsed if elapsed > 0 else 0.0
+        }
+
+def simulate(config, plays, workers=None, chunk_size=1_000_000, seed=None, confidence=0.95):
+    """Simula `plays` jogadas da categoria em paralelo, gerando um resultado parcial a cada lote concluído"""
+    stats = SimulationStats(config, plays, confidence)
+    chunks = [chunk_size] * (plays // chunk_size)
+    if plays % chunk_size:
+        chunks.append(plays % chunk_size)
+
+    # Um fluxo independente por lote: reprodutível com a mesma semente, qualquer que seja a ordem de execução
+    seed_sequences = np.random.SeedSequence(seed).spawn(len(chunks))
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(_simulate_chunk, config, size, seed_sequence)
+            for size, seed_sequence in zip(chunks, seed_sequences)
+        ]
+        for future in as_completed(futures):
+            stats.add(future.result())
+            yield stats.to_dict()
+
+def _format_report(result):
+    lines = [
+        f"{result['category_name']} (#{result['category_id']}) - preço R$ {result['price']:.2f}",
+        f"  jogadas:        {result['plays']:,}",
+        f"  RTP:            {result['rtp']:.4%}  IC {result['confidence']:.0%} [{result['rtp_ci'][0]:.4%}, {result['rtp_ci'][1]:.4%}]  (teórico {result['expected_rtp']:.4%})",
+        f"  taxa de acerto: {result['hit_rate']:.4%}  IC {result['confidence']:.0%} [{result['hit_rate_ci'][0]:.4%}, {result['hit_rate_ci'][1]:.4%}]",
+        f"  prêmio/jogada:  média R$ {result['payout_mean']:.4f}  variância {result['payout_variance']:.4f}  desvio R$ {result['payout_std']:.4f}",
+        f"  multiplicador:  {result['multiplied_win_rate']:.4%} das vitórias  bônus: {result['bonus_rate']:.4%} das raspadinhas ({result['bonus_free_games_per_play']:.4f} jogos grátis/jogada)",
+        f"  velocidade:     {result['plays_per_second']:,.0f} jogadas/s em {result['elapsed_seconds']:.1f}s",
+        '  faixas de prêmio:'
+    ]
+    for tier in result['tiers']:
+        lines.append(
+            f"    R$ {tier['prize']:>10.2f}  {tier['count']:>14,}  freq {tier['frequency']:.6%}  "
+            f"vencedores {tier['share_of_winners']:.2%}  RTP {tier['rtp_contribution']:.4%}"
+        )
+    return '\n'.join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Simulação Monte Carlo de RTP por categoria')
+    parser.add_argument('--category', type=int, action='append', help='ID da categoria (pode repetir; padrão: todas)')
+    parser.add_argument('--plays', type=int, default=10_000_000, help='Jogadas simuladas por categoria')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Processos em paralelo')
+    parser.add_argument('--chunk-size', type=int, default=1_000_000, help='Jogadas por lote enviado a um processo')
+    parser.add_argument('--seed', type=int, help='Semente para resultados reprodutíveis')
+    parser.add_argument('--confidence', type=float, default=0.95, help='Nível de confiança dos intervalos')
+    parser.add_argument('--database-uri', default=DEFAULT_DATABASE_URI, help='Banco de onde ler as categorias')
+    parser.add_argument('--price', type=float, help='Sobrescreve o preço da categoria')
+    parser.add_argument('--max-prize', type=float, help='Sobrescreve o prêmio máximo da categoria')
+    parser.add_argument('--prize-table', help='Arquivo JSON com a tabela de prêmios a testar (mesmo formato de prize_table)')
+    parser.add_argument('--win-rules', help='Arquivo JSON com a regra de vitória a testar (mesmo formato de win_rules)')
+    parser.add_argument('--report-every', type=float, default=5.0, help='Segundos entre resultados parciais')
+    parser.add_argument('--json', action='store_true', help='Saída em NDJSON (parciais e final)')
+    args = parser.parse_args(argv)
+
+    configs = load_categories(args.database_uri, args.category)
+    if not configs:
+        parser.error('Nenhuma categoria encontrada')
+    
+    prize_table = None
+    if args.prize_table:
+        with open(args.prize_table) as f:
+            prize_table = json.load(f)
+        try:
+            PrizeTable.validate_config(prize_table)
+        except ValueError as e:
+            parser.error(str(e))
+    
+    win_rules = None
+    if args.win_rules:
+        with open(args.win_rules) as f:
+            win_rules = json.load(f)
+
+    for config in configs:
+        if args.price is not None:
+            config['price'] = args.price
+        if args.max_prize is not None:
+            config['max_prize'] = args.max_prize
+        if prize_table is not None:
+            config['prize_table'] = prize_table
+        if win_rules is not None:
+            config['win_rules'] = win_rules
+            try:
+                WinRule(win_rules, config['symbols'])
+            except ValueError as e:
+                parser.error(str(e))
+
+        result = None
+        last_report = time.perf_counter()
+
+        for result in simulate(config, args.plays, args.workers, args.chunk_size, args.seed, args.confidence):
+            now = time.perf_counter()
+            if result['progress'] < 1 and now - last_report >= args.report_every:
+                last_report = now
+                if args.json:
+                    print(json.dumps({'partial': True, **result}), flush=True)
+                else:
+                    print(
+                        f"[{result['category_name']}] {result['progress']:.1%} - {result['plays']:,} jogadas, "
+                        f"RTP {result['rtp']:.4%} ± {(result['rtp_ci'][1] - result['rtp']):.4%}",
+                        file=sys.stderr, flush=True
+                    )
+
+        if args.json:
+            print(json.dumps({'partial': False, **result}), flush=True)
+        else:
+            print(_format_report(result), flush=True)
+
+if __name__ == '__main__':
+    main()
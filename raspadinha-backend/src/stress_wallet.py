@@ -0,0 +1,235 @@
+"""Teste de estresse de concorrência da carteira
+
+Vários processos, cada um com várias threads, debitam e creditam a mesma
+carteira ao mesmo tempo em um banco SQLite compartilhado. No final confere:
+
+    saldo final == saldo inicial + créditos confirmados - débitos confirmados
+    nenhum saldo negativo em momento algum (débito sem saldo é recusado)
+    replay do razão == saldos da carteira
+
+Cenários:
+    wallet  Wallet.add_balance / subtract_balance direto (padrão)
+    play    jogadas pela API (/api/games/play), conferindo carteira x extrato
+    naive   leitura-modificação-escrita em Python, como era antes, para comparar
+
+Uso:
+    python -m src.stress_wallet
+    python -m src.stress_wallet --processes 8 --threads 8 --operations 500
+    python -m src.stress_wallet --scenario play --processes 4 --threads 4
+    python -m src.stress_wallet --scenario naive   # deve acusar atualizações perdidas
+
+Sai com código 1 se alguma verificação falhar.
+"""
+import os
+import sys
+import json
+import random
+import argparse
+import tempfile
+import threading
+import multiprocessing
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+INITIAL_BALANCE = Decimal('500.00')
+INITIAL_BONUS = Decimal('50.00')
+
+def _load_app(database):
+    # A aplicação lê a configuração do ambiente ao ser importada
+    os.environ['DATABASE_URL'] = f'sqlite:///{database}'
+    os.environ['CARD_POOL_ENABLED'] = '0'
+    from src.main import app
+    return app
+
+def setup(database):
+    """Cria o banco com um usuário e a carteira inicial; devolve o ID do usuário"""
+    app = _load_app(database)
+    from src.models.user import db, User
+    from src.models.wallet import Wallet
+
+    with app.app_context():
+        user = User(email='stress@example.com', first_name='Stress', last_name='Test', cpf='52998224725')
+        user.set_password('stress123')
+        db.session.add(user)
+        db.session.flush()
+        wallet = Wallet(user_id=user.id)
+        db.session.add(wallet)
+        db.session.flush()
+        wallet.add_balance(INITIAL_BALANCE)
+        wallet.add_balance(INITIAL_BONUS, is_bonus=True)
+        db.session.commit()
+        return user.id
+
+def _wallet_thread(app, user_id, operations, seed, naive, result):
+    from src.models.user import db
+    from src.models.wallet import Wallet
+
+    rng = random.Random(seed)
+    for _ in range(operations):
+        amount = Decimal(rng.choice(('1.00', '2.50', '5.00', '10.00')))
+        credit = rng.random() < 0.4
+        use_bonus_first = rng.random() < 0.5
+
+        with app.app_context():
+            try:
+                wallet = Wallet.query.filter_by(user_id=user_id).first()
+                if naive:
+                    # Como era antes: lê, calcula em Python e grava o resultado
+                    if credit:
+                        wallet.balance += amount
+                    elif wallet.balance >= amount:
+                        wallet.balance -= amount
+                    else:
+                        raise ValueError('Saldo insuficiente')
+                elif credit:
+                    wallet.add_balance(amount)
+                else:
+                    wallet.subtract_balance(amount, use_bonus_first=use_bonus_first)
+                db.session.commit()
+            except ValueError:
+                db.session.rollback()
+                result['refused'] += 1
+                continue
+            except Exception as e:
+                db.session.rollback()
+                result['errors'].append(repr(e))
+                continue
+
+        result['credits' if credit else 'debits'] += amount
+
+def _play_thread(app, user_id, operations, seed, naive, result):
+    from flask_jwt_extended import create_access_token
+
+    with app.app_context():
+        token = create_access_token(identity=user_id)
+    client = app.test_client()
+    rng = random.Random(seed)
+
+    for _ in range(operations):
+        response = client.post(
+            '/api/games/play', json={'category_id': rng.randint(1, 4)},
+            headers={'Authorization': f'Bearer {token}'}
+        )
+        if response.status_code == 200:
+            data = response.get_json()
+            result['debits'] += Decimal(str(data['game']['amount_paid']))
+            result['credits'] += Decimal(str(data['game']['prize_won']))
+        elif response.status_code == 400:
+            result['refused'] += 1
+        else:
+            result['errors'].append(f'HTTP {response.status_code}')
+
+def worker(database, user_id, scenario, threads, operations, seed):
+    """Processo de carga: `threads` threads com `operations` operações cada"""
+    app = _load_app(database)
+    target = _play_thread if scenario == 'play' else _wallet_thread
+    results = [{'credits': Decimal('0'), 'debits': Decimal('0'), 'refused': 0, 'errors': []} for _ in range(threads)]
+
+    pool = [
+        threading.Thread(target=target, args=(app, user_id, operations, seed * 1000 + i, scenario == 'naive', results[i]))
+        for i in range(threads)
+    ]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+
+    return {
+        'credits': str(sum(r['credits'] for r in results)),
+        'debits': str(sum(r['debits'] for r in results)),
+        'refused': sum(r['refused'] for r in results),
+        'errors': [e for r in results for e in r['errors']]
+    }
+
+def verify(database, user_id, scenario, credits, debits):
+    """Confere a carteira (e, no cenário de jogadas, o extrato) contra as operações confirmadas"""
+    app = _load_app(database)
+    from src.models.user import db
+    from src.models.wallet import Wallet
+    from src.models.transaction import Transaction
+    from src.models.ledger import LedgerService
+
+    with app.app_context():
+        wallet = Wallet.query.filter_by(user_id=user_id).first()
+        total = wallet.balance + wallet.bonus_balance
+        expected = INITIAL_BALANCE + INITIAL_BONUS + credits - debits
+
+        checks = {
+            'saldo final confere com as operações confirmadas': total == expected,
+            'saldo nunca negativo': wallet.balance >= 0 and wallet.bonus_balance >= 0,
+            'razão confere com o retrato da carteira': not LedgerService.verify(wallet)
+        }
+
+        if scenario == 'play':
+            costs = db.session.query(db.func.sum(Transaction.amount)).filter_by(user_id=user_id, type='game_cost').scalar() or 0
+            prizes = db.session.query(db.func.sum(Transaction.amount)).filter_by(user_id=user_id, type='prize_payout').scalar() or 0
+            checks['extrato confere com a carteira'] = (
+                INITIAL_BALANCE + INITIAL_BONUS - Decimal(str(costs)) + Decimal(str(prizes)) == total
+            )
+
+        return {
+            'balance': str(wallet.balance),
+            'bonus_balance': str(wallet.bonus_balance),
+            'expected_total': str(expected),
+            'actual_total': str(total),
+            'lost': str(expected - total),
+            'checks': checks
+        }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Teste de estresse de concorrência da carteira')
+    parser.add_argument('--scenario', choices=('wallet', 'play', 'naive'), default='wallet')
+    parser.add_argument('--processes', type=int, default=4, help='Processos simultâneos')
+    parser.add_argument('--threads', type=int, default=4, help='Threads por processo')
+    parser.add_argument('--operations', type=int, default=200, help='Operações por thread')
+    parser.add_argument('--json', action='store_true', help='Resultado em JSON')
+    args = parser.parse_args(argv)
+
+    database = os.path.join(tempfile.mkdtemp(prefix='raspadinha-stress-'), 'stress.db')
+    context = multiprocessing.get_context('spawn')
+
+    with context.Pool(1) as pool:
+        user_id = pool.apply(setup, (database,))
+
+    with context.Pool(args.processes) as pool:
+        outcomes = pool.starmap(worker, [
+            (database, user_id, args.scenario, args.threads, args.operations, i)
+            for i in range(args.processes)
+        ])
+
+    credits = sum(Decimal(o['credits']) for o in outcomes)
+    debits = sum(Decimal(o['debits']) for o in outcomes)
+    errors = [e for o in outcomes for e in o['errors']]
+
+    with context.Pool(1) as pool:
+        result = pool.apply(verify, (database, user_id, args.scenario, credits, debits))
+
+    result.update({
+        'scenario': args.scenario,
+        'processes': args.processes,
+        'threads': args.threads,
+        'operations': args.processes * args.threads * args.operations,
+        'credits': str(credits),
+        'debits': str(debits),
+        'refused': sum(o['refused'] for o in outcomes),
+        'errors': len(errors),
+        'error_samples': sorted(set(errors))[:5]
+    })
+    ok = all(result['checks'].values())
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print(f"{result['operations']:,} operações ({args.scenario}) em {args.processes} processos x {args.threads} threads")
+        print(f"  créditos {credits}  débitos {debits}  recusadas {result['refused']}  erros {result['errors']}")
+        print(f"  saldo esperado {result['expected_total']}  saldo final {result['actual_total']}  perdido {result['lost']}")
+        for name, passed in result['checks'].items():
+            print(f"  [{'ok' if passed else 'FALHOU'}] {name}")
+        for sample in result['error_samples']:
+            print(f'  erro: {sample}')
+
+    sys.exit(0 if ok else 1)
+
+if __name__ == '__main__':
+    main()
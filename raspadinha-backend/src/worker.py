@@ -0,0 +1,43 @@
+"""Processo único das threads em background (pool de raspadinhas, fila de jobs, saques e métricas)
+
+Os processos web do gunicorn sobem com as threads desligadas (variáveis
+*_ENABLED=0 no ecosystem.config.js): com uma cópia por worker, os
+reabastecimentos do pool passariam da marca alta e vários consumidores da
+fila e de saques disputariam o lock de escrita do SQLite com as jogadas.
+Este comando sobe a aplicação com as threads ligadas (as que não forem
+desligadas pelo ambiente) e fica no ar até receber SIGTERM ou SIGINT.
+
+Uso:
+    python -m src.worker
+"""
+import os
+import sys
+import signal
+import logging
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+BACKGROUND_FLAGS = ('CARD_POOL_ENABLED', 'JOB_WORKERS_ENABLED', 'PAYOUT_WORKER_ENABLED', 'METRICS_COMPACTION_ENABLED')
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(threadName)s %(levelname)s %(message)s')
+    # A aplicação decide quais threads sobem ao ser importada
+    for flag in BACKGROUND_FLAGS:
+        os.environ.setdefault(flag, '1')
+    from src.main import app
+
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stopping.set())
+
+    names = ('card_pool_refiller', 'job_worker_pool', 'payout_worker', 'metrics_compactor')
+    running = [app.extensions[name] for name in names if name in app.extensions]
+    print(f"Threads em background: {', '.join(name for name in names if name in app.extensions) or 'nenhuma'}", flush=True)
+
+    stopping.wait()
+    for worker in running:
+        worker.stop()
+
+if __name__ == '__main__':
+    main()